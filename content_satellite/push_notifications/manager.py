@@ -2,7 +2,7 @@ from django.db.models import Q
 from django.utils import timezone
 from satellite.slack_utils import post_message_to_slack
 from push_notifications.models import INTRADAY_THRESHOLD, IntradayBigMovementReceipt, NotificationSubscriber
-from satellite.models import Ticker, Service
+from satellite.models import Ticker
 
 
 def process_rules():
@@ -25,19 +25,23 @@ def process_rules():
     if len(new_movers_receipts) == 0:
         return
 
+    # which services cover each of the big movers? one query against the ticker/service membership table
+    service_ids_by_ticker_id = {}
+    memberships = Ticker.covering_services.through.objects.filter(ticker__in=[r.ticker_id for r in new_movers_receipts])
+    for ticker_id, service_id in memberships.values_list('ticker_id', 'service_id'):
+        service_ids_by_ticker_id.setdefault(ticker_id, set()).add(service_id)
+
     # for each subscriber, figure out which of the newly-detected big movers match his interests
-    for subscriber in NotificationSubscriber.objects.all():
+    for subscriber in NotificationSubscriber.objects.all().prefetch_related('services'):
         tickers_for_subscriber = [t.strip() for t in subscriber.tickers_csv.upper().split(',')]
-        subscriber_services = [s.pretty_name.strip() for s in subscriber.services.all()]
+        subscriber_service_ids = set([s.id for s in subscriber.services.all()])
 
         messages_for_subscriber = []
         for r in new_movers_receipts:
             if r.ticker.ticker_symbol in tickers_for_subscriber:
                 messages_for_subscriber.append(r.message)
-            elif r.ticker.services_for_ticker:
-                ticker_services = [s.strip() for s in r.ticker.services_for_ticker.split(',')]
-                if set(subscriber_services) & set(ticker_services):
-                    messages_for_subscriber.append(r.message)
+            elif subscriber_service_ids & service_ids_by_ticker_id.get(r.ticker_id, set()):
+                messages_for_subscriber.append(r.message)
 
         if messages_for_subscriber:
             message_text = '```' + '\n'.join(messages_for_subscriber) + '```'
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('push_notifications', '0004_auto_20150810_0037'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='intradaybigmovementreceipt',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True),
+            preserve_default=True,
+        ),
+        migrations.AlterIndexTogether(
+            name='intradaybigmovementreceipt',
+            index_together=set([('ticker', 'timestamp')]),
+        ),
+    ]
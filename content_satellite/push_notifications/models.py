@@ -10,7 +10,7 @@ class IntradayBigMovementReceipt(models.Model):
     '''
     ticker = models.ForeignKey(Ticker)
     percent_change = models.DecimalField(max_digits=7, default=0, decimal_places=2, verbose_name='% change at time of alert')
-    timestamp = models.DateTimeField()
+    timestamp = models.DateTimeField(db_index=True)
 
     @classmethod
     def create(cls, ticker, percent_change):
@@ -25,6 +25,10 @@ class IntradayBigMovementReceipt(models.Model):
             message_text += ' (%s)' % self.ticker.services_for_ticker
         return message_text
 
+    class Meta:
+        # "has this ticker had an alert today?"
+        index_together = (('ticker', 'timestamp'),)
+
 
 class NotificationSubscriber(models.Model):
     '''
@@ -1,13 +1,19 @@
 from django.contrib import admin
 from django.db import models
 
-from satellite.models import Ticker, Service, ServiceTake, Article, Scorecard, DataHarvestEventLog, BylineMetaData, CoverageType
+from satellite.models import Ticker, Service, ServiceTake, Article, Scorecard, DataHarvestEventLog, BylineMetaData, CoverageType, \
+	TickerDailyPerformance, TickerIntradayPerformance
 
 
 class TickerAdmin(admin.ModelAdmin):
 	list_display = ['ticker_symbol','company_name','daily_percent_change','exchange_symbol','services','scorecards','tier', 'tier_status',
 	'earnings_announcement','notes']
 	search_fields = ['ticker_symbol', 'instrument_id','company_name']
+	list_filter = ['covering_services', 'tier']
+
+	def get_queryset(self, request):
+		# the services and scorecards columns read from service takes fetched for the whole page at once
+		return super(TickerAdmin, self).get_queryset(request).with_coverage_summary()
 
 admin.site.register(Ticker, TickerAdmin)
 
@@ -47,4 +53,19 @@ admin.site.register(DataHarvestEventLog, DataHarvestEventLogAdmin)
 class BylineMetaDataAdmin(admin.ModelAdmin):
 	list_display = ['byline', 'services', 'tickers']
 
-admin.site.register(BylineMetaData, BylineMetaDataAdmin)
\ No newline at end of file
+admin.site.register(BylineMetaData, BylineMetaDataAdmin)
+
+class TickerDailyPerformanceAdmin(admin.ModelAdmin):
+	list_display = ['ticker', 'date', 'percent_change']
+	list_filter = ['date']
+	search_fields = ['ticker__ticker_symbol',]
+	list_select_related = ['ticker']
+
+admin.site.register(TickerDailyPerformance, TickerDailyPerformanceAdmin)
+
+class TickerIntradayPerformanceAdmin(admin.ModelAdmin):
+	list_display = ['ticker', 'timestamp', 'percent_change']
+	search_fields = ['ticker__ticker_symbol',]
+	list_select_related = ['ticker']
+
+admin.site.register(TickerIntradayPerformance, TickerIntradayPerformanceAdmin)
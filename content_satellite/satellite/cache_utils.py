@@ -0,0 +1,131 @@
+import time
+
+from django.core.cache import cache
+
+
+class CachedValue(object):
+	"""
+	a value that's expensive to compute (usually: needs a query) and that many requests want, kept in the django
+	cache so that every process (the web server's, the cron commands') shares one copy.
+
+	loader() is called when the cache doesn't have the value: the first time it's asked for, once it's older than
+	max_age_in_seconds, or after invalidate(). invalidate() takes effect everywhere at once, eg when a cron command
+	that just changed the data calls it. with the database cache in settings, get() is one query, and invalidate()
+	runs on the same connection as the change it follows, so both take effect when that transaction commits.
+
+	max_age_in_seconds is only a backstop, for changes that nothing invalidates, and for a get() that read the data
+	just before a change committed and stored it just after.
+
+	with local_max_age_in_seconds, each process also keeps its own copy for that long, and get() doesn't touch the
+	django cache (no query) while it's fresh. the price: another process's invalidate() only reaches this one once
+	its copy expires, so that's how stale the value can be after a change elsewhere.
+	"""
+
+	def __init__(self, loader, max_age_in_seconds=300, key=None, local_max_age_in_seconds=None):
+		self.loader = loader
+		self.max_age_in_seconds = max_age_in_seconds
+		self.key = key or 'satellite.%s' % loader.__name__.lstrip('_')
+		self.local_max_age_in_seconds = local_max_age_in_seconds
+		# (value, when it expires), or None
+		self._local = None
+
+	def get(self):
+		local = self._local
+		if local is not None and local[1] > time.time():
+			return local[0]
+
+		cached = cache.get(self.key)
+		if cached is None:
+			# wrapped, so that a value of None is cached like any other
+			cached = (self.loader(),)
+			cache.set(self.key, cached, self.max_age_in_seconds)
+
+		if self.local_max_age_in_seconds:
+			self._local = (cached[0], time.time() + self.local_max_age_in_seconds)
+		return cached[0]
+
+	def invalidate(self):
+		self._local = None
+		cache.delete(self.key)
+
+
+def _load_ticker_symbols():
+	from satellite.models import Ticker
+	return frozenset(Ticker.objects.values_list('ticker_symbol', flat=True))
+
+# every ticker symbol SOL knows about. models.py invalidates it whenever a Ticker is saved or deleted. ticker_lookup
+# asks for it on every request, so each process keeps it for up to 30 seconds without asking the db; a ticker added
+# or removed elsewhere shows up within that
+ticker_symbols = CachedValue(_load_ticker_symbols, local_max_age_in_seconds=30)
+
+
+def get_ticker_symbols():
+	return ticker_symbols.get()
+
+
+def invalidate_ticker_symbols():
+	"""
+	call after changing tickers without Ticker.save()/delete() (eg bulk_create), since those don't send the
+	signals that would otherwise take care of it
+	"""
+	ticker_symbols.invalidate()
+
+
+def _load_single_authors():
+	"""
+	the author names to choose from when assigning coverage: each byline's first author (eg 'Tom Gardner' for
+	'Tom Gardner and David Gardner', or for 'Tom Gardner, Chris Hill'), without repeats, sorted
+	"""
+	from satellite.models import BylineMetaData
+	single_authors = set()
+	for byline in BylineMetaData.objects.values_list('byline', flat=True):
+		single_authors.add(byline.split(' and', 1)[0].split(',', 1)[0])
+	return sorted(single_authors)
+
+# models.py invalidates it whenever a BylineMetaData is saved or deleted
+single_authors = CachedValue(_load_single_authors)
+
+
+def get_single_authors():
+	return single_authors.get()
+
+
+def invalidate_single_authors():
+	""" call after changing BylineMetaData records without save()/delete() (eg bulk_create) """
+	single_authors.invalidate()
+
+
+class MarketSnapshot(object):
+	""" what the landing page shows: today's biggest gainer and loser, and the newest article. any may be None """
+
+	def __init__(self, gainer, loser, latest):
+		self.gainer = gainer
+		self.loser = loser
+		self.latest = latest
+
+
+def _load_market_snapshot():
+	"""
+	three ORDER BY ... LIMIT 1 queries, each answered from an index (Ticker.daily_percent_change, Article.date_pub),
+	so it costs the same however many tickers and articles there are
+	"""
+	from satellite.models import Ticker, Article
+	return MarketSnapshot(
+		gainer=Ticker.objects.order_by('-daily_percent_change').first(),
+		loser=Ticker.objects.order_by('daily_percent_change').first(),
+		latest=Article.objects.filter(date_pub__isnull=False).select_related('service').order_by('-date_pub').first(),
+	)
+
+# the ingest and purge commands invalidate it as soon as they've written new quotes or added or deleted articles
+# (and models.py does, on Ticker save and delete). an article saved one at a time (eg in the admin) shows up once
+# max_age_in_seconds is up
+market_snapshot = CachedValue(_load_market_snapshot, max_age_in_seconds=60)
+
+
+def get_market_snapshot():
+	return market_snapshot.get()
+
+
+def invalidate_market_snapshot():
+	""" call after changing quotes in bulk (eg bulk_update, which sends no signals), or after adding or deleting articles """
+	market_snapshot.invalidate()
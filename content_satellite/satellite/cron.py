@@ -43,10 +43,24 @@ def _import_tick_take():
 	try:
 		call_command('import_tick_take')
 	except Exception as e:
-		print str(e)	
+		print str(e)
+		# let the task fail, rather than look like a good import
+		raise
 
 ### end of updating ticker status ----------------------------
 
+### earnings dates ------------------
+# every weekday at 6:30 AM, ahead of the 8:00 AM earnings preview. only the tickers whose date is coming up (or has
+# passed) are checked, so this takes a few minutes rather than an hour
+@kronos.register('30 6 * * 1-5')
+def update_earnings_announcement_dates():
+	try:
+		call_command('update_earnings_announcement_dates')
+	except Exception as e:
+		print str(e)
+
+### end of updating earnings dates ------------------
+
 ### author meta data ------------------
 # every morning at 12:15 AM (not too long after the nightly 11:59 sweep for articles), let's re-compile the author meta data
 @kronos.register('15 0 * * *')
@@ -56,6 +70,15 @@ def update_author_meta_data_nightly():
 	except Exception as e:
 		print str(e)
 
+# the nightly run only looks at the authors touched since the run before. once a week, on Sunday at 12:45 AM,
+# recompile everyone, in case an article changed hands without anything newer to point at it
+@kronos.register('45 0 * * 0')
+def rebuild_author_meta_data_weekly():
+	try:
+		call_command('update_byline_meta_data', full=True)
+	except Exception as e:
+		print str(e)
+
 ### end of updating author meta data ------------------
 
 ### ticker performance ----------------
@@ -88,6 +111,15 @@ def zero_out_daily_percent_change():
 		print str(e)
 
 
+# every weekday at 5:00 PM, once the day's closing changes are in the history, refresh each ticker's 50-day change
+@kronos.register('0 17 * * 1-5')
+def update_percent_change_historical():
+	try:
+		call_command('update_percent_change_historical')
+	except Exception as e:
+		print str(e)
+
+
 ### end of updating ticker performance ----------------
 
 
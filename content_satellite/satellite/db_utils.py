@@ -0,0 +1,131 @@
+from django.db import connection, transaction, IntegrityError
+
+
+def bulk_update(objs, field_names, batch_size=None):
+	"""
+	write the given fields of many model instances (all of the same model) back to the db, with one
+	"UPDATE ... SET column = CASE id WHEN ... END WHERE id IN (...)" statement per batch instead of one save() per row.
+	only the named columns are written. returns the number of rows updated.
+
+	objs: model instances whose attributes already hold the new values
+	field_names: the names of the fields to write, eg ['daily_percent_change']
+	batch_size: rows per statement. by default we keep each statement under sqlite's limit of 999 query parameters
+	"""
+	objs = list(objs)
+	if not objs:
+		return 0
+
+	meta = objs[0]._meta
+	fields = [meta.get_field(field_name) for field_name in field_names]
+	quote_name = connection.ops.quote_name
+	pk_column = quote_name(meta.pk.column)
+
+	if batch_size is None:
+		# per row: a pk and a value for each field's CASE, plus the pk in the WHERE clause
+		batch_size = max(1, 900 // (2 * len(fields) + 1))
+
+	num_rows_updated = 0
+
+	with transaction.atomic():
+		cursor = connection.cursor()
+
+		for start_idx in range(0, len(objs), batch_size):
+			batch = objs[start_idx:start_idx+batch_size]
+
+			assignments = []
+			params = []
+			for field in fields:
+				when_clauses = []
+				for obj in batch:
+					when_clauses.append('WHEN %s THEN %s')
+					params.append(obj.pk)
+					params.append(field.get_db_prep_save(getattr(obj, field.attname), connection))
+
+				case_expression = 'CASE %s %s END' % (pk_column, ' '.join(when_clauses))
+				if connection.vendor != 'sqlite':
+					# eg postgres can't tell the type of a CASE whose branches are all parameters (or all NULL)
+					case_expression = 'CAST(%s AS %s)' % (case_expression, field.db_type(connection))
+
+				assignments.append('%s = %s' % (quote_name(field.column), case_expression))
+
+			params.extend([obj.pk for obj in batch])
+
+			sql = 'UPDATE %s SET %s WHERE %s IN (%s)' % (quote_name(meta.db_table), ', '.join(assignments), pk_column, ', '.join(['%s'] * len(batch)))
+			cursor.execute(sql, params)
+			num_rows_updated += cursor.rowcount
+
+	return num_rows_updated
+
+
+def bulk_create_ignoring_duplicates(model, objs):
+	"""
+	insert-or-ignore for rows guarded by a unique constraint. all of objs go in with one bulk_create; if that trips
+	the constraint (eg another run inserted some of the same rows a moment ago), we insert them one at a time
+	instead, each in its own savepoint, and skip the ones that are already there.
+	returns the number of rows inserted.
+	"""
+	objs = list(objs)
+	if not objs:
+		return 0
+
+	try:
+		with transaction.atomic():
+			model.objects.bulk_create(objs)
+		return len(objs)
+	except IntegrityError:
+		pass
+
+	num_rows_inserted = 0
+	for obj in objs:
+		try:
+			with transaction.atomic():
+				obj.save(force_insert=True)
+			num_rows_inserted += 1
+		except IntegrityError:
+			pass
+
+	return num_rows_inserted
+
+
+def iterate_in_chunks(queryset, chunk_size=500, key='pk'):
+	"""
+	yields the rows of a queryset (model objects, values() dictionaries or values_list() tuples), in its order, a chunk
+	at a time. for exports too big to hold in memory: .iterator() doesn't help there, since the postgres driver still
+	pulls the whole result set over before handing back the first row.
+
+	the chunks are keyset ("seek") chunks over `key`, a field name ('-' in front for descending), eg 'pk' or
+	'ticker__ticker_symbol': each chunk asks for the next chunk_size values of the key after the last one we've seen
+	("WHERE key > last ... LIMIT chunk_size"), then for the rows with those values. nothing is read up front, and each
+	chunk costs about the same however far in we are.
+
+	the queryset must be ordered by the key first. rows that share a value of the key (eg a ticker joined to its
+	services, or articles published at the same moment) come back in the same chunk. rows with no value for the key
+	come last, in chunks by primary key.
+	"""
+	descending = key.startswith('-')
+	key_field = key.lstrip('-')
+	after_lookup = '%s__lt' % key_field if descending else '%s__gt' % key_field
+
+	# the key values, in order, without repeats (chunk_size of them stays under sqlite's limit of 999 query parameters)
+	key_values = queryset.filter(**{'%s__isnull' % key_field: False}).order_by(key).values_list(key_field, flat=True).distinct()
+
+	last_key_value = None
+	while True:
+		if last_key_value is None:
+			chunk_of_key_values = list(key_values[:chunk_size])
+		else:
+			chunk_of_key_values = list(key_values.filter(**{after_lookup: last_key_value})[:chunk_size])
+		if not chunk_of_key_values:
+			break
+
+		for row in queryset.filter(**{'%s__in' % key_field: chunk_of_key_values}):
+			yield row
+
+		if len(chunk_of_key_values) < chunk_size:
+			break
+		last_key_value = chunk_of_key_values[-1]
+
+	if key_field != 'pk':
+		rows_without_a_key = queryset.filter(**{'%s__isnull' % key_field: True})
+		for row in iterate_in_chunks(rows_without_a_key, chunk_size, key='-pk' if descending else 'pk'):
+			yield row
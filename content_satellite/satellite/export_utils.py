@@ -0,0 +1,38 @@
+import csv
+
+from django.http import StreamingHttpResponse
+
+
+class _Echo(object):
+	""" a file-like object for csv.writer that hands each formatted row back instead of keeping it """
+	def write(self, value):
+		return value
+
+
+def _encode(cell):
+	# the csv module in python 2 doesn't take unicode; give it utf-8
+	if cell is None:
+		return ''
+	if isinstance(cell, unicode):
+		return cell.encode('utf-8')
+	return cell
+
+
+def get_streaming_csv_response(filename, header, rows):
+	"""
+	a response that sends a csv file row by row, as the rows are produced, rather than building the whole file first.
+
+	header: the list of column names
+	rows: any iterable of lists of cell values, ideally a generator over db_utils.iterate_in_chunks(), so that neither
+	the rows nor the model objects pile up in memory. the first bytes go out before the last row is even read.
+	"""
+	writer = csv.writer(_Echo())
+
+	def generate_lines():
+		yield writer.writerow([_encode(cell) for cell in header])
+		for row in rows:
+			yield writer.writerow([_encode(cell) for cell in row])
+
+	response = StreamingHttpResponse(generate_lines(), content_type='text/csv')
+	response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+	return response
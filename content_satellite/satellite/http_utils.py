@@ -0,0 +1,167 @@
+import httplib
+import socket
+import threading
+import time
+import urlparse
+from multiprocessing.pool import ThreadPool
+
+
+class HttpError(Exception):
+	""" the server answered, but not with a 2xx status """
+
+	def __init__(self, url, status, reason=''):
+		super(HttpError, self).__init__('%s: HTTP %s %s' % (url, status, reason))
+		self.url = url
+		self.status = status
+
+
+class HttpTransport(object):
+	"""
+	makes GET requests over keep-alive connections: each thread holds on to one connection per host and reuses it
+	for its next request to that host, instead of opening a new connection per request.
+
+	anything with the same get(url, headers=None, timeout=None) method can stand in for this class, eg a fake
+	that answers from local fixtures in tests.
+	"""
+
+	def __init__(self, default_headers=None, timeout=10):
+		self.default_headers = default_headers or {}
+		self.timeout = timeout
+		self._local = threading.local()
+		self._all_connections = []
+		self._lock = threading.Lock()
+
+	def _get_connection(self, scheme, netloc, timeout):
+		connections = getattr(self._local, 'connections', None)
+		if connections is None:
+			connections = self._local.connections = {}
+
+		key = (scheme, netloc)
+		connection = connections.get(key)
+		if connection is None:
+			connection_class = httplib.HTTPSConnection if scheme == 'https' else httplib.HTTPConnection
+			connection = connection_class(netloc, timeout=timeout)
+			connections[key] = connection
+			with self._lock:
+				self._all_connections.append(connection)
+
+		connection.timeout = timeout
+		if connection.sock is not None:
+			connection.sock.settimeout(timeout)
+		return connection
+
+	def _drop_connection(self, scheme, netloc):
+		connection = self._local.connections.pop((scheme, netloc), None)
+		if connection is not None:
+			connection.close()
+			with self._lock:
+				self._all_connections.remove(connection)
+
+	def get(self, url, headers=None, timeout=None):
+		""" returns the body of the response. raises HttpError for non-2xx responses """
+		parsed_url = urlparse.urlsplit(url)
+		path = parsed_url.path or '/'
+		if parsed_url.query:
+			path += '?' + parsed_url.query
+
+		request_headers = dict(self.default_headers)
+		request_headers.update(headers or {})
+
+		connection = self._get_connection(parsed_url.scheme, parsed_url.netloc, timeout or self.timeout)
+		try:
+			connection.request('GET', path, headers=request_headers)
+			response = connection.getresponse()
+			body = response.read()
+		except (httplib.HTTPException, socket.error):
+			# the connection is in an unknown state; the next request will open a fresh one
+			self._drop_connection(parsed_url.scheme, parsed_url.netloc)
+			raise
+
+		if response.getheader('connection', '').lower() == 'close':
+			self._drop_connection(parsed_url.scheme, parsed_url.netloc)
+
+		if not 200 <= response.status < 300:
+			raise HttpError(url, response.status, response.reason)
+
+		return body
+
+	def close(self):
+		with self._lock:
+			for connection in self._all_connections:
+				connection.close()
+			self._all_connections = []
+
+
+class RateLimitedTransport(object):
+	"""
+	wraps a transport so that requests to any one host go out no more often than max_requests_per_second, however
+	many threads share it. each request takes the next free slot for its host and sleeps until then; requests to
+	different hosts don't wait on each other.
+	"""
+
+	def __init__(self, transport, max_requests_per_second):
+		self.transport = transport
+		self.min_interval_in_seconds = 1.0 / max_requests_per_second
+		self._next_slot_keyed_by_host = {}
+		self._lock = threading.Lock()
+
+	def _wait_for_slot(self, host):
+		with self._lock:
+			now = time.time()
+			slot = max(now, self._next_slot_keyed_by_host.get(host, now))
+			self._next_slot_keyed_by_host[host] = slot + self.min_interval_in_seconds
+		if slot > now:
+			time.sleep(slot - now)
+
+	def get(self, url, headers=None, timeout=None):
+		self._wait_for_slot(urlparse.urlsplit(url).netloc)
+		return self.transport.get(url, headers=headers, timeout=timeout)
+
+	def close(self):
+		self.transport.close()
+
+
+def get_with_retries(transport, url, headers=None, timeout=None, max_attempts=3, backoff_seconds=0.5):
+	"""
+	transport.get(url), retried on network errors and 5xx responses. waits backoff_seconds before the 2nd attempt,
+	twice that before the 3rd, and so on. 4xx responses aren't retried; asking again won't change the answer.
+	"""
+	attempt = 1
+	while True:
+		try:
+			return transport.get(url, headers=headers, timeout=timeout)
+		except HttpError as e:
+			if e.status < 500 or attempt >= max_attempts:
+				raise
+		except (httplib.HTTPException, socket.error):
+			if attempt >= max_attempts:
+				raise
+
+		time.sleep(backoff_seconds * (2 ** (attempt - 1)))
+		attempt += 1
+
+
+def map_concurrently(function, items, max_workers=8):
+	"""
+	calls function(item) for each item, at most max_workers at a time, each in its own thread.
+	returns a list of (item, result, error) tuples in the same order as items; error is None when the call succeeded,
+	otherwise it's the exception the call raised (and result is None).
+
+	meant for network-bound work. keep db access out of function and do it afterwards, in the calling thread.
+	"""
+	items = list(items)
+	if not items:
+		return []
+
+	def call(item):
+		try:
+			return (item, function(item), None)
+		except Exception as e:
+			return (item, None, e)
+
+	pool = ThreadPool(min(max_workers, len(items)))
+	try:
+		return pool.map(call, items)
+	finally:
+		pool.close()
+		pool.join()
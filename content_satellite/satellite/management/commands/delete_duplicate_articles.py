@@ -1,11 +1,17 @@
 '''
 what makes an article worth keeping?
-for a given title, url, service, & ticker combination, we want at most one article. 
+for a given url & ticker combination, we want at most one article.
 let's say these features make up an article's "profile".
-this script deletes articles that have a profile already accounted for in Satellite.
+this script deletes articles that have a profile already accounted for in Satellite, keeping the oldest one (lowest id).
+
+new duplicates can't get in anymore (Article has a unique constraint on url & ticker), so this is a sweep for
+data that predates the constraint.
 '''
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Min
 
+from satellite.cache_utils import invalidate_market_snapshot
 from satellite.models import Article
 
 class Command(BaseCommand):
@@ -13,32 +19,24 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
     	print 'starting script'
 
-    	all_articles = Article.objects.all()
-    	print 'how many articles?', len(all_articles)
+    	print 'how many articles?', Article.objects.count()
 
-    	article_profiles_already_processed = set()
-    	articles_to_delete = set()
+    	# let the db do the grouping: one row per profile that's been used more than once
+    	duplicated_profiles = Article.objects.order_by().values('url', 'ticker_id') \
+    		.annotate(num_articles=Count('id'), id_to_keep=Min('id')).filter(num_articles__gt=1)
 
-    	for art in all_articles:
-    		profile = (art.title, art.url, art.service.name, art.ticker.instrument_id)
+    	print 'how many duplicated article profiles?', len(duplicated_profiles)
 
-    		if profile in article_profiles_already_processed:
-    			articles_to_delete.add(art)
-    		else:
-    			article_profiles_already_processed.add(profile)
+    	num_deleted = 0
+    	with transaction.atomic():
+    		for profile in duplicated_profiles:
+    			articles_to_delete = Article.objects.filter(url=profile['url'], ticker_id=profile['ticker_id']).exclude(id=profile['id_to_keep'])
+    			num_deleted += articles_to_delete.count()
+    			articles_to_delete.delete()
 
-    	print 'how many unique article profiles?', len(article_profiles_already_processed)
-    	print 'how many articles to delete?', len(articles_to_delete)
+    	if num_deleted:
+    		invalidate_market_snapshot()
 
-    	for art_to_delete in articles_to_delete:
-			art.delete()
-    	all_articles = Article.objects.all()
-    	
-    	print 'how many articles now?', len(all_articles)
+    	print 'how many articles deleted?', num_deleted
+    	print 'how many articles now?', Article.objects.count()
     	print 'finished script'
-
-
-
-
-
-
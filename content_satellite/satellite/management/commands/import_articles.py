@@ -1,111 +1,207 @@
 '''
-ask the API for the most recent 100 articles across the premium services;
-for each of those, add an Article object, one for each of the tickers in the article 
+ask the API for the articles across the premium services published since the last run; for each of those, add an
+Article object, one for each of the tickers in the article
+
+the API hands back articles newest first, 100 at a time. we keep asking for the next 100 until we reach an article
+no newer than where the last run left off (or we hit max_pages_per_run), so a burst of more than 100 articles
+between runs isn't lost. where a run left off is the publish date of the newest article the API handed back,
+whether or not we kept it (eg none of its tickers are ours); it's kept in the run's event log, as data_through.
 '''
-import urllib
 import json
 import datetime
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.utils import timezone
+from satellite.cache_utils import invalidate_market_snapshot
+from satellite.db_utils import bulk_create_ignoring_duplicates
+from satellite.http_utils import HttpTransport, get_with_retries
 from satellite.models import Article, Service, Ticker, DataHarvestEventLog, DATA_HARVEST_TYPE_ARTICLES
 
-num_articles_to_retrieve = 100
-stop_value = num_articles_to_retrieve - 1  # the API treats the stop arg as zero-based and inclusive; eg to get 5 results, tell it to go up to (and include) index 4
+num_articles_to_retrieve = 100  # per page
+max_pages_per_run = 20
 service_ids = '1081,1069,1502,1451,1371,1321,1255,1228,1128,1066,1062,1048,1008'
-url = 'http://apiary.fool.com/napi/secure/content/query/?stop=%d&format=json&service_ids=%s' % (stop_value, service_ids)
-
-def get_articles():
-
-	response = urllib.urlopen(url).read()
-	json_data = json.loads(response)
-	articles = json_data['results']
-
-	print 'num articles returned from API:', len(articles)
+# the API treats the stop arg as zero-based and inclusive; eg to get 5 results, tell it to start at index 0 and go up to (and include) index 4
+url_template = 'http://apiary.fool.com/napi/secure/content/query/?start=%d&stop=%d&format=json&service_ids=%s'
+
+
+def _get_publish_date(article_json):
+	publish_date = article_json['publish_at']
+	publish_date = publish_date.replace('T',' ')
+	publish_date = publish_date.split('Z')[0]
+	publish_date = datetime.datetime.strptime(publish_date, '%Y-%m-%d %H:%M:%S')
+	if settings.USE_TZ:
+		# the same interpretation the db layer would give a naive datetime, so that we can compare with what's stored
+		publish_date = timezone.make_aware(publish_date, timezone.get_default_timezone())
+	return publish_date
+
+
+def get_articles_json(since=None, transport=None):
+	"""
+	page through the API, newest articles first, until we reach an article published at or before `since`.
+	if since is None (eg we don't have any articles yet), just get the first page.
+	returns (the list of articles (as json), the number of pages requested, whether we caught up with `since`).
+	we haven't caught up if max_pages_per_run pages weren't enough to get back to it
+	"""
+	if transport is None:
+		transport = HttpTransport()
+
+	articles = []
+	num_pages = 0
+
+	while num_pages < max_pages_per_run:
+		start_value = num_pages * num_articles_to_retrieve
+		stop_value = start_value + num_articles_to_retrieve - 1
+		url = url_template % (start_value, stop_value, service_ids)
+
+		response = get_with_retries(transport, url)
+		json_data = json.loads(response)
+		page_of_articles = json_data['results']
+		num_pages += 1
+
+		articles.extend(page_of_articles)
+
+		# the end of the feed
+		if since is None or len(page_of_articles) < num_articles_to_retrieve:
+			return articles, num_pages, True
+
+		# we've caught up once the oldest article on this page is one we've already seen
+		if _get_publish_date(page_of_articles[-1]) <= since:
+			return articles, num_pages, True
+
+	return articles, num_pages, False
+
+
+def get_last_run_data_through():
+	"""
+	where the last run left off: the newest publish date it saw. before any run has kept that, the publish date of
+	the newest article we have
+	"""
+	last_run = DataHarvestEventLog.objects.filter(data_type=DATA_HARVEST_TYPE_ARTICLES, data_through__isnull=False)
+	last_run = last_run.order_by('-date_started').first()
+	if last_run is not None:
+		return last_run.data_through
+	return Article.objects.aggregate(Max('date_pub'))['date_pub__max']
+
+
+def get_articles(since=None, transport=None):
+	"""
+	add the articles published since `since` (by default, where the last run left off).
+	returns (a description of what happened, where this run leaves off: the newest publish date seen)
+	"""
+	if since is None:
+		since = get_last_run_data_through()
+
+	articles, num_pages, caught_up = get_articles_json(since=since, transport=transport)
+
+	print 'num articles returned from API:', len(articles), 'pages:', num_pages
+
+	# the next run picks up from the newest article we've seen, kept or not
+	publish_dates = [_get_publish_date(a) for a in articles]
+	if since is not None:
+		publish_dates.append(since)
+	data_through = max(publish_dates) if publish_dates else None
+
+	gap_note = ''
+	if not caught_up:
+		# we move on from the newest article anyway, or we'd never get out from under the burst
+		oldest_publish_date = _get_publish_date(articles[-1])
+		print 'warning: %d pages were not enough to get back to %s; articles published between then and %s were skipped' % (
+			max_pages_per_run, since, oldest_publish_date)
+		gap_note = '; page limit reached, articles between %s and %s skipped' % (since, oldest_publish_date)
 
 	# for all of those articles, keep only the ones that have a 'tickers' value
 	articles = [article for article in articles if article['tickers']]
 
 	print 'num articles with tickers:', len(articles)
 
-	count_of_articles_added = 0
+	# look up tickers (by instrument id) and services (by name) once, rather than once per article
+	ticker_ids_keyed_by_instrument_id = dict(Ticker.objects.values_list('instrument_id', 'id'))
+	service_ids_keyed_by_name = dict(Service.objects.values_list('name', 'id'))
+
+	candidate_articles = []
 
 	for article_json in articles:
-		for ticker_defn in article_json['tickers']:
-			instrument_id = ticker_defn['instrument_id']
+		# examples of values we expect in ['service']['slug']: 'hidden_gems','stock_advisor','supernova'
+		# we need to have corresponding Service records
+		service_slug = article_json['service']['slug']
+		service_slug = service_slug.replace('-','_')
+		if service_slug not in service_ids_keyed_by_name:
+			# if we don't find a match, then assume we don't care to process the article
+			print 'no match for service', service_slug
+			continue
+
+		# assign the url. in the json, the "base domain" of the url is not defined - eg only the part of the path after 'newsletters.fool.com' and 'www.fool.com'.
+		# so based on the service, we decide what base domain to use. this is
+		# so that the user can copy-paste a complete url
+		if article_json['legacy_uri']:
+			content_base_url = 'newsletters.fool.com'
+			if service_slug == 'usmf_free':
+				continue
+			article_url = content_base_url + article_json['legacy_uri']
+		else:
+			# for some reason, we couldn't figure out the 'legacy_uri' (essentially, the article's url)
+			# without the url, let's say that the article is not worthwhile to SOL.
+			print 'could not find legacy_uri'
+			continue
+
+		article_tags = set() # we'll use this set to keep track of all tags associated with this article
+		for tags in article_json['tags']:
+			slug = tags['slug'].replace('-', ' ')
+			article_tags.add(slug)  # add to the list
+		article_tags = ', '.join(article_tags) # convert to a pretty string
+
+		publish_date = _get_publish_date(article_json)
 
+		for ticker_defn in article_json['tickers']:
 			# does SOl have a ticker that corresponds to this instrument id?
 			# if so, then we'll proceed with giving SOL a copy of this article
 			# else, we'll skip this article
-			ticker_matches = Ticker.objects.filter(instrument_id=instrument_id)
-			if not ticker_matches:
-				continue  # don't process the rest of the lines in this for loop
-
-			ticker_match = ticker_matches[0]
-		
-			# examples of values we expect in ['service']['slug']: 'hidden_gems','stock_advisor','supernova'
-			# we need to have corresponding Service records
-			service_slug = article_json['service']['slug']
-			# find those corresponding Service records. in practice, we should get at most 1 match
-			service_slug = service_slug.replace('-','_')
-			service_matches = Service.objects.filter(name=service_slug)
-			if len(service_matches)==0:
-				# if we don't find a match, then assume we don't care to process the article
-				print 'no match for service', service_slug
-				continue
-
-			# assign the url. in the json, the "base domain" of the url is not defined - eg only the part of the path after 'newsletters.fool.com' and 'www.fool.com'. 
-			# so based on the service, we decide what base domain to use. this is
-			# so that the user can copy-paste a complete url
-			article_url = None
-			if article_json['legacy_uri']:
-				content_base_url = 'newsletters.fool.com'
-				if service_slug == 'usmf_free':
-					continue
-				article_url = content_base_url + article_json['legacy_uri']
-			else:
-				# for some reason, we couldn't figure out the 'legacy_uri' (essentially, the article's url)
-				# without the url, let's say that the article is not worthwhile to SOL.
-				print 'could not find legacy_uri'
-				continue
-			
-			# this url & ticker combo should exist only once in our set of Article objects.
-			# if the combo already exists, we won't introduce this article for that ticker.
-			url_matches = Article.objects.filter(url=article_url, ticker=ticker_match)
-			if len(url_matches) >0:
-				print 'found duplicate', article_url, ticker_match
+			ticker_id = ticker_ids_keyed_by_instrument_id.get(ticker_defn['instrument_id'])
+			if ticker_id is None:
 				continue
 
-			service = service_matches[0]
-
-			article_tags = set() # we'll use this set to keep track of all tags associated with this article
-			for tags in article_json['tags']:
-				slug = tags['slug'].replace('-', ' ')
-				article_tags.add(slug)  # add to the list
-			article_tags = ', '.join(article_tags) # convert to a pretty string
-			
-			publish_date = article_json['publish_at']
-			publish_date = publish_date.replace('T',' ')
-			publish_date = publish_date.split('Z')[0]
-
 			article = Article()
 			article.title = article_json['headline'][:100]
-			article.service = service
+			article.service_id = service_ids_keyed_by_name[service_slug]
 			article.author = article_json['byline'][:50]
-			article.date_pub = datetime.datetime.strptime(publish_date, '%Y-%m-%d %H:%M:%S')
-			article.ticker  = ticker_match
+			article.date_pub = publish_date
+			article.ticker_id = ticker_id
 			article.url = article_url
 			article.tags = article_tags
-			article.save()
+			candidate_articles.append(article)
+
+	# this url & ticker combo should exist only once in our set of Article objects (the db enforces it with a
+	# unique constraint). the combos we already have are found with one query per 500 urls and skipped up front;
+	# the insert itself ignores any duplicate that slips in between that query and the insert
+	existing_url_ticker_pairs = set()
+	candidate_urls = list(set([a.url for a in candidate_articles]))
+	chunk_size = 500
+	for start_idx in range(0, len(candidate_urls), chunk_size):
+		urls_to_check = candidate_urls[start_idx:start_idx+chunk_size]
+		existing_url_ticker_pairs.update(Article.objects.filter(url__in=urls_to_check).values_list('url', 'ticker_id'))
+
+	articles_to_add = []
+	for article in candidate_articles:
+		url_ticker_pair = (article.url, article.ticker_id)
+		if url_ticker_pair in existing_url_ticker_pairs:
+			continue
+		# (also guards against an article showing up on two pages, if new articles were published while we paged)
+		existing_url_ticker_pairs.add(url_ticker_pair)
+		articles_to_add.append(article)
 
-			count_of_articles_added += 1
+	count_of_articles_added = bulk_create_ignoring_duplicates(Article, articles_to_add)
+	if count_of_articles_added:
+		invalidate_market_snapshot()
 
-	return 'number of articles added (one per url/ticker pair): %d' % count_of_articles_added
+	status_message = 'pages fetched: %d; number of articles added (one per url/ticker pair): %d' % (num_pages, count_of_articles_added)
+	return status_message + gap_note, data_through
 
 
 
 class Command(BaseCommand):
-    help = 'Retrieves from the hydra/napi API the most recent 100 articles across the premium services and creates corresponding Article objects'
+    help = 'Retrieves from the hydra/napi API the articles across the premium services published since the last run and creates corresponding Article objects'
 
     def handle(self, *args, **options):
 		print 'starting script'
@@ -117,11 +213,12 @@ class Command(BaseCommand):
 
 		script_start_time = datetime.datetime.now()
 		try:
-			status_message = get_articles()
-			log_notes = status_message
+			log_notes, event_log.data_through = get_articles()
+			event_log.succeeded = True
 		except Exception as e:
 			print "error getting articles.", str(e)
 			log_notes = str(e)
+			event_log.succeeded = False
 
 		script_end_time = datetime.datetime.now()
 		total_seconds = (script_end_time - script_start_time).total_seconds()
@@ -131,4 +228,4 @@ class Command(BaseCommand):
 		event_log.notes = log_notes
 		event_log.save()
 
-		print 'finished script'
\ No newline at end of file
+		print 'finished script'
@@ -1,55 +1,135 @@
 '''
 updates the ServiceTake objects, adding BBN, new, core status
+
+the import runs in two stages:
+ 1. fetch the open positions of every Scorecard from the scorecards API, several scorecards at a time over
+    keep-alive connections (with timeouts and retries). nothing is written yet, so if any scorecard can't be
+    fetched we stop here and the previous recs stay in place.
+ 2. write everything in a single transaction: create Tickers for symbols we haven't seen, replace the ServiceTakes
+    with one bulk insert, and recompute each ticker's scorecards_for_ticker / services_for_ticker (and the
+    ticker/service membership table) once, at the end.
 '''
 
-import urllib
 import json
 import datetime
+from optparse import make_option
 from django.core.management.base import BaseCommand, CommandError
-from satellite.models import Ticker, Scorecard, ServiceTake
+from django.db import transaction
+from django.db.models import Q
+from satellite.cache_utils import invalidate_ticker_symbols
+from satellite.db_utils import bulk_update
+from satellite.http_utils import HttpTransport, get_with_retries, map_concurrently
+from satellite.models import Ticker, Scorecard, ServiceTake, rebuild_service_memberships, \
+    DataHarvestEventLog, DATA_HARVEST_TYPE_SCORECARD_RECS
 
 base_url = 'http://apiary.fool.com/PremiumScorecards/v1/scorecards/'
 
+num_fetch_workers = 8
+fetch_timeout_in_seconds = 30
+
+
+def get_open_positions(scorecard, transport, scorecards_base_url=base_url):
+    """ ask the scorecards API for the open positions of this Scorecard """
+    url = scorecards_base_url + scorecard.name
+    response = get_with_retries(transport, url, timeout=fetch_timeout_in_seconds)
+    json_resp = json.loads(response)
+    return json_resp['OpenPositions']
+
+
+def fetch_all_open_positions(scorecards, transport=None, scorecards_base_url=base_url, max_workers=num_fetch_workers):
+    """
+    fetch the open positions of all of these scorecards, up to max_workers at a time.
+    returns a list of (Scorecard, list of open positions) pairs, in the same order as scorecards.
+    if any scorecard couldn't be fetched, raises a CommandError that names them all.
+
+    transport: what makes the http requests (by default, an HttpTransport); tests can pass a fake, or
+    point scorecards_base_url at a local server
+    """
+    if transport is None:
+        transport = HttpTransport()
+
+    results = map_concurrently(lambda sc: get_open_positions(sc, transport, scorecards_base_url), scorecards, max_workers)
+
+    # the workers don't print (their output would interleave); we report each scorecard from here instead
+    for scorecard, open_positions, error in results:
+        if error is None:
+            print scorecards_base_url + scorecard.name, 'open positions:', len(open_positions)
+        else:
+            print scorecards_base_url + scorecard.name, 'error:', error
+
+    failures = ['%s (%s)' % (scorecard.name, error) for scorecard, open_positions, error in results if error is not None]
+    if failures:
+        raise CommandError("couldn't fetch scorecards: " + ', '.join(failures))
+
+    return [(scorecard, open_positions) for scorecard, open_positions, error in results]
+
+
+def _get_ticker_symbol(open_position):
+    ticker_symbol = open_position['UnderlyingTickerSymbol']
+    if ticker_symbol == '':
+        ticker_symbol = open_position['TickerSymbol']
+    return ticker_symbol
+
+
+def save_open_positions(open_positions_by_scorecard):
+    """
+    open_positions_by_scorecard: a list of (Scorecard, list of open positions as returned by the API) pairs
+
+    replaces all ServiceTakes with ones for these open positions and refreshes the tickers' denormalized
+    scorecard/service fields. returns a short description of what was written.
+    """
+    with transaction.atomic():
+
+        # the tickers we'll touch: the ones in these open positions (looked up a chunk of symbols at a time, to
+        # stay under sqlite's limit of 999 query parameters), plus the ones some scorecard held last time, which
+        # may need clearing. create the Tickers we don't know about yet in one insert
+        ticker_symbols = list(set([_get_ticker_symbol(o) for scorecard, open_positions in open_positions_by_scorecard
+            for o in open_positions]))
+        ticker_by_symbol = {}
+        chunk_size = 500
+        for start_idx in range(0, len(ticker_symbols), chunk_size):
+            for t in Ticker.objects.filter(ticker_symbol__in=ticker_symbols[start_idx:start_idx+chunk_size]):
+                ticker_by_symbol[t.ticker_symbol] = t
+        for t in Ticker.objects.filter(Q(scorecards_for_ticker__isnull=False) | Q(services_for_ticker__isnull=False)):
+            ticker_by_symbol.setdefault(t.ticker_symbol, t)
+
+        new_tickers_by_symbol = {}
+        for scorecard, open_positions in open_positions_by_scorecard:
+            for o in open_positions:
+                ticker_symbol = _get_ticker_symbol(o)
+                if ticker_symbol in ticker_by_symbol or ticker_symbol in new_tickers_by_symbol:
+                    continue
+
+                t = Ticker()
+                t.ticker_symbol = ticker_symbol
+                t.instrument_id = o['InstrumentId']
+                t.exchange_symbol = o['ExchangeSymbol']
+                t.percent_change_historical = 0.0
+                t.company_name = o['CompanyName']
+                new_tickers_by_symbol[ticker_symbol] = t
+
+        if new_tickers_by_symbol:
+            print 'new tickers:', ', '.join(sorted(new_tickers_by_symbol.keys()))
+            Ticker.objects.bulk_create(new_tickers_by_symbol.values())
+            # bulk_create doesn't hand back the new db ids, so look the new tickers up again
+            new_ticker_symbols = new_tickers_by_symbol.keys()
+            for start_idx in range(0, len(new_ticker_symbols), chunk_size):
+                for t in Ticker.objects.filter(ticker_symbol__in=new_ticker_symbols[start_idx:start_idx+chunk_size]):
+                    ticker_by_symbol[t.ticker_symbol] = t
+            # bulk_create doesn't send post_save either
+            invalidate_ticker_symbols()
+
+        # replace all previous ServiceTakes
+        ServiceTake.objects.all().delete()
 
-class Command(BaseCommand):
-    help = "Imports core, first, BBN, new rec information for tickers."
-
-    def handle(self, *args, **options):
-
-        print "Let's do this"
+        service_takes = []
+        scorecard_names_by_ticker_id = {}
+        service_names_by_ticker_id = {}
 
-        # delete all previous ServiceTakes
-        ServiceTake.objects.all().delete()
+        for scorecard, open_positions in open_positions_by_scorecard:
+            for o in open_positions:
+                t = ticker_by_symbol[_get_ticker_symbol(o)]
 
-        for scorecard in Scorecard.objects.all():
-            print scorecard
-            scorecard_name = scorecard.name
-            url = base_url + scorecard_name
-            print url
-            response = urllib.urlopen(url).read()
-            json_resp = json.loads(response)
-            op = json_resp['OpenPositions']
-            for o in op:
-                ticker_symbol = o['UnderlyingTickerSymbol']
-                if ticker_symbol=='':
-                    ticker_symbol=o['TickerSymbol']
-
-                print ticker_symbol
-                # create a Ticker for this symbol if it doesn't exist
-                matches = Ticker.objects.filter(ticker_symbol=ticker_symbol)        
-                if len(matches)==0:
-                    t = Ticker()
-                    t.ticker_symbol = ticker_symbol
-                    t.instrument_id = o['InstrumentId']
-                    t.exchange_symbol = o['ExchangeSymbol']
-                    t.percent_change_historical = 0.0
-                    t.company_name = o['CompanyName']
-                    t.save()
-                else:
-                    t = matches[0]
-
-        
-               # create a ServiceTake
                 st = ServiceTake()
                 st.is_core = o['IsCore']
                 st.is_first = o['IsFirst']
@@ -60,38 +140,87 @@ class Command(BaseCommand):
                 st.scorecard = scorecard
                 temp = o['OpenDate']
                 temp = temp.split('T')[0]
-                st.open_date = datetime.datetime.strptime(temp, '%Y-%m-%d')
+                st.open_date = datetime.datetime.strptime(temp, '%Y-%m-%d').date()
+                service_takes.append(st)
+
+                scorecard_names_by_ticker_id.setdefault(t.id, set()).add(scorecard.pretty_name)
+                service_names_by_ticker_id.setdefault(t.id, set()).add(scorecard.service.pretty_name)
+
+        ServiceTake.objects.bulk_create(service_takes)
+
+        # create scorecards_for_ticker and services_for_ticker, once per ticker; write only the ones that changed
+        tickers_to_update = []
+        for t in ticker_by_symbol.values():
+            if t.id in scorecard_names_by_ticker_id:
+                scorecards_for_ticker = ", ".join(sorted(scorecard_names_by_ticker_id[t.id]))
+                services_for_ticker = ", ".join(sorted(service_names_by_ticker_id[t.id]))
+            else:
+                # no scorecard holds this ticker anymore
+                scorecards_for_ticker = None
+                services_for_ticker = None
 
-                st.save()
+            if t.scorecards_for_ticker != scorecards_for_ticker or t.services_for_ticker != services_for_ticker:
+                t.scorecards_for_ticker = scorecards_for_ticker
+                t.services_for_ticker = services_for_ticker
+                tickers_to_update.append(t)
 
-                #create scorecards_for_ticker and services_for_ticker
-                service_takes_on_this_ticker = ServiceTake.objects.filter(ticker=t)
-                scorecards_for_ticker = list()
-                for st in service_takes_on_this_ticker:
-                    scorecards_for_ticker.append(st.scorecard.pretty_name)
+        bulk_update(tickers_to_update, ['scorecards_for_ticker', 'services_for_ticker'])
 
-                scorecards_for_ticker = set(scorecards_for_ticker)
-                t.scorecards_for_ticker = ", ".join(scorecards_for_ticker)
+        # refresh the ticker/service membership table that the service filters query against
+        num_memberships = rebuild_service_memberships()
 
-                services_for_ticker = list()
-                for st in service_takes_on_this_ticker:
-                    services_for_ticker.append(st.scorecard.service.pretty_name)
+    return 'service takes: %d; new tickers: %d; tickers updated: %d; ticker/service memberships: %d' % (
+        len(service_takes), len(new_tickers_by_symbol), len(tickers_to_update), num_memberships)
 
-                services_for_ticker = set(services_for_ticker)
-                t.services_for_ticker = ", ".join(services_for_ticker)
 
-                t.save()
+class Command(BaseCommand):
+    help = "Imports core, first, BBN, new rec information for tickers."
 
-#self.stdout.write("finished")
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', type='int', dest='workers', default=num_fetch_workers,
+            help='how many scorecards to fetch at a time (default: %d)' % num_fetch_workers),
+    )
 
+    def handle(self, *args, **options):
 
+        print "Let's do this"
 
+        event_log = DataHarvestEventLog()
+        event_log.data_type = DATA_HARVEST_TYPE_SCORECARD_RECS
+        event_log.notes = 'running'
+        event_log.save()
 
+        script_start_time = datetime.datetime.now()
+        fetch_seconds = 0
+        transport = HttpTransport()
+        error = None
+        try:
+            # stage 1: fetch. nothing has been written yet
+            scorecards = list(Scorecard.objects.all().select_related('service'))
+            open_positions_by_scorecard = fetch_all_open_positions(scorecards, transport, max_workers=options['workers'])
 
+            fetch_seconds = (datetime.datetime.now() - script_start_time).total_seconds()
 
+            # stage 2: write
+            log_notes = save_open_positions(open_positions_by_scorecard)
+        except Exception as e:
+            print "error importing scorecard recs.", str(e)
+            log_notes = 'error: %s' % str(e)
+            error = e
+        finally:
+            transport.close()
 
+        total_seconds = (datetime.datetime.now() - script_start_time).total_seconds()
 
+        print 'time elapsed: %d seconds' % total_seconds
 
+        event_log.notes = '%s; fetch: %.1f s; total: %.1f s' % (log_notes, fetch_seconds, total_seconds)
+        event_log.save()
 
+        print event_log.notes
 
+        if error is not None:
+            # exit with a failure, so that whatever ran us (eg cron) knows the import didn't happen
+            raise CommandError('error importing scorecard recs: %s' % error)
 
+        print 'finished script'
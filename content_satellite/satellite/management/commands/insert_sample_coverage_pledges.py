@@ -4,7 +4,7 @@ insert fake CoverageType records
 from datetime import datetime
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from satellite.models import Ticker, COVERAGE_CHOICES, CoverageType, Service
+from satellite.models import Ticker, COVERAGE_CHOICES, CoverageType
 import random
 
 class Command(BaseCommand):
@@ -17,14 +17,17 @@ class Command(BaseCommand):
 
         num_inserts = 0
 
-        for t in Ticker.objects.all():
-            for s in Service.objects.all():
-                if t.services_for_ticker is not None and s.pretty_name in t.services_for_ticker:
-                    randomly_selected_coverage_type = random.randint(0, len(COVERAGE_CHOICES)-1)   # https://docs.python.org/2/library/random.html
+        # one row per ticker/service pair, straight from the ticker/service membership table
+        memberships = Ticker.covering_services.through.objects.all().select_related('ticker', 'service')
 
-                    coverage_type = CoverageType(ticker=t, service=s, coverage_type=randomly_selected_coverage_type)
-                    coverage_type.save()
-                    print 'inserted coverage type %s %s %s' % (t.ticker_symbol, s.pretty_name, randomly_selected_coverage_type)
-                    num_inserts += 1
+        for m in memberships:
+            t = m.ticker
+            s = m.service
+            randomly_selected_coverage_type = random.randint(0, len(COVERAGE_CHOICES)-1)   # https://docs.python.org/2/library/random.html
+
+            coverage_type = CoverageType(ticker=t, service=s, coverage_type=randomly_selected_coverage_type)
+            coverage_type.save()
+            print 'inserted coverage type %s %s %s' % (t.ticker_symbol, s.pretty_name, randomly_selected_coverage_type)
+            num_inserts += 1
 
         print 'finished script. num inserts: %d' % num_inserts
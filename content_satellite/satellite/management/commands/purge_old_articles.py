@@ -1,27 +1,103 @@
 '''
-purge articles older than 100 days
+purge old articles. each Service can say how many days of its articles to keep (Service.article_retention_days);
+services that don't say keep 100 days' worth.
+
+the old articles are deleted batch_size at a time, by primary key, so that no single delete holds the table for long.
+articles without a publish date are left alone.
 '''
+import datetime
+from optparse import make_option
+
 from django.core.management.base import BaseCommand, CommandError
-from datetime import datetime, timedelta
-from satellite.models import Article
+from django.utils import timezone
+from satellite.cache_utils import invalidate_market_snapshot
+from satellite.models import Article, Service, DataHarvestEventLog, DATA_HARVEST_TYPE_ARTICLE_PURGE
 
 max_age_in_days = 100
+batch_size = 1000
+
+
+def get_date_threshold(service, now=None):
+	""" articles of this service published before this moment are old enough to purge """
+	if now is None:
+		now = timezone.now()
+	days_to_keep = service.article_retention_days
+	if days_to_keep is None:
+		days_to_keep = max_age_in_days
+	return now - datetime.timedelta(days=days_to_keep)
+
+
+def purge_old_articles(dry_run=False, batch_size=batch_size):
+	"""
+	delete the old articles of every service. returns a dictionary, keys = Service, values = number of articles
+	deleted (or, for a dry run, the number that would have been deleted)
+	"""
+	now = timezone.now()
+	counts_keyed_by_service = {}
+
+	for service in Service.objects.all():
+		old_articles = Article.objects.filter(service=service, date_pub__lt=get_date_threshold(service, now))
+
+		if dry_run:
+			counts_keyed_by_service[service] = old_articles.count()
+			continue
+
+		num_deleted = 0
+		while True:
+			article_ids = list(old_articles.order_by('id').values_list('id', flat=True)[:batch_size])
+			if not article_ids:
+				break
+			Article.objects.filter(id__in=article_ids).delete()
+			num_deleted += len(article_ids)
+		counts_keyed_by_service[service] = num_deleted
+
+	if not dry_run and sum(counts_keyed_by_service.values()):
+		# queryset deletes send no signals the landing page hears; its newest article may be gone
+		invalidate_market_snapshot()
+
+	return counts_keyed_by_service
+
 
 class Command(BaseCommand):
-    help = 'Deletes articles older than 100 days'
+    help = 'Deletes articles older than their service\'s retention period (100 days, unless the service says otherwise)'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run', action='store_true', dest='dry_run', default=False,
+            help='only count the articles that would be deleted'),
+        make_option('--batch-size', type='int', dest='batch_size', default=batch_size,
+            help='how many articles to delete per statement (default: %d)' % batch_size),
+    )
 
     def handle(self, *args, **options):
-    	print 'starting script'
+		print 'starting script'
+
+		dry_run = options['dry_run']
+
+		event_log = DataHarvestEventLog()
+		event_log.data_type = DATA_HARVEST_TYPE_ARTICLE_PURGE
+		event_log.notes = 'running'
+		event_log.save()
+
+		script_start_time = datetime.datetime.now()
+		try:
+			counts_keyed_by_service = purge_old_articles(dry_run=dry_run, batch_size=options['batch_size'])
+			total_count = sum(counts_keyed_by_service.values())
+			log_notes = '%s: %d' % ('articles to delete' if dry_run else 'articles deleted', total_count)
+			counts_by_service = ['%s: %d' % (s.pretty_name, c) for s, c in sorted(counts_keyed_by_service.items(), key=lambda x: x[0].pretty_name) if c]
+			if counts_by_service:
+				log_notes += '; ' + ', '.join(counts_by_service)
+		except Exception as e:
+			print "error purging articles.", str(e)
+			log_notes = 'error: %s' % str(e)
 
-        print 'how many articles?', len(Article.objects.all())
-        date_threshold = (datetime.today() - timedelta(days=max_age_in_days)).date()
-    	all_articles = Article.objects.all()
+		total_seconds = (datetime.datetime.now() - script_start_time).total_seconds()
 
+		print 'time elapsed: %d seconds' % total_seconds
 
-    	for art in all_articles:
-            if art.date_pub < date_threshold:
-                print "deleting ", art.url
-                art.delete()
+		if dry_run:
+			log_notes = 'dry run; ' + log_notes
+		event_log.notes = log_notes
+		event_log.save()
 
-    	print 'how many articles now?', len(Article.objects.all())
-    	print 'finished script'
+		print log_notes
+		print 'finished script'
@@ -1,16 +1,77 @@
 '''
-zero-out the 'daily_percent_change' field on all Ticker objects
+zero-out the 'daily_percent_change' field on all Ticker objects, with one UPDATE
+
+with --archive, the values being zeroed (the previous trading day's changes) are first copied into
+TickerDailyPerformance with one bulk INSERT, dated the last trading day the history has (or --date). (the quote
+ingest keeps that history itself; this fills in whatever it missed.)
 '''
-from datetime import datetime
-from django.conf import settings
+import datetime
+from optparse import make_option
+
 from django.core.management.base import BaseCommand, CommandError
-from satellite.models import Ticker, DataHarvestEventLog, DATA_HARVEST_TYPE_MARKET_DATA
+from django.db import transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_date
+from satellite.cache_utils import invalidate_market_snapshot
+from satellite.db_utils import bulk_create_ignoring_duplicates
+from satellite.models import Ticker, TickerDailyPerformance, DataHarvestEventLog, DATA_HARVEST_TYPE_MARKET_DATA
+
+
+def get_last_trading_day():
+	"""
+	the most recent date in the TickerDailyPerformance history, or None if there's no history yet. the quote ingest
+	records a date only when the market was open, so this is the trading day that the tickers' changes belong to
+	"""
+	return TickerDailyPerformance.objects.aggregate(last_trading_day=Max('date'))['last_trading_day']
+
+
+def archive_daily_percent_changes(date):
+	"""
+	copy every ticker's daily_percent_change into a TickerDailyPerformance for the given date, with one bulk INSERT.
+	tickers that already have a row for that date (eg the archive already ran) are left alone.
+	returns the number of rows added
+	"""
+	already_archived_ticker_ids = set(TickerDailyPerformance.objects.filter(date=date).values_list('ticker_id', flat=True))
+	daily_performances = [TickerDailyPerformance(ticker_id=ticker_id, date=date, percent_change=daily_percent_change)
+		for ticker_id, daily_percent_change in Ticker.objects.order_by().values_list('id', 'daily_percent_change')
+		if ticker_id not in already_archived_ticker_ids]
+	return bulk_create_ignoring_duplicates(TickerDailyPerformance, daily_performances)
+
+
+def reset_daily_percent_changes(archive=False, archive_date=None):
+	"""
+	with archive, the changes are first archived under archive_date; by default, the last trading day in the history.
+	returns (count of tickers reset, count of rows archived, the date they were archived under)
+	"""
+	count_archived = 0
 
+	with transaction.atomic():
+		if archive:
+			if archive_date is None:
+				archive_date = get_last_trading_day()
+			if archive_date is not None:
+				count_archived = archive_daily_percent_changes(archive_date)
+			else:
+				print 'no history to say which trading day the changes are from; nothing archived (see --date)'
+
+		count_tickers_reset = Ticker.objects.update(daily_percent_change=0)
+
+	# update() sends no post_save signals, so the landing page's gainer/loser wouldn't hear about it
+	invalidate_market_snapshot()
+
+	return count_tickers_reset, count_archived, archive_date
 
 
 class Command(BaseCommand):
     help = 'zero-out the daily_percent_change for all Ticker objects'
 
+    option_list = BaseCommand.option_list + (
+        make_option('--archive', action='store_true', dest='archive', default=False,
+            help='first keep the current values as TickerDailyPerformance records, dated the last trading day in the history'),
+        make_option('--date', dest='archive_date', default=None,
+            help='with --archive, the date (YYYY-MM-DD) to archive the values under, instead'),
+    )
+
     def handle(self, *args, **options):
 		print 'starting script'
 
@@ -19,34 +80,30 @@ class Command(BaseCommand):
 		event_log.notes = 'running'
 		event_log.save()
 
-		tickers_symbols_that_errored = set()
-		count_tickers_successfully_updated = 0
+		script_start_time = datetime.datetime.now()
 
-		script_start_time = datetime.now()
-		
-		for ticker in Ticker.objects.all():
-			try:
-				ticker.daily_percent_change = 0
-				ticker.save()
-				count_tickers_successfully_updated += 1
-			except Exception as e:
-				print "couldn't reset daily percent change", ticker.ticker_symbol, str(e)
-				tickers_symbols_that_errored.add(ticker.ticker_symbol)
+		try:
+			archive_date = None
+			if options['archive_date']:
+				archive_date = parse_date(options['archive_date'])
+				if archive_date is None:
+					raise CommandError('not a date (YYYY-MM-DD): %s' % options['archive_date'])
 
+			count_tickers_reset, count_archived, archive_date = reset_daily_percent_changes(archive=options['archive'], archive_date=archive_date)
+			notes = 'tickers reset: %d; ' % count_tickers_reset
+			if options['archive']:
+				notes += 'archived: %d for %s; ' % (count_archived, archive_date)
+			notes += 'no errors'
+		except Exception as e:
+			print "couldn't reset daily percent changes", str(e)
+			notes = 'tickers reset: 0; errors: %s' % str(e)
 
-		script_end_time = datetime.now()
+		script_end_time = datetime.datetime.now()
 		total_seconds = (script_end_time - script_start_time).total_seconds()
 
 		print 'time elapsed: %d seconds' %  total_seconds
-		notes = 'tickers reset: %d; ' % count_tickers_successfully_updated
-		if tickers_symbols_that_errored:
-			notes += 'errors: ' + ', '.join(tickers_symbols_that_errored)
-		else:
-			notes += 'no errors'
-		event_log.notes = notes			
+		print notes
+		event_log.notes = notes
 		event_log.save()
 
 		print 'finished script'
-
-		print 'tickers that errored: %d' % len(tickers_symbols_that_errored)
-		print ', '.join(tickers_symbols_that_errored)
\ No newline at end of file
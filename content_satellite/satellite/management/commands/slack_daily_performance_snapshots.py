@@ -5,7 +5,7 @@ posts to slack an overview of the daily market performance of each service's rec
 from collections import Counter
 from django.core.management.base import BaseCommand, CommandError
 from datetime import datetime, timedelta
-from satellite.models import Service, Ticker
+from satellite.models import Service
 
 from satellite.slack_utils import post_message_to_slack
 
@@ -36,30 +36,15 @@ class Command(BaseCommand):
 	def handle(self, *args, **options):
 		print 'starting script'
 
-		# create a dictionary, keys = service pretty name, values = a list of tickers in that service
+		# create a dictionary, keys = service pretty name, values = a list of tickers in that service.
+		# the tickers come from the ticker/service membership table: one query for the services, one for their tickers
 		tickers_by_service_pretty_name = {}
 
-		# prime the dictionary: insert keys for the service pretty names, set the values to an empty list
-		for s in Service.objects.all():
-			tickers_by_service_pretty_name[s.pretty_name] = []
-
-		# populate the values
-		for ticker in Ticker.objects.all():
-			if not ticker.services_for_ticker:
-				continue
-			
-			# convert the string of services into a list, one element per service name
-			services_associated_with_ticker = ticker.services_for_ticker.split(",")
-
-			# strip whitespace from each element in the list
-			services_associated_with_ticker = [s.strip() for s in services_associated_with_ticker] 
-
-			for service_associated_with_ticker in services_associated_with_ticker:
-				tickers_by_service_pretty_name[service_associated_with_ticker].append(ticker)
+		for s in Service.objects.all().prefetch_related('covered_tickers'):
+			tickers_by_service_pretty_name[s.pretty_name] = list(s.covered_tickers.all())
 
 
-		# by this point, we've iterated over all tickers and via our dictionary know
-		# all that are associated to any service
+		# by this point, via our dictionary we know all the tickers that are associated to any service
 		# we'll now compile text summaries, one per service
 
 		text_summaries = []
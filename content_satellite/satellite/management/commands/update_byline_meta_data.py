@@ -1,45 +1,164 @@
 '''
 updates the BylineMetaData objects - account for authors of Articles published in the past year.
-for each of those authors, compile the tickers and services they've covered in the past year.
+for each of those authors, compile the tickers and services they've covered in the past year; authors with nothing
+in the past year are marked as such.
+
+by default only the authors whose past year has changed since the last successful run are recompiled: the ones
+with articles published since then, and the ones with articles that have turned a year old since then. with --full
+every author is recompiled; that's also what happens when there's no earlier successful run to go on, or when
+article purge has run since the last run (we can't tell whose articles it deleted).
 '''
-import urllib
-import json
-from datetime import datetime
+from collections import defaultdict
+from datetime import datetime, timedelta
+from optparse import make_option
 
-from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from satellite.models import Article, Service, BylineMetaData, DataHarvestEventLog, DATA_HARVEST_TYPE_BYLINE_META_DATA
-
-def get_dictionaries_of_service_names_and_ticker_symbols_keyed_by_byline():
-	service_names_set_keyed_by_author_name = {}
-	ticker_symbols_set_keyed_by_author_name = {}
-
-	one_year_ago = datetime(datetime.now().year-1, datetime.now().month, datetime.now().day)
-	for art in Article.objects.filter(date_pub__gt=one_year_ago):
-		byline = art.author.strip()
-
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from satellite.cache_utils import invalidate_single_authors
+from satellite.db_utils import bulk_update, bulk_create_ignoring_duplicates
+from satellite.models import Article, BylineMetaData, DataHarvestEventLog, DATA_HARVEST_TYPE_BYLINE_META_DATA, \
+	DATA_HARVEST_TYPE_ARTICLE_PURGE
+
+NOTHING_IN_THE_LAST_YEAR = 'nothing in the last year'
+# articles are imported a while after they're published, so an article published just before the last run may only
+# have shown up after it. look back this much further than the last run to catch those
+overlap = timedelta(days=1)
+# keeps each "IN (...)" under sqlite's limit of 999 query parameters
+chunk_size = 500
+
+
+def _get_one_year_ago(now=None):
+	return (now or timezone.now()) - timedelta(days=365)
+
+
+def get_last_run_started():
+	""" when the last run that finished without an error began, or None if there hasn't been one """
+	last_runs = DataHarvestEventLog.objects.filter(data_type=DATA_HARVEST_TYPE_BYLINE_META_DATA, succeeded=True)
+	last_run = last_runs.order_by('-date_started').first()
+	return last_run.date_started if last_run else None
+
+
+def has_article_purge_run_since(when):
+	# any purge at all, however it went: one that errored part way may still have deleted some batches. (it's run
+	# by hand, now and then, so the odd full rebuild it costs is nothing)
+	return DataHarvestEventLog.objects.filter(data_type=DATA_HARVEST_TYPE_ARTICLE_PURGE, date_started__gte=when).exists()
+
+
+def get_authors_touched_since(when, now=None):
+	"""
+	the authors (as stored on Article, ie not stripped) whose past year looks different now than it did at `when`:
+	they've published since then, or one of their articles has turned a year old since then
+	"""
+	one_year_ago = _get_one_year_ago(now)
+	published_since = Q(date_pub__gte=when - overlap)
+	aged_out_since = Q(date_pub__gt=_get_one_year_ago(when) - overlap, date_pub__lte=one_year_ago)
+	articles = Article.objects.filter(published_since | aged_out_since)
+	return set(articles.order_by().values_list('author', flat=True).distinct())
+
+
+def compile_services_and_tickers_keyed_by_byline(articles):
+	"""
+	articles: a queryset of Articles. each distinct (author, service, ticker) comes back from a single values_list
+	query, so no Service or Ticker is loaded.
+	returns a dictionary, keys = byline, values = (service names, ticker symbols), each as a sorted, comma-separated string
+	"""
+	service_names_set_keyed_by_byline = defaultdict(set)
+	ticker_symbols_set_keyed_by_byline = defaultdict(set)
+
+	for author, service_name, ticker_symbol in articles.order_by().values_list('author', 'service__pretty_name', 'ticker__ticker_symbol').distinct():
+		byline = author.strip()
 		if byline == '':
 			continue
-
-		if byline not in service_names_set_keyed_by_author_name:
-			service_names_set_keyed_by_author_name[byline] = set()
-
-		if byline not in ticker_symbols_set_keyed_by_author_name:
-			ticker_symbols_set_keyed_by_author_name[byline] = set()
-
-		service_names_set_keyed_by_author_name[byline].add(art.service.pretty_name)
-		ticker_symbols_set_keyed_by_author_name[byline].add(art.ticker.ticker_symbol)
-
-	print 'finished creating dictionaries. unique bylines:', len(service_names_set_keyed_by_author_name.keys())
-	return service_names_set_keyed_by_author_name, ticker_symbols_set_keyed_by_author_name
+		service_names_set_keyed_by_byline[byline].add(service_name)
+		ticker_symbols_set_keyed_by_byline[byline].add(ticker_symbol)
+
+	services_and_tickers_keyed_by_byline = {}
+	for byline, service_names in service_names_set_keyed_by_byline.items():
+		services_and_tickers_keyed_by_byline[byline] = (', '.join(sorted(service_names)), ', '.join(sorted(ticker_symbols_set_keyed_by_byline[byline])))
+	return services_and_tickers_keyed_by_byline
+
+
+def save_byline_meta_data(services_and_tickers_keyed_by_byline, bylines=None):
+	"""
+	make the BylineMetaData objects match the compiled values: changed ones are written with one bulk UPDATE per batch,
+	new ones with one bulk INSERT, and unchanged ones not at all.
+	bylines: the bylines that were recompiled; the ones among them without compiled values are marked as having
+	nothing in the last year. None means every BylineMetaData was recompiled.
+	returns (count of objects updated, count of objects created)
+	"""
+	services_and_tickers_keyed_by_byline = dict(services_and_tickers_keyed_by_byline)
+
+	if bylines is None:
+		byline_meta_data = list(BylineMetaData.objects.all())
+	else:
+		bylines = list(set(bylines) | set(services_and_tickers_keyed_by_byline))
+		byline_meta_data = []
+		for start_idx in range(0, len(bylines), chunk_size):
+			byline_meta_data.extend(BylineMetaData.objects.filter(byline__in=bylines[start_idx:start_idx+chunk_size]))
+
+	byline_meta_data_to_update = []
+	for b in byline_meta_data:
+		services, tickers = services_and_tickers_keyed_by_byline.pop(b.byline, (NOTHING_IN_THE_LAST_YEAR, NOTHING_IN_THE_LAST_YEAR))
+		if b.services != services or b.tickers != tickers:
+			b.services = services
+			b.tickers = tickers
+			byline_meta_data_to_update.append(b)
+
+	# whatever's left is a byline we haven't seen before
+	byline_meta_data_to_create = [BylineMetaData(byline=byline, services=services, tickers=tickers) for byline, (services, tickers) in sorted(services_and_tickers_keyed_by_byline.items())]
+
+	with transaction.atomic():
+		count_updated = bulk_update(byline_meta_data_to_update, ['services', 'tickers'])
+		count_created = bulk_create_ignoring_duplicates(BylineMetaData, byline_meta_data_to_create)
+
+	if count_created:
+		# bulk_create sends no post_save signals, and the new bylines belong on the list of authors to choose from
+		invalidate_single_authors()
+
+	return count_updated, count_created
+
+
+def rebuild_byline_meta_data():
+	""" recompile every author. returns (count of bylines recompiled, count updated, count created) """
+	articles = Article.objects.filter(date_pub__gt=_get_one_year_ago())
+	services_and_tickers_keyed_by_byline = compile_services_and_tickers_keyed_by_byline(articles)
+	count_updated, count_created = save_byline_meta_data(services_and_tickers_keyed_by_byline)
+	return len(services_and_tickers_keyed_by_byline), count_updated, count_created
+
+
+def update_byline_meta_data(since):
+	""" recompile the authors touched since `since`. returns (count of bylines recompiled, count updated, count created) """
+	authors = get_authors_touched_since(since)
+	# an author stored with stray whitespace shares a byline with the stripped version; recompile both spellings
+	authors = list(authors | set([author.strip() for author in authors]))
+
+	one_year_ago = _get_one_year_ago()
+	services_and_tickers_keyed_by_byline = {}
+	for start_idx in range(0, len(authors), chunk_size):
+		articles = Article.objects.filter(date_pub__gt=one_year_ago, author__in=authors[start_idx:start_idx+chunk_size])
+		services_and_tickers_keyed_by_byline.update(compile_services_and_tickers_keyed_by_byline(articles))
+
+	bylines = set([author.strip() for author in authors]) - set([''])
+	count_updated, count_created = save_byline_meta_data(services_and_tickers_keyed_by_byline, bylines)
+	return len(bylines), count_updated, count_created
 
 
 class Command(BaseCommand):
-    help = 'assigns the services_for_byline for all BylineMetaData objects'
+    help = 'assigns the services and tickers for the BylineMetaData objects of the authors whose past year has changed since the last run'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--full', action='store_true', dest='full', default=False,
+            help='recompile every author, not just the ones touched since the last run'),
+    )
 
     def handle(self, *args, **options):
 		print 'starting script'
 
+		# look this up before logging this run, which would otherwise count as the last one
+		last_run_started = get_last_run_started()
+
 		event_log = DataHarvestEventLog()
 		event_log.data_type = DATA_HARVEST_TYPE_BYLINE_META_DATA
 		event_log.notes = 'running'
@@ -49,54 +168,36 @@ class Command(BaseCommand):
 
 		notes = ''
 		try:
-			service_names_set_keyed_by_author_name, ticker_symbols_set_keyed_by_author_name = get_dictionaries_of_service_names_and_ticker_symbols_keyed_by_byline()
-
-			for byline in service_names_set_keyed_by_author_name.keys():
-
-				services_for_byline = service_names_set_keyed_by_author_name[byline]
-				tickers_for_byline = ticker_symbols_set_keyed_by_author_name[byline]
-
-				services_for_byline = list(services_for_byline)
-				tickers_for_byline = list(tickers_for_byline)
-
-				services_for_byline.sort()
-				tickers_for_byline.sort()
-
-				services_for_byline = ', '.join(services_for_byline)
-				tickers_for_byline = ', '.join(tickers_for_byline)
-
-				matches_by_byline = BylineMetaData.objects.filter(byline=byline)
-				if matches_by_byline:
-					for m in matches_by_byline:
-						m.services = services_for_byline
-						m.tickers = tickers_for_byline
-						m.save()
-				else:
-					b = BylineMetaData()
-					b.byline = byline
-					b.services = services_for_byline
-					b.tickers = tickers_for_byline
-					b.save()
-
-
-			for bylineMetaData in BylineMetaData.objects.all():
-				if bylineMetaData.byline not in service_names_set_keyed_by_author_name.keys():
-					bylineMetaData.services = "nothing in the last year"
-					bylineMetaData.tickers = "nothing in the last year"
-					bylineMetaData.save()
-					continue
-
-			notes = 'updated %d BylineMetaData objects' % len(service_names_set_keyed_by_author_name.keys())
+			if options['full']:
+				full_reason = 'full rebuild, as asked'
+			elif last_run_started is None:
+				full_reason = 'full rebuild, no earlier run'
+			elif has_article_purge_run_since(last_run_started):
+				full_reason = 'full rebuild, article purge has run since the last run'
+			else:
+				full_reason = None
+
+			if full_reason:
+				count_recompiled, count_updated, count_created = rebuild_byline_meta_data()
+				notes = full_reason
+			else:
+				count_recompiled, count_updated, count_created = update_byline_meta_data(since=last_run_started)
+				notes = 'changes since %s' % last_run_started.strftime('%Y-%m-%d %H:%M')
+
+			notes += '; bylines recompiled: %d; updated %d BylineMetaData objects, created %d' % (count_recompiled, count_updated, count_created)
+			event_log.succeeded = True
 
 		except Exception as e:
 			print 'error', str(e)
 			notes = "error: %s" % str(e)
+			event_log.succeeded = False
 
 		script_end_time = datetime.now()
 		total_seconds = (script_end_time - script_start_time).total_seconds()
 
 		print 'time elapsed: %d seconds' %  total_seconds
-		event_log.notes = notes			
+		print notes
+		event_log.notes = notes
 		event_log.save()
 
-		print 'finished script'
\ No newline at end of file
+		print 'finished script'
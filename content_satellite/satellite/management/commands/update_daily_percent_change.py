@@ -1,66 +1,164 @@
 '''
 update the 'daily_percent_change' field on all Ticker objects
+
+quotes are fetched in batches of symbols, several batches at a time, from a quote provider (by default Yahoo Finance's
+YQL endpoint). once every batch is back, all the new values are written with one bulk UPDATE of daily_percent_change,
+and today's TickerDailyPerformance rows are brought in step with them (one bulk UPDATE, one bulk INSERT).
+with --intraday, each value is also kept as a TickerIntradayPerformance (one bulk INSERT).
+
+when every quote is just the last trading day's change over again, the market hasn't opened today (a holiday, or too
+early), and no history is recorded; dated today, those changes would count twice in percent_change_historical.
 '''
 import urllib
 import json
 import datetime
+from optparse import make_option
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from satellite.models import Ticker, DataHarvestEventLog, DATA_HARVEST_TYPE_MARKET_DATA
+from django.utils import timezone
+from satellite.cache_utils import invalidate_market_snapshot
+from satellite.db_utils import bulk_update
+from satellite.http_utils import HttpTransport, get_with_retries, map_concurrently
+from satellite.models import Ticker, TickerDailyPerformance, TickerIntradayPerformance, DataHarvestEventLog, DATA_HARVEST_TYPE_MARKET_DATA, \
+	record_daily_performances
 
+batch_size = 25
+num_fetch_workers = 8
+intraday_history_days = 5
 
-def get_daily_percent_change(ticker_symbols_as_list):
-	""" get the daily percent change, as reported by Yahoo Finance
+
+class YahooQuoteProvider(object):
 	"""
+	gets the daily percent change, as reported by Yahoo Finance.
+
+	a quote provider is anything with a get_daily_percent_changes(ticker_symbols) method that returns a dictionary,
+	keys = ticker symbol, values = daily percent change (as a string like '-1.25'); eg a stub that answers from
+	local data in tests.
+	"""
+
 	yahoo_finance_url = 'http://query.yahooapis.com/v1/public/yql'
 
-	# when we make the request, pass along additional preferences, eg the SQL query
-	ticker_symbols_as_string = ','.join(ticker_symbols_as_list)
-	data = {'q': "select Symbol, PercentChange from yahoo.finance.quotes where symbol in (%s)" % ticker_symbols_as_string, 
-	'format': 'json',
-	'diagnostics':'false',
-	'env': 'http://datatables.org/alltables.env',}
+	def __init__(self, transport=None, yahoo_finance_url=None):
+		self.transport = transport or HttpTransport()
+		if yahoo_finance_url:
+			self.yahoo_finance_url = yahoo_finance_url
+
+	def get_daily_percent_changes(self, ticker_symbols_as_list):
+
+		# when we make the request, pass along additional preferences, eg the SQL query
+		ticker_symbols_as_string = ','.join(['\"'+ts+'\"' for ts in ticker_symbols_as_list])
+		data = {'q': "select Symbol, PercentChange from yahoo.finance.quotes where symbol in (%s)" % ticker_symbols_as_string,
+		'format': 'json',
+		'diagnostics':'false',
+		'env': 'http://datatables.org/alltables.env',}
+
+		encoded_data = urllib.urlencode(data)
+		url = "%s?%s" % (self.yahoo_finance_url, encoded_data)
+
+		yahoo_response = get_with_retries(self.transport, url)
+		yahoo_json = json.loads(yahoo_response)
+
+		quote_results = yahoo_json['query']['results']['quote']
+		if isinstance(quote_results, dict):
+			# for a single symbol, YQL returns the quote itself rather than a list of one quote
+			quote_results = [quote_results]
+
+		daily_percent_change_keyed_by_ticker_symbol = {}
+
+		for quote_result in quote_results:
+
+			symbol = quote_result['Symbol']
+			daily_percent_change = quote_result['PercentChange']
 
-	encoded_data = urllib.urlencode(data)
-	url = "%s?%s" % (yahoo_finance_url, encoded_data)
+			if daily_percent_change is None:
+				print 'warning: no value found for percent change', symbol
+				continue
 
-	yahoo_response = urllib.urlopen(url).read()
-	yahoo_json = json.loads(yahoo_response)
+			# we noticed that the percent change is often reported as a string like "+14.35%"...
+			# let's get rid of the leading "+" and the trailing "%"
+			if daily_percent_change.startswith('+'):
+				# 'slice' the string (my_value[start_index:stop_index]); define the start index,
+				# and in this case, no need to specify the end index
+				daily_percent_change = daily_percent_change[1:]
 
-	daily_percent_change_keyed_by_ticker_symbol = {}
+			# get rid of the trailing "%"
+			if daily_percent_change.endswith('%'):
+				# 'slice' the string. this time, no need to define the start index, but definiely define the end index
+				daily_percent_change = daily_percent_change[:-1]
 
-	for quote_result in yahoo_json['query']['results']['quote']:
+			daily_percent_change_keyed_by_ticker_symbol[symbol] = daily_percent_change
 
-		symbol = quote_result['Symbol']  
-		daily_percent_change = quote_result['PercentChange']  
+		return daily_percent_change_keyed_by_ticker_symbol
 
-		if daily_percent_change is None:
-			print 'warning: no value found for percent change', symbol
+
+def record_intraday_performances(tickers, timestamp):
+	""" one bulk INSERT of the tickers' daily_percent_change as of timestamp, and one DELETE of the rows gone stale """
+	TickerIntradayPerformance.objects.bulk_create([TickerIntradayPerformance(ticker_id=t.id, timestamp=timestamp, percent_change=t.daily_percent_change) for t in tickers])
+	TickerIntradayPerformance.objects.filter(timestamp__lt=timestamp - datetime.timedelta(days=intraday_history_days)).delete()
+
+
+def update_daily_percent_changes(quote_provider=None, max_workers=num_fetch_workers, intraday=False):
+	"""
+	fetch quotes for all tickers, batch_size symbols per request and up to max_workers requests at a time,
+	then write every new daily_percent_change with one bulk UPDATE, and keep today's history in step.
+	returns (count of tickers updated, set of ticker symbols that errored, the date the history was recorded under;
+	None if the quotes only repeat the last trading day's)
+	"""
+	if quote_provider is None:
+		quote_provider = YahooQuoteProvider()
+
+	tickers = list(Ticker.objects.all().only('id', 'ticker_symbol', 'daily_percent_change').order_by('ticker_symbol'))
+
+	batches = [tickers[start_idx: start_idx+batch_size] for start_idx in range(0, len(tickers), batch_size)]
+	results = map_concurrently(lambda batch: quote_provider.get_daily_percent_changes([t.ticker_symbol for t in batch]), batches, max_workers)
+
+	tickers_symbols_that_errored = set()
+	tickers_to_update = []
+
+	for tickers_to_process, percent_changes_keyed_by_ticker_symbol, error in results:
+		if error is not None:
+			print "couldn't get quotes for", ', '.join([t.ticker_symbol for t in tickers_to_process]), str(error)
+			tickers_symbols_that_errored.update([t.ticker_symbol for t in tickers_to_process])
 			continue
-			
-		# we noticed that the percent change is often reported as a string like "+14.35%"...
-		# let's get rid of the leading "+" and the trailing "%"
-		if daily_percent_change.startswith('+'):
-			# 'slice' the string (my_value[start_index:stop_index]); define the start index,
-			# and in this case, no need to specify the end index
-			daily_percent_change = daily_percent_change[1:]  
-		
-		# get rid of the trailing "%" 
-		if daily_percent_change.endswith('%'):
-			# 'slice' the string. this time, no need to define the start index, but definiely define the end index
-			daily_percent_change = daily_percent_change[:-1]
 
-		print symbol, daily_percent_change
+		for ticker_to_process in tickers_to_process:
+			try:
+				daily_percent_change = percent_changes_keyed_by_ticker_symbol[ticker_to_process.ticker_symbol]
+				ticker_to_process.daily_percent_change = Ticker._meta.get_field('daily_percent_change').to_python(daily_percent_change)
+				tickers_to_update.append(ticker_to_process)
+			except Exception as e:
+				print "couldn't set daily percent change", ticker_to_process.ticker_symbol, str(e)
+				tickers_symbols_that_errored.add(ticker_to_process.ticker_symbol)
+
+	bulk_update(tickers_to_update, ['daily_percent_change'])
+	# bulk_update sends no post_save signals, so the landing page's gainer/loser wouldn't hear about the new quotes
+	invalidate_market_snapshot()
 
-		daily_percent_change_keyed_by_ticker_symbol[symbol] = daily_percent_change
+	now = timezone.now()
+	today = timezone.localtime(now).date() if settings.USE_TZ else now.date()
+	percent_change_keyed_by_ticker_id = dict([(t.id, t.daily_percent_change) for t in tickers_to_update])
+	if TickerDailyPerformance.objects.repeats_last_trading_day(percent_change_keyed_by_ticker_id, today):
+		print "every quote repeats the last trading day's change; the market's closed, so no history for", today
+		return len(tickers_to_update), tickers_symbols_that_errored, None
 
-	return daily_percent_change_keyed_by_ticker_symbol
+	record_daily_performances(percent_change_keyed_by_ticker_id, today)
+	if intraday:
+		record_intraday_performances(tickers_to_update, now)
+
+	return len(tickers_to_update), tickers_symbols_that_errored, today
 
 
 class Command(BaseCommand):
     help = 'Updates the daily_percent_change for all Ticker objects'
 
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', type='int', dest='workers', default=num_fetch_workers,
+            help='how many batches of quotes to fetch at a time (default: %d)' % num_fetch_workers),
+        make_option('--intraday', action='store_true', dest='intraday', default=False,
+            help='also keep these quotes as intraday history (for %d days)' % intraday_history_days),
+    )
+
     def handle(self, *args, **options):
 		print 'starting script'
 
@@ -70,46 +168,24 @@ class Command(BaseCommand):
 		event_log.save()
 
 		script_start_time = datetime.datetime.now()
-		tickers = Ticker.objects.all().order_by('ticker_symbol')
-
-		tickers_symbols_that_errored = set()
-		count_tickers_successfully_updated = 0
-
-		# let's process 25 tickers at a time. one implementation: use a for loop, where each loop
-		# processes tickers of index x up to index x+25
-		batch_size = 25
-		start_idx = 0
-		while start_idx < len(tickers):
-			
-			tickers_to_process = tickers[start_idx: start_idx+batch_size]
-
-			symbols_as_list = ['\"'+t.ticker_symbol+'\"' for t in tickers_to_process]
-			percent_changes_keyed_by_ticker_symbol = get_daily_percent_change(symbols_as_list)
-			
-			for ticker_to_process in tickers_to_process:
-				try:
-					ticker_to_process.daily_percent_change = percent_changes_keyed_by_ticker_symbol[ticker_to_process.ticker_symbol]
-					ticker_to_process.save()
-					count_tickers_successfully_updated += 1
-				except Exception as e:
-					print "couldn't set daily percent change", ticker_to_process.ticker_symbol, str(e)
-					tickers_symbols_that_errored.add(ticker_to_process.ticker_symbol)
-
-			start_idx += batch_size
+
+		count_tickers_successfully_updated, tickers_symbols_that_errored, history_date = update_daily_percent_changes(max_workers=options['workers'], intraday=options['intraday'])
 
 		script_end_time = datetime.datetime.now()
 		total_seconds = (script_end_time - script_start_time).total_seconds()
 
 		print 'time elapsed: %d seconds' %  total_seconds
 		notes = 'tickers updated: %d; ' % count_tickers_successfully_updated
+		if history_date is None and count_tickers_successfully_updated:
+			notes += 'market closed, no history; '
 		if tickers_symbols_that_errored:
-			notes += 'errors: ' + ', '.join(tickers_symbols_that_errored)
+			notes += 'errors: ' + ', '.join(sorted(tickers_symbols_that_errored))
 		else:
 			notes += 'no errors'
-		event_log.notes = notes			
+		event_log.notes = notes
 		event_log.save()
 
 		print 'finished script'
 
 		print 'tickers that errored: %d' % len(tickers_symbols_that_errored)
-		print ', '.join(tickers_symbols_that_errored)
\ No newline at end of file
+		print ', '.join(tickers_symbols_that_errored)
@@ -1,39 +1,111 @@
 '''
-update the 'earnings_announcement' field on all Ticker objects,
+update the 'earnings_announcement' field on Ticker objects,
 using expected earnings report dates retrieved from Quandl
+
+a ticker whose stored date is still more than skip_if_days_away days off is left alone; its date isn't about to
+move, and skipping it saves a request. the rest are fetched a few at a time, no faster than the provider's rate
+limit, and only the tickers whose date actually changed are written, with one bulk UPDATE.
 '''
-import urllib
 import json
 import datetime
+from optparse import make_option
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from satellite.db_utils import bulk_update
+from satellite.http_utils import HttpTransport, RateLimitedTransport, get_with_retries, map_concurrently
 from satellite.models import Ticker, DataHarvestEventLog, DATA_HARVEST_TYPE_EARNINGS_DATES
 
+num_fetch_workers = 4
+max_requests_per_second = 5
+skip_if_days_away = 30
+
 
-def get_earnings_announcement_date(ticker_symbol):
-	""" 
-	get the 'EXP_RPT_DATE_QR1' (expected report date for 1st quarter?)
+class QuandlEarningsDateProvider(object):
+	"""
+	gets the 'EXP_RPT_DATE_QR1' (expected report date for 1st quarter?)
 	from Quandl, which pulls from Zachs Research
+
+	an earnings date provider is anything with a get_earnings_announcement_date(ticker_symbol) method that returns a
+	date; eg this class pointed (with quandl_url) at a local server that answers from fixtures.
 	"""
 
 	# sample url: http://www.quandl.com/api/v1/datasets/ZEA/AOL.json?column=4&auth_token=[quandl_auth_token]
-	earnings_announcement_url = 'https://www.quandl.com/api/v1/datasets/ZEA/%s.json?column=4&auth_token=%s' % (ticker_symbol, settings.QUANDL_AUTH_TOKEN)
+	quandl_url = 'https://www.quandl.com/api/v1/datasets/ZEA'
+
+	def __init__(self, transport=None, quandl_url=None, auth_token=None):
+		self.transport = transport or RateLimitedTransport(HttpTransport(), max_requests_per_second)
+		if quandl_url:
+			self.quandl_url = quandl_url.rstrip('/')
+		self.auth_token = auth_token or settings.QUANDL_AUTH_TOKEN
 
-	earnings_response = urllib.urlopen(earnings_announcement_url).read()
-	earnings_json = json.loads(earnings_response)
+	def get_earnings_announcement_date(self, ticker_symbol):
+		earnings_announcement_url = '%s/%s.json?column=4&auth_token=%s' % (self.quandl_url, ticker_symbol, self.auth_token)
 
-	# in the json that Quandl returns to us, the value representing the earnings date doesn't look like a typical date string. 
-	# here's an example of what it looks like in the Quandl json: 20150427.0
-	# these next two lines, we extract the value from the json and convert it into a conventional datetime type
-	expected_report_date_quarter1 = str(int(earnings_json['data'][0][1]))
-	earnings_announcement_date = datetime.datetime.strptime(expected_report_date_quarter1, '%Y%m%d')
+		earnings_response = get_with_retries(self.transport, earnings_announcement_url)
+		earnings_json = json.loads(earnings_response)
 
-	return earnings_announcement_date
+		# in the json that Quandl returns to us, the value representing the earnings date doesn't look like a typical date string.
+		# here's an example of what it looks like in the Quandl json: 20150427.0
+		# these next two lines, we extract the value from the json and convert it into a conventional date type
+		expected_report_date_quarter1 = str(int(earnings_json['data'][0][1]))
+		return datetime.datetime.strptime(expected_report_date_quarter1, '%Y%m%d').date()
+
+
+def get_tickers_to_refresh(include_all=False, today=None):
+	"""
+	the tickers whose earnings date may have moved: no date yet, a date that's passed, or one that's coming up within
+	skip_if_days_away days. with include_all, every ticker.
+	"""
+	tickers = Ticker.objects.all().only('id', 'ticker_symbol', 'earnings_announcement').order_by('ticker_symbol')
+	if include_all:
+		return tickers
+	today = today or datetime.date.today()
+	return tickers.exclude(earnings_announcement__gt=today + datetime.timedelta(days=skip_if_days_away))
+
+
+def update_earnings_announcement_dates(provider=None, include_all=False, max_workers=num_fetch_workers):
+	"""
+	fetch the earnings date of each ticker that may have moved, up to max_workers requests at a time, then write the
+	dates that changed with one bulk UPDATE.
+	returns (count of tickers checked, count of tickers updated, set of ticker symbols that errored)
+	"""
+	if provider is None:
+		provider = QuandlEarningsDateProvider()
+
+	tickers = list(get_tickers_to_refresh(include_all=include_all))
+	results = map_concurrently(lambda ticker: provider.get_earnings_announcement_date(ticker.ticker_symbol), tickers, max_workers)
+
+	tickers_symbols_that_errored = set()
+	tickers_to_update = []
+
+	for ticker, earnings_announcement_date, error in results:
+		if error is not None:
+			print "couldn't set earnings date", ticker.ticker_symbol, str(error)
+			tickers_symbols_that_errored.add(ticker.ticker_symbol)
+			continue
+
+		if earnings_announcement_date != ticker.earnings_announcement:
+			print ticker.ticker_symbol, ticker.earnings_announcement, '->', earnings_announcement_date
+			ticker.earnings_announcement = earnings_announcement_date
+			tickers_to_update.append(ticker)
+
+	bulk_update(tickers_to_update, ['earnings_announcement'])
+
+	return len(tickers), len(tickers_to_update), tickers_symbols_that_errored
 
 
 class Command(BaseCommand):
-    help = 'Updates the earnings_announcement for all Ticker objects'
+    help = 'Updates the earnings_announcement for the Ticker objects whose date may have moved'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--all', action='store_true', dest='all', default=False,
+            help="check every ticker, including the ones whose date is more than %d days off" % skip_if_days_away),
+        make_option('--workers', type='int', dest='workers', default=num_fetch_workers,
+            help='how many requests to have in flight at a time (default: %d)' % num_fetch_workers),
+        make_option('--quandl-url', dest='quandl_url', default=None,
+            help='ask this server instead of Quandl, eg a local one that answers from fixtures'),
+    )
 
     def handle(self, *args, **options):
 		print 'starting script'
@@ -45,33 +117,25 @@ class Command(BaseCommand):
 
 		script_start_time = datetime.datetime.now()
 
-		tickers_symbols_that_errored = set()
-		tickers = Ticker.objects.all().order_by('ticker_symbol')
-		for ticker in tickers:
-			ticker_symbol = ticker.ticker_symbol
-			try:
-				earnings_announcement_date = get_earnings_announcement_date(ticker_symbol)
-				print ticker_symbol, earnings_announcement_date
-				ticker.earnings_announcement = earnings_announcement_date
-				ticker.save()
-			except Exception as e:
-				print "couldn't set earnings date", ticker_symbol, str(e)
-				tickers_symbols_that_errored.add(ticker_symbol)
+		provider = QuandlEarningsDateProvider(quandl_url=options['quandl_url'])
+		count_tickers_checked, count_tickers_updated, tickers_symbols_that_errored = update_earnings_announcement_dates(
+			provider=provider, include_all=options['all'], max_workers=options['workers'])
 
 		script_end_time = datetime.datetime.now()
 		total_seconds = (script_end_time - script_start_time).total_seconds()
 
 		print 'time elapsed: %d seconds' %  total_seconds
 
-
+		notes = 'tickers checked: %d; updated: %d; ' % (count_tickers_checked, count_tickers_updated)
 		if tickers_symbols_that_errored:
-			event_log.notes = 'errors: ' + ', '.join(tickers_symbols_that_errored)
+			notes += 'errors: ' + ', '.join(sorted(tickers_symbols_that_errored))
 		else:
-			event_log.notes = 'no errors'
+			notes += 'no errors'
+		event_log.notes = notes
 		event_log.save()
 
 
 		print 'finished script'
 
 		print 'tickers that errored: %d' % len(tickers_symbols_that_errored)
-		print ', '.join(tickers_symbols_that_errored)		
\ No newline at end of file
+		print ', '.join(tickers_symbols_that_errored)
@@ -1,48 +1,201 @@
 '''
-update the 'daily_percent_change' field on all Ticker objects
+update the 'num_followers' field on all Ticker objects
+
+the counts come from the leads API, several requests at a time over keep-alive connections; once they're all
+back, the counts that changed are written with one bulk UPDATE of num_followers.
+
+by default we ask for one ticker per request, the only response format we know. with --batch-size we ask for
+several tickers per request instead; the leads endpoint takes a list of tickers, but we haven't seen what it
+answers for more than one, so a batch only counts when the response says which count belongs to which ticker.
+the tickers a batch doesn't account for are asked for one at a time, as usual.
 '''
-import urllib2
-import datetime
+import urllib
 import json
+import datetime
+from optparse import make_option
 
 from django.core.management.base import BaseCommand, CommandError
-from satellite.models import Ticker
+from satellite.db_utils import bulk_update
+from satellite.http_utils import HttpTransport, get_with_retries, map_concurrently
+from satellite.models import Ticker, DataHarvestEventLog, DATA_HARVEST_TYPE_FOLLOWERS
+
+num_fetch_workers = 8
+fool_one_service_id = 1255
+lookie='Lookie=C6203A9167ABA57562DD83D6AEA13BCC1EDC892BE430D6915FA389C5437EDE6F4E8F70E752E1838A1C6343E400F5D8C230FB1395D04410E2049CA550A09989D258D66CC6C03D2201454FC58D4909FC982C45F62419E9EAFD323772179CB7C85F59970D042D2EB71BFD9F168B626BAA4A732E3E53A322D3CC4783BA8B56C6663A39BC100F'
+followers_key = 'SubscribersFollowingTicker'
+
+
+def _is_count(value):
+	return isinstance(value, (int, long)) and not isinstance(value, bool)
+
+
+def parse_num_followers(json_response, ticker_symbols):
+	"""
+	make sense of a leads response for the given ticker symbols. returns a dictionary, keys = ticker symbol, values =
+	number of Fool One followers; tickers the response doesn't clearly account for are left out.
+
+	for one ticker the response is {"SubscribersFollowingTicker": 123}. for several, we only trust the shapes that
+	can't be misread: counts keyed by ticker symbol (at the top level or under "SubscribersFollowingTicker"), or a list
+	of objects that each carry a ticker symbol and a count. a single number for several tickers might be their total,
+	so it's no good to us.
+	"""
+	if isinstance(json_response, dict) and _is_count(json_response.get(followers_key)):
+		if len(ticker_symbols) == 1:
+			return {ticker_symbols[0]: json_response[followers_key]}
+		return {}
+
+	if isinstance(json_response, dict) and isinstance(json_response.get(followers_key), (dict, list)):
+		json_response = json_response[followers_key]
+
+	ticker_symbols = set(ticker_symbols)
+	num_followers_keyed_by_ticker_symbol = {}
+
+	if isinstance(json_response, dict):
+		for ticker_symbol, num_followers in json_response.items():
+			if ticker_symbol.upper() in ticker_symbols and _is_count(num_followers):
+				num_followers_keyed_by_ticker_symbol[ticker_symbol.upper()] = num_followers
+
+	elif isinstance(json_response, list):
+		for item in json_response:
+			if not isinstance(item, dict) or not _is_count(item.get(followers_key)):
+				continue
+			for symbol_key in ('Ticker', 'TickerSymbol', 'Symbol'):
+				ticker_symbol = item.get(symbol_key)
+				if isinstance(ticker_symbol, basestring) and ticker_symbol.upper() in ticker_symbols:
+					num_followers_keyed_by_ticker_symbol[ticker_symbol.upper()] = item[followers_key]
+					break
+
+	return num_followers_keyed_by_ticker_symbol
+
+
+class LeadsFollowerCountProvider(object):
+	"""
+	gets the number of Fool One members following each ticker in a personal scorecard, from the leads API.
+
+	a follower count provider is anything with a get_num_followers(ticker_symbols) method that returns a dictionary,
+	keys = ticker symbol, values = number of followers (leaving out the tickers it has no count for); eg this class
+	pointed (with leads_url) at a local server that answers from fixtures.
+	"""
+
+	leads_url = 'http://apiary.fool.com/leads/.json'
 
+	def __init__(self, transport=None, leads_url=None):
+		self.transport = transport or HttpTransport(default_headers={'Cookie': lookie})
+		if leads_url:
+			self.leads_url = leads_url
 
-def get_number_fool_one_followers(ticker_symbol):
-	url='http://apiary.fool.com/leads/.json?serviceIds=1255&tickers=%s' % (ticker_symbol)
-	lookie='Lookie=C6203A9167ABA57562DD83D6AEA13BCC1EDC892BE430D6915FA389C5437EDE6F4E8F70E752E1838A1C6343E400F5D8C230FB1395D04410E2049CA550A09989D258D66CC6C03D2201454FC58D4909FC982C45F62419E9EAFD323772179CB7C85F59970D042D2EB71BFD9F168B626BAA4A732E3E53A322D3CC4783BA8B56C6663A39BC100F'
+	def get_num_followers(self, ticker_symbols):
+		url = '%s?serviceIds=%d&tickers=%s' % (self.leads_url, fool_one_service_id, ','.join([urllib.quote(ts) for ts in ticker_symbols]))
+		response = get_with_retries(self.transport, url)
+		return parse_num_followers(json.loads(response), ticker_symbols)
 
-	opener = urllib2.build_opener()
-	opener.addheaders.append(('Cookie', lookie.strip()))
 
-	response = opener.open(url, timeout=10).read()
-	json_response = json.loads(response)
-	num_followers = json_response['SubscribersFollowingTicker']
-	return num_followers
+def get_num_followers_keyed_by_ticker_symbol(ticker_symbols, provider, batch_size=1, max_workers=num_fetch_workers):
+	"""
+	returns (dictionary of follower counts keyed by ticker symbol, count of tickers that came from batches,
+	set of ticker symbols that errored)
+	"""
+	num_followers_keyed_by_ticker_symbol = {}
+
+	if batch_size > 1:
+		batches = [ticker_symbols[start_idx:start_idx+batch_size] for start_idx in range(0, len(ticker_symbols), batch_size)]
+		for batch, num_followers_for_batch, error in map_concurrently(provider.get_num_followers, batches, max_workers):
+			if error is not None:
+				print "couldn't get followers for batch", ', '.join(batch), str(error)
+				continue
+			for ticker_symbol in batch:
+				if ticker_symbol in num_followers_for_batch:
+					num_followers_keyed_by_ticker_symbol[ticker_symbol] = num_followers_for_batch[ticker_symbol]
+
+		if not num_followers_keyed_by_ticker_symbol:
+			print 'warning: no batch response said which count goes with which ticker; asking one ticker at a time'
+
+	count_from_batches = len(num_followers_keyed_by_ticker_symbol)
+
+	def get_num_followers_for_ticker(ticker_symbol):
+		num_followers_for_ticker = provider.get_num_followers([ticker_symbol])
+		if ticker_symbol not in num_followers_for_ticker:
+			raise ValueError('no count of followers in the response')
+		return num_followers_for_ticker[ticker_symbol]
+
+	tickers_symbols_that_errored = set()
+	remaining_ticker_symbols = [ts for ts in ticker_symbols if ts not in num_followers_keyed_by_ticker_symbol]
+	for ticker_symbol, num_followers, error in map_concurrently(get_num_followers_for_ticker, remaining_ticker_symbols, max_workers):
+		if error is not None:
+			print "couldn't get number of followers", ticker_symbol, str(error)
+			tickers_symbols_that_errored.add(ticker_symbol)
+			continue
+		num_followers_keyed_by_ticker_symbol[ticker_symbol] = num_followers
+
+	return num_followers_keyed_by_ticker_symbol, count_from_batches, tickers_symbols_that_errored
+
+
+def update_num_followers(provider=None, batch_size=1, max_workers=num_fetch_workers):
+	"""
+	fetch the follower counts of all tickers, then write the ones that changed with one bulk UPDATE.
+	returns (count of tickers with a count, count of those that came from batches, count of tickers updated,
+	set of ticker symbols that errored)
+	"""
+	if provider is None:
+		provider = LeadsFollowerCountProvider()
+
+	tickers = list(Ticker.objects.all().only('id', 'ticker_symbol', 'num_followers').order_by('ticker_symbol'))
+
+	num_followers_keyed_by_ticker_symbol, count_from_batches, tickers_symbols_that_errored = get_num_followers_keyed_by_ticker_symbol(
+		[t.ticker_symbol for t in tickers], provider, batch_size=batch_size, max_workers=max_workers)
+
+	tickers_to_update = []
+	for ticker in tickers:
+		num_followers = num_followers_keyed_by_ticker_symbol.get(ticker.ticker_symbol)
+		if num_followers is not None and num_followers != ticker.num_followers:
+			ticker.num_followers = num_followers
+			tickers_to_update.append(ticker)
+
+	bulk_update(tickers_to_update, ['num_followers'])
+
+	return len(num_followers_keyed_by_ticker_symbol), count_from_batches, len(tickers_to_update), tickers_symbols_that_errored
 
 
 class Command(BaseCommand):
     help = 'Updates the num_followers for all Ticker objects. assigns the number of Fool One members following that ticker symbol in a personal scorecard.'
 
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', type='int', dest='workers', default=num_fetch_workers,
+            help='how many requests to have in flight at a time (default: %d)' % num_fetch_workers),
+        make_option('--batch-size', type='int', dest='batch_size', default=1,
+            help='ask for this many tickers per request (default: 1). tickers a batch response does not account for are asked for one at a time'),
+        make_option('--leads-url', dest='leads_url', default=None,
+            help='ask this server instead of the leads API, eg a local one that answers from fixtures'),
+    )
+
     def handle(self, *args, **options):
 		print 'starting script'
 
+		event_log = DataHarvestEventLog()
+		event_log.data_type = DATA_HARVEST_TYPE_FOLLOWERS
+		event_log.notes = 'running'
+		event_log.save()
+
 		script_start_time = datetime.datetime.now()
-		tickers = Ticker.objects.all().order_by('ticker_symbol')
-		for ticker in tickers:
-			ticker_symbol = ticker.ticker_symbol
-
-			try:
-				num_followers = get_number_fool_one_followers(ticker_symbol)
-				print ticker, num_followers
-				ticker.num_followers = num_followers
-				ticker.save()
-			except Exception as e:
-				print "couldn't set number of followers", str(e)
+
+		provider = LeadsFollowerCountProvider(leads_url=options['leads_url'])
+		count_tickers_with_counts, count_from_batches, count_tickers_updated, tickers_symbols_that_errored = update_num_followers(
+			provider=provider, batch_size=options['batch_size'], max_workers=options['workers'])
 
 		script_end_time = datetime.datetime.now()
 		total_seconds = (script_end_time - script_start_time).total_seconds()
 
 		print 'time elapsed: %d seconds' %  total_seconds
-		print 'finished script'
\ No newline at end of file
+
+		notes = 'tickers counted: %d (from batches: %d); updated: %d; ' % (count_tickers_with_counts, count_from_batches, count_tickers_updated)
+		if tickers_symbols_that_errored:
+			notes += 'errors: ' + ', '.join(sorted(tickers_symbols_that_errored))
+		else:
+			notes += 'no errors'
+		event_log.notes = notes
+		event_log.save()
+
+		print 'finished script'
+
+		print 'tickers that errored: %d' % len(tickers_symbols_that_errored)
+		print ', '.join(tickers_symbols_that_errored)
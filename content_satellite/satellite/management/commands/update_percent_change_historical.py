@@ -0,0 +1,62 @@
+'''
+refresh the 'percent_change_historical' field ('50D%Change') on all Ticker objects: each ticker's change over the
+last 50 trading days, compounded from its TickerDailyPerformance history. only the tickers whose value changed are
+written, with one bulk UPDATE.
+
+it runs once a day, after the close, rather than as part of the 9:25 AM reset, which has to stay one quick UPDATE.
+'''
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from satellite.db_utils import bulk_update
+from satellite.models import Ticker, TickerDailyPerformance, DataHarvestEventLog, DATA_HARVEST_TYPE_MARKET_DATA
+
+# what Ticker.percent_change_historical ('50D%Change') covers
+historical_num_days = 50
+
+
+def update_percent_change_historical(num_days=historical_num_days):
+	"""
+	set each ticker's percent_change_historical to its change over the last num_days trading days, and write the ones
+	that changed with one bulk UPDATE. tickers without any history are left alone. returns the number of tickers updated
+	"""
+	returns_keyed_by_ticker_id = TickerDailyPerformance.objects.get_returns(num_days)
+
+	tickers_to_update = []
+	for ticker in Ticker.objects.filter(id__in=returns_keyed_by_ticker_id.keys()).only('id', 'percent_change_historical'):
+		if ticker.percent_change_historical != returns_keyed_by_ticker_id[ticker.id]:
+			ticker.percent_change_historical = returns_keyed_by_ticker_id[ticker.id]
+			tickers_to_update.append(ticker)
+
+	return bulk_update(tickers_to_update, ['percent_change_historical'])
+
+
+class Command(BaseCommand):
+    help = 'Updates the percent_change_historical (%d-day change) for all Ticker objects with a performance history' % historical_num_days
+
+    def handle(self, *args, **options):
+		print 'starting script'
+
+		event_log = DataHarvestEventLog()
+		event_log.data_type = DATA_HARVEST_TYPE_MARKET_DATA
+		event_log.notes = 'running'
+		event_log.save()
+
+		script_start_time = datetime.datetime.now()
+
+		try:
+			count_updated = update_percent_change_historical()
+			notes = '%d-day changes updated: %d; no errors' % (historical_num_days, count_updated)
+		except Exception as e:
+			print "couldn't update the %d-day changes" % historical_num_days, str(e)
+			notes = '%d-day changes updated: 0; errors: %s' % (historical_num_days, str(e))
+
+		script_end_time = datetime.datetime.now()
+		total_seconds = (script_end_time - script_start_time).total_seconds()
+
+		print 'time elapsed: %d seconds' %  total_seconds
+		print notes
+		event_log.notes = notes
+		event_log.save()
+
+		print 'finished script'
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def populate_covering_services(apps, schema_editor):
+    # seed the ticker/service membership table from the current ServiceTake records
+    Ticker = apps.get_model('satellite', 'Ticker')
+    ServiceTake = apps.get_model('satellite', 'ServiceTake')
+    Membership = Ticker.covering_services.through
+
+    ticker_and_service_ids = ServiceTake.objects.order_by().values_list('ticker_id', 'scorecard__service_id').distinct()
+    Membership.objects.bulk_create([Membership(ticker_id=ticker_id, service_id=service_id) for ticker_id, service_id in ticker_and_service_ids])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satellite', '0031_auto_20150730_1316'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticker',
+            name='covering_services',
+            field=models.ManyToManyField(related_name='covered_tickers', verbose_name=b'services covering ticker', to='satellite.Service', blank=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(populate_covering_services, reverse_code=lambda apps, schema_editor: None),
+    ]
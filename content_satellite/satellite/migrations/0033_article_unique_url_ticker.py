@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.db.models import Count, Min
+
+
+def delete_duplicate_articles(apps, schema_editor):
+    # before the unique constraint goes on, keep only the oldest Article (lowest id) per url/ticker combo
+    Article = apps.get_model('satellite', 'Article')
+
+    duplicated_pairs = Article.objects.order_by().values('url', 'ticker_id') \
+        .annotate(num_articles=Count('id'), id_to_keep=Min('id')).filter(num_articles__gt=1)
+
+    for pair in duplicated_pairs:
+        Article.objects.filter(url=pair['url'], ticker_id=pair['ticker_id']).exclude(id=pair['id_to_keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satellite', '0032_ticker_covering_services'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_articles, reverse_code=lambda apps, schema_editor: None),
+        migrations.AlterUniqueTogether(
+            name='article',
+            unique_together=set([('url', 'ticker')]),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satellite', '0033_article_unique_url_ticker'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='article_retention_days',
+            field=models.IntegerField(help_text=b'purge_old_articles deletes older articles of this service. leave blank for the default (100 days)', null=True, verbose_name=b'days to keep articles', blank=True),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='date_pub',
+            field=models.DateTimeField(db_index=True, null=True, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='dataharvesteventlog',
+            name='data_type',
+            field=models.IntegerField(default=1, choices=[(1, b'articles'), (2, b'market performance'), (3, b'earnings dates'), (4, b'scorecard recs'), (5, b'bylines meta data'), (6, b'article purge')]),
+            preserve_default=True,
+        ),
+    ]
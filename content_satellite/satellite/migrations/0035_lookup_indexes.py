@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.db.models import Count, Min
+
+
+def delete_duplicate_bylines(apps, schema_editor):
+    # before the unique constraint goes on, keep only the oldest BylineMetaData (lowest id) per byline.
+    # update_byline_meta_data rewrites every match with the same values, so the copies are interchangeable
+    BylineMetaData = apps.get_model('satellite', 'BylineMetaData')
+
+    duplicated_bylines = BylineMetaData.objects.order_by().values('byline') \
+        .annotate(num_rows=Count('id'), id_to_keep=Min('id')).filter(num_rows__gt=1)
+
+    for b in duplicated_bylines:
+        BylineMetaData.objects.filter(byline=b['byline']).exclude(id=b['id_to_keep']).delete()
+
+
+def check_ticker_symbols_are_unique(apps, schema_editor):
+    # duplicate tickers can't be merged automatically (too many things point at a Ticker), so stop and say which
+    Ticker = apps.get_model('satellite', 'Ticker')
+
+    duplicated_symbols = Ticker.objects.order_by().values('ticker_symbol') \
+        .annotate(num_rows=Count('id')).filter(num_rows__gt=1).values_list('ticker_symbol', flat=True)
+    if duplicated_symbols:
+        raise ValueError('merge or delete the duplicate tickers before migrating: %s' % ', '.join(duplicated_symbols))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satellite', '0034_article_retention'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_bylines, reverse_code=lambda apps, schema_editor: None),
+        migrations.RunPython(check_ticker_symbols_are_unique, reverse_code=lambda apps, schema_editor: None),
+        migrations.AlterField(
+            model_name='article',
+            name='author',
+            field=models.CharField(max_length=50, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='bylinemetadata',
+            name='byline',
+            field=models.CharField(unique=True, max_length=50),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='ticker',
+            name='instrument_id',
+            field=models.IntegerField(default=0, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='ticker',
+            name='ticker_symbol',
+            field=models.CharField(unique=True, max_length=5, verbose_name=b'symbol'),
+            preserve_default=True,
+        ),
+        migrations.AlterIndexTogether(
+            name='coveragetype',
+            index_together=set([('ticker', 'coverage_type', 'service')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='dataharvesteventlog',
+            index_together=set([('data_type', 'date_started')]),
+        ),
+    ]
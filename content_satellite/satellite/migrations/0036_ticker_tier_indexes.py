@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satellite', '0035_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ticker',
+            name='tier',
+            field=models.IntegerField(default=0, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='ticker',
+            name='tier_status',
+            field=models.CharField(db_index=True, max_length=50, null=True, verbose_name=b'tier status', blank=True),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satellite', '0036_ticker_tier_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ticker',
+            name='daily_percent_change',
+            field=models.DecimalField(default=0, verbose_name=b'Daily % change', max_digits=11, decimal_places=2, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='ticker',
+            name='earnings_announcement',
+            field=models.DateField(db_index=True, null=True, verbose_name=b'next earnings date', blank=True),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satellite', '0037_ticker_quote_and_earnings_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dataharvesteventlog',
+            name='data_type',
+            field=models.IntegerField(default=1, choices=[(1, b'articles'), (2, b'market performance'), (3, b'earnings dates'), (4, b'scorecard recs'), (5, b'bylines meta data'), (6, b'article purge'), (7, b'One followers')]),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satellite', '0038_followers_harvest_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TickerDailyPerformance',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('date', models.DateField()),
+                ('percent_change', models.DecimalField(verbose_name=b'% change', max_digits=11, decimal_places=2)),
+                ('ticker', models.ForeignKey(to='satellite.Ticker')),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='tickerdailyperformance',
+            unique_together=set([('ticker', 'date')]),
+        ),
+    ]
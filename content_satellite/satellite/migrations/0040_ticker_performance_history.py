@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satellite', '0039_ticker_daily_performance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TickerIntradayPerformance',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('timestamp', models.DateTimeField(db_index=True)),
+                ('percent_change', models.DecimalField(verbose_name=b'% change', max_digits=11, decimal_places=2)),
+                ('ticker', models.ForeignKey(to='satellite.Ticker')),
+            ],
+            options={
+                'ordering': ['-timestamp'],
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='tickerintradayperformance',
+            index_together=set([('ticker', 'timestamp')]),
+        ),
+        migrations.AlterField(
+            model_name='tickerdailyperformance',
+            name='date',
+            field=models.DateField(db_index=True),
+            preserve_default=True,
+        ),
+    ]
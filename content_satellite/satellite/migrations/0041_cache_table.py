@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management import call_command
+from django.db import models, migrations
+
+
+def create_cache_table(apps, schema_editor):
+    # the table for the database cache in settings.CACHES, which cache_utils keeps its shared values in.
+    # does nothing if the table is already there, or if the cache isn't a database cache
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satellite', '0040_ticker_performance_history'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, reverse_code=lambda apps, schema_editor: None),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satellite', '0041_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataharvesteventlog',
+            name='succeeded',
+            field=models.NullBooleanField(),
+            preserve_default=True,
+        ),
+    ]
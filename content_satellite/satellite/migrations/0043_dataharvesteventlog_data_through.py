@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satellite', '0042_dataharvesteventlog_succeeded'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataharvesteventlog',
+            name='data_through',
+            field=models.DateTimeField(null=True, blank=True),
+            preserve_default=True,
+        ),
+    ]
@@ -1,22 +1,54 @@
-from django.db import models
+from collections import OrderedDict
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from satellite.cache_utils import invalidate_ticker_symbols, invalidate_single_authors, invalidate_market_snapshot
+from satellite.db_utils import bulk_update, bulk_create_ignoring_duplicates
+
+
+class TickerQuerySet(models.QuerySet):
+
+	def in_services(self, services):
+		"""
+		tickers covered by at least one of the given services (Service objects or their db ids).
+		this is one join against the indexed ticker/service membership table; no substring matching on services_for_ticker
+		"""
+		return self.filter(covering_services__in=services).distinct()
+
+	def in_any_service(self):
+		""" tickers covered by at least one service """
+		return self.filter(covering_services__isnull=False).distinct()
+
+	def with_coverage_summary(self):
+		"""
+		fetch each ticker's service takes, with their scorecards and services, in one more query for the whole
+		queryset, so that scorecards() and services() don't query per ticker (eg on a page listing many tickers).
+		each ticker gets them as a list, in prefetched_service_takes
+		"""
+		return self.prefetch_related(models.Prefetch('servicetake_set', queryset=ServiceTake.objects.select_related('scorecard__service'),
+			to_attr='prefetched_service_takes'))
 
 
 class Ticker(models.Model):
 	
-	ticker_symbol = models.CharField(max_length=5, verbose_name='symbol')
+	ticker_symbol = models.CharField(max_length=5, unique=True, verbose_name='symbol')
 	exchange_symbol = models.CharField(max_length=10, verbose_name='exchange')
-	instrument_id = models.IntegerField(default=0)
+	instrument_id = models.IntegerField(default=0, db_index=True)
 	num_followers = models.IntegerField(default=0, verbose_name='One followers')
-	earnings_announcement = models.DateField(null=True, blank=True, verbose_name='next earnings date')
-	daily_percent_change = models.DecimalField(max_digits=11, default=0, decimal_places=2, verbose_name='Daily % change')
+	earnings_announcement = models.DateField(null=True, blank=True, db_index=True, verbose_name='next earnings date')
+	daily_percent_change = models.DecimalField(max_digits=11, default=0, decimal_places=2, db_index=True, verbose_name='Daily % change')
 	percent_change_historical = models.DecimalField(max_digits=11, decimal_places=3, verbose_name='50D%Change')
 	company_name = models.CharField(max_length=120, null=True, blank=True, verbose_name='name')
 	notes = models.TextField(max_length=5000, null=True, blank=True, verbose_name='Notes')
 	scorecards_for_ticker = models.CharField(max_length=200, null=True, blank=True, verbose_name='scorecards for ticker')
 	services_for_ticker = models.CharField(max_length=200, null=True, blank=True, verbose_name='services for ticker')	
-	tier = models.IntegerField(default=0)
-	tier_status = models.CharField(max_length=50, null=True, blank=True, verbose_name='tier status')
+	tier = models.IntegerField(default=0, db_index=True)
+	tier_status = models.CharField(max_length=50, null=True, blank=True, db_index=True, verbose_name='tier status')
 	analysts_for_ticker = models.CharField(max_length=500, null=True, blank=True, verbose_name='analysts for ticker')
+	covering_services = models.ManyToManyField('Service', blank=True, related_name='covered_tickers', verbose_name='services covering ticker')
+
+	objects = TickerQuerySet.as_manager()
 
 	def __unicode__(self):
 		return self.ticker_symbol
@@ -26,20 +58,26 @@ class Ticker(models.Model):
 		ordering = ['ticker_symbol']
 
 
+	def _get_service_takes(self):
+		# already in memory if this ticker came from Ticker.objects.with_coverage_summary(); otherwise one joined query
+		if hasattr(self, 'prefetched_service_takes'):
+			return self.prefetched_service_takes
+		return self.servicetake_set.select_related('scorecard__service')
+
 	def scorecards(self):
 		""" which scorecards have this ticker? """
 
-		service_takes_on_this_ticker = ServiceTake.objects.filter(ticker=self)
+		service_takes_on_this_ticker = self._get_service_takes()
 
 		scorecards_represented = set()
 		for service_take in service_takes_on_this_ticker:
 			scorecards_represented.add(service_take.scorecard.pretty_name)
-		return ", ".join(scorecards_represented)
+		return ", ".join(sorted(scorecards_represented))
 
 	def services(self):
 		"""how many services have this ticker?"""
 
-		service_takes_on_this_ticker = ServiceTake.objects.filter(ticker=self)
+		service_takes_on_this_ticker = self._get_service_takes()
 
 		services_represented = set()
 		for service_take in service_takes_on_this_ticker:
@@ -52,6 +90,8 @@ class Ticker(models.Model):
 class Service(models.Model):
 	name = models.CharField(max_length=50)
 	pretty_name = models.CharField(max_length=30)
+	article_retention_days = models.IntegerField(null=True, blank=True, verbose_name='days to keep articles',
+		help_text='purge_old_articles deletes older articles of this service. leave blank for the default (100 days)')
 
 	def __unicode__(self):
 		return self.pretty_name
@@ -87,10 +127,146 @@ class ServiceTake(models.Model):
 		ordering = ['scorecard'] 
 
 
+@receiver([post_save, post_delete], sender=Ticker)
+def forget_cached_ticker_symbols(sender, **kwargs):
+	invalidate_ticker_symbols()
+
+
+def rebuild_service_memberships():
+	"""
+	recompute the ticker/service membership table (Ticker.covering_services) from the ServiceTake records:
+	one read, one delete, and one bulk insert, all in a single transaction
+	"""
+	Membership = Ticker.covering_services.through
+
+	ticker_and_service_ids = ServiceTake.objects.order_by().values_list('ticker_id', 'scorecard__service_id').distinct()
+	memberships = [Membership(ticker_id=ticker_id, service_id=service_id) for ticker_id, service_id in ticker_and_service_ids]
+
+	with transaction.atomic():
+		Membership.objects.all().delete()
+		Membership.objects.bulk_create(memberships)
+
+	return len(memberships)
+
+
+class TickerDailyPerformanceQuerySet(models.QuerySet):
+
+	def for_last_trading_days(self, num_days):
+		"""
+		the rows of the num_days most recent dates in this queryset. there are no rows for days the market was closed,
+		so those are trading days
+		"""
+		dates = list(self.order_by('-date').values_list('date', flat=True).distinct()[:num_days])
+		if not dates:
+			return self.none()
+		return self.filter(date__gte=dates[-1])
+
+	def repeats_last_trading_day(self, percent_change_keyed_by_ticker_id, date):
+		"""
+		whether the given percent changes are the ones already recorded for the last trading day before date, for every
+		ticker that has a row on that day. that's what the quote provider hands back while the market is closed (eg a
+		holiday, or before it has any quotes for the day), so they're no news about date
+		"""
+		rows = self.filter(date__lt=date).for_last_trading_days(1).order_by().values_list('ticker_id', 'percent_change')
+		repeats = [percent_change_keyed_by_ticker_id[ticker_id] == percent_change for ticker_id, percent_change in rows
+			if ticker_id in percent_change_keyed_by_ticker_id]
+		return bool(repeats) and all(repeats)
+
+	def get_returns(self, num_days):
+		"""
+		each ticker's percent change over the num_days most recent trading days, compounded day by day.
+		returns a dictionary, keys = ticker db id, values = percent change (a Decimal, eg Decimal('12.345')).
+
+		the window comes back from one indexed query (plus one for its first date). sqlite has no LN()/EXP() to
+		multiply rows together in SQL, so the compounding happens here
+		"""
+		growth_keyed_by_ticker_id = {}
+		rows = self.for_last_trading_days(num_days).order_by().values_list('ticker_id', 'percent_change')
+		for ticker_id, percent_change in rows:
+			growth_keyed_by_ticker_id[ticker_id] = growth_keyed_by_ticker_id.get(ticker_id, Decimal(1)) * (1 + percent_change / 100)
+
+		return dict([(ticker_id, ((growth - 1) * 100).quantize(Decimal('0.001'))) for ticker_id, growth in growth_keyed_by_ticker_id.items()])
+
+	def get_biggest_movers(self, num_days, count=10):
+		"""
+		the tickers that gained and lost the most over the num_days most recent trading days.
+		returns (gainers, losers): lists of (Ticker, percent change) tuples, biggest movers first
+		"""
+		returns_sorted = sorted(self.get_returns(num_days).items(), key=lambda x: x[1], reverse=True)
+		tickers = Ticker.objects.in_bulk([ticker_id for ticker_id, percent_change in returns_sorted[:count] + returns_sorted[-count:]])
+
+		gainers = [(tickers[ticker_id], percent_change) for ticker_id, percent_change in returns_sorted[:count]]
+		losers = [(tickers[ticker_id], percent_change) for ticker_id, percent_change in reversed(returns_sorted[-count:])]
+		return gainers, losers
+
+
+class TickerDailyPerformance(models.Model):
+	"""
+	a ticker's percent change on one trading day. update_daily_percent_change keeps today's row in step with
+	Ticker.daily_percent_change, so once the market closes it holds the day's final change
+	"""
+	ticker = models.ForeignKey(Ticker)
+	date = models.DateField(db_index=True)
+	percent_change = models.DecimalField(max_digits=11, decimal_places=2, verbose_name='% change')
+
+	objects = TickerDailyPerformanceQuerySet.as_manager()
+
+	def __unicode__(self):
+		return '%s %s' % (self.ticker, self.date)
+
+	class Meta:
+		ordering = ['-date']
+		# one row per ticker per day; the unique index is also what lookups of a ticker's history search
+		unique_together = (('ticker', 'date'),)
+
+
+def record_daily_performances(percent_change_keyed_by_ticker_id, date):
+	"""
+	make the TickerDailyPerformance rows for the given date hold the given percent changes: one read of the date's
+	rows, then one bulk UPDATE for the ones that changed and one bulk INSERT for the new ones.
+	returns (count of rows updated, count of rows added)
+	"""
+	# whatever's left once the existing rows have had theirs is a new row
+	percent_change_keyed_by_ticker_id = dict(percent_change_keyed_by_ticker_id)
+
+	with transaction.atomic():
+		daily_performances_to_update = []
+		for daily_performance in TickerDailyPerformance.objects.filter(date=date).only('id', 'ticker', 'percent_change'):
+			percent_change = percent_change_keyed_by_ticker_id.pop(daily_performance.ticker_id, None)
+			if percent_change is not None and percent_change != daily_performance.percent_change:
+				daily_performance.percent_change = percent_change
+				daily_performances_to_update.append(daily_performance)
+
+		daily_performances_to_add = [TickerDailyPerformance(ticker_id=ticker_id, date=date, percent_change=percent_change)
+			for ticker_id, percent_change in percent_change_keyed_by_ticker_id.items()]
+
+		count_updated = bulk_update(daily_performances_to_update, ['percent_change'])
+		count_added = bulk_create_ignoring_duplicates(TickerDailyPerformance, daily_performances_to_add)
+
+	return count_updated, count_added
+
+
+class TickerIntradayPerformance(models.Model):
+	"""
+	a ticker's percent change on the day as of one quote fetch, for the tickers' paths through the day.
+	only recorded when update_daily_percent_change is run with --intraday, and only kept for a few days
+	"""
+	ticker = models.ForeignKey(Ticker)
+	timestamp = models.DateTimeField(db_index=True)
+	percent_change = models.DecimalField(max_digits=11, decimal_places=2, verbose_name='% change')
+
+	def __unicode__(self):
+		return '%s %s' % (self.ticker, self.timestamp)
+
+	class Meta:
+		ordering = ['-timestamp']
+		index_together = (('ticker', 'timestamp'),)
+
+
 class Article(models.Model):
 	title = models.CharField(max_length=100)
-	author = models.CharField(max_length=50)
-	date_pub = models.DateTimeField(null=True, blank=True)
+	author = models.CharField(max_length=50, db_index=True)
+	date_pub = models.DateTimeField(null=True, blank=True, db_index=True)
 	url = models.URLField(max_length=400)
 	tags = models.CharField(max_length=100, null=True)
 	service = models.ForeignKey(Service)
@@ -101,6 +277,16 @@ class Article(models.Model):
 
 	class Meta:
 		ordering = ['-date_pub']
+		# one Article per url/ticker combo. the unique index also makes lookups by url cheap
+		unique_together = (('url', 'ticker'),)
+
+
+# not on Article: a receiver for post_delete would turn off django's fast delete, so every queryset delete() of
+# articles (eg the purge) would load each row and invalidate once per article. the commands that add or delete
+# articles invalidate once, when they're done
+@receiver([post_save, post_delete], sender=Ticker)
+def forget_cached_market_snapshot(sender, **kwargs):
+	invalidate_market_snapshot()
 
 
 TEN_PERCENT_PROMISE = 1
@@ -131,24 +317,93 @@ COVERAGE_CHOICES = (
 	(GENERAL_COVERAGE, 'General Coverage')
 	)
 
+class CoverageTypeQuerySet(models.QuerySet):
+
+	def pledged(self):
+		""" the records that promise something: a record without an author isn't a promise of anything """
+		return self.exclude(author__isnull=True).exclude(author='')
+
+
 class CoverageType(models.Model):
 	coverage_type = models.IntegerField(choices=COVERAGE_CHOICES, null=True)
 	ticker = models.ForeignKey(Ticker)
 	service = models.ForeignKey(Service)
 	author = models.CharField(max_length=100, null=True, blank=True, verbose_name='Analyst')
 
+	objects = CoverageTypeQuerySet.as_manager()
+
 	def __unicode__(self):
 		return str(self.coverage_type)
 
+	class Meta:
+		# pledges are looked up by ticker + coverage type (+ service)
+		index_together = (('ticker', 'coverage_type', 'service'),)
+
+
+class CoverageMatrix(object):
+	"""
+	who promised which kind of coverage of which ticker, for which service: ticker -> coverage type -> service -> author.
+	built from the CoverageType records with one query, so that a page listing many tickers (and the template tags
+	it calls per ticker, coverage type and service) reads from memory instead of querying each time.
+
+	tickers can be passed as Ticker objects or db ids; services likewise. only the records that promise something
+	(see CoverageTypeQuerySet.pledged) are read.
+	"""
+
+	def __init__(self, coverage_types):
+		self._authors_by_service_id = {}
+		self._service_names_by_id = {}
+
+		coverage_types = coverage_types.pledged().order_by('id').values_list('ticker_id', 'coverage_type', 'service_id', 'service__pretty_name', 'author')
+		for ticker_id, coverage_type, service_id, service_name, author in coverage_types:
+			self._authors_by_service_id.setdefault(ticker_id, {}).setdefault(coverage_type, OrderedDict())[service_id] = author
+			self._service_names_by_id[service_id] = service_name
+
+	@classmethod
+	def for_tickers(cls, tickers=None):
+		""" the matrix for these tickers (a list or a queryset); for every ticker if tickers is None """
+		coverage_types = CoverageType.objects.all()
+		if tickers is not None:
+			coverage_types = coverage_types.filter(ticker__in=tickers)
+		return cls(coverage_types)
+
+	def _get_authors_by_service_id(self, ticker, coverage_type):
+		ticker_id = getattr(ticker, 'id', ticker)
+		return self._authors_by_service_id.get(ticker_id, {}).get(coverage_type, {})
+
+	def get_service_ids(self, ticker, coverage_type):
+		return self._get_authors_by_service_id(ticker, coverage_type).keys()
+
+	def get_service_names(self, ticker, coverage_type):
+		return [self._service_names_by_id[service_id] for service_id in self.get_service_ids(ticker, coverage_type)]
+
+	def get_authors(self, ticker, coverage_type):
+		return self._get_authors_by_service_id(ticker, coverage_type).values()
+
+	def get_author(self, ticker, coverage_type, service):
+		""" the author of the pledge for this ticker, coverage type and service; None if there's no such pledge """
+		return self._get_authors_by_service_id(ticker, coverage_type).get(getattr(service, 'id', service))
+
+	def get_coverage_types(self, ticker):
+		""" the coverage types promised for this ticker, in the order of COVERAGE_CHOICES """
+		coverage_types_promised = self._authors_by_service_id.get(getattr(ticker, 'id', ticker), {})
+		return [choice_id for choice_id, choice_name in COVERAGE_CHOICES if coverage_types_promised.get(choice_id)]
+
 
 class BylineMetaData(models.Model):
-	byline = models.CharField(max_length=50)
+	byline = models.CharField(max_length=50, unique=True)
 	services = models.CharField(max_length=200, null=True, blank=True,verbose_name='services covered in last year')
 	tickers = models.CharField(max_length=1500, null=True, blank=True,verbose_name='tickers covered in the last year')
 
 	def __unicode__(self):
 		return self.byline
 
+
+@receiver([post_save, post_delete], sender=BylineMetaData)
+def forget_cached_single_authors(sender, **kwargs):
+	invalidate_single_authors()
+
+
 class AnalystForTicker(models.Model):
 	priority = models.CharField(max_length=50)
 	service = models.ForeignKey(Service)
@@ -164,14 +419,17 @@ DATA_HARVEST_TYPE_MARKET_DATA = 2
 DATA_HARVEST_TYPE_EARNINGS_DATES = 3
 DATA_HARVEST_TYPE_SCORECARD_RECS = 4
 DATA_HARVEST_TYPE_BYLINE_META_DATA = 5
-
+DATA_HARVEST_TYPE_ARTICLE_PURGE = 6
+DATA_HARVEST_TYPE_FOLLOWERS = 7
 
 DATA_HARVEST_TYPE_CHOICES = (
     (DATA_HARVEST_TYPE_ARTICLES, 'articles'),
     (DATA_HARVEST_TYPE_MARKET_DATA, 'market performance'),
     (DATA_HARVEST_TYPE_EARNINGS_DATES, 'earnings dates'),
     (DATA_HARVEST_TYPE_SCORECARD_RECS, 'scorecard recs'),
-    (DATA_HARVEST_TYPE_BYLINE_META_DATA, 'bylines meta data')
+    (DATA_HARVEST_TYPE_BYLINE_META_DATA, 'bylines meta data'),
+    (DATA_HARVEST_TYPE_ARTICLE_PURGE, 'article purge'),
+    (DATA_HARVEST_TYPE_FOLLOWERS, 'One followers'),
 )
 
 class DataHarvestEventLog(models.Model):
@@ -181,6 +439,12 @@ class DataHarvestEventLog(models.Model):
 	date_finished = models.DateTimeField(auto_now=True)
 
 	notes = models.TextField(max_length=5000, null=True, blank=True)
+	# whether the run finished without an error; None while it's running (and for the commands that don't say).
+	# commands that go by an earlier run read this, not the notes
+	succeeded = models.NullBooleanField()
+	# how far the run got through its source, for the next run to pick up from (eg import_articles: the publish date
+	# of the newest article the API handed back); None if it doesn't say
+	data_through = models.DateTimeField(null=True, blank=True)
 
 	@property 
 	def date_type_pretty_name(self):
@@ -193,4 +457,6 @@ class DataHarvestEventLog(models.Model):
 		return self.date_type_pretty_name + " - " + self.date_started.strftime('%b %M %d')
 
 	class Meta:
-		ordering = ['-date_started']
\ No newline at end of file
+		ordering = ['-date_started']
+		# the freshness page asks for the latest events of each type
+		index_together = (('data_type', 'date_started'),)
\ No newline at end of file
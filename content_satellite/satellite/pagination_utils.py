@@ -0,0 +1,66 @@
+import base64
+import json
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+	pass
+
+
+class PrecountedPaginator(Paginator):
+	""" a Paginator for when we already know how many objects there are, so it doesn't run its own COUNT(*) """
+
+	def __init__(self, object_list, per_page, count, **kwargs):
+		super(PrecountedPaginator, self).__init__(object_list, per_page, **kwargs)
+		self._count = count
+
+
+def encode_cursor(date_pub, db_id):
+	""" an opaque, url-safe string that marks a position in a newest-first list of articles """
+	return base64.urlsafe_b64encode(json.dumps([date_pub.isoformat(), db_id]))
+
+
+def decode_cursor(cursor):
+	""" returns (date_pub, db id). raises InvalidCursor if the cursor isn't one that encode_cursor made """
+	try:
+		date_pub_as_string, db_id = json.loads(base64.urlsafe_b64decode(str(cursor)))
+		date_pub = parse_datetime(date_pub_as_string)
+		db_id = int(db_id)
+	except (TypeError, ValueError):
+		raise InvalidCursor('not a valid cursor: %s' % cursor)
+	if date_pub is None:
+		raise InvalidCursor('not a valid cursor: %s' % cursor)
+	return date_pub, db_id
+
+
+def get_keyset_page(articles, cursor=None, page_size=100):
+	"""
+	keyset ("seek") pagination over articles, newest first: instead of an OFFSET (which makes the db walk past every
+	earlier row, so deep pages get slower and slower), each page asks for the articles that sort after the last one
+	on the previous page, ie after its (date_pub, id). every page costs the same, and no COUNT(*) is needed.
+
+	articles: a queryset of Articles, or of values() dictionaries that include 'date_pub' and 'id'. articles
+	without a publish date have no place in the order, so they're left out.
+	cursor: None for the first page, otherwise the next_cursor that came with the previous page.
+
+	returns (list of articles on this page, next_cursor); next_cursor is None on the last page.
+	"""
+	articles = articles.filter(date_pub__isnull=False).order_by('-date_pub', '-id')
+
+	if cursor:
+		date_pub, db_id = decode_cursor(cursor)
+		articles = articles.filter(Q(date_pub__lt=date_pub) | Q(date_pub=date_pub, id__lt=db_id))
+
+	# ask for one more than we'll show, to find out whether there's a next page
+	page = list(articles[:page_size+1])
+	if len(page) <= page_size:
+		return page, None
+
+	page = page[:page_size]
+	last_article = page[-1]
+	if isinstance(last_article, dict):
+		return page, encode_cursor(last_article['date_pub'], last_article['id'])
+	return page, encode_cursor(last_article.date_pub, last_article.id)
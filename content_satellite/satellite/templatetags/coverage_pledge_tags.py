@@ -1,28 +1,43 @@
 from django import template
-from satellite.models import CoverageType
+from satellite.models import CoverageMatrix, COVERAGE_CHOICES
 
 register = template.Library()
 
+# pass along the coverage_matrix that the view built (see CoverageMatrix) and these tags don't query;
+# without one, each call queries for the ticker's pledges
+
 @register.simple_tag
-def get_service_pledges(ticker, coverage_choice_id):
+def get_service_pledges(ticker, coverage_choice_id, coverage_matrix=None):
     """
     Given a ticker and the integer representation of a coverage choice,
     find all CoverageType records, and from that set compile a string of the pretty names of the associated services
     """
-    coverage_pledges = CoverageType.objects.filter(ticker=ticker, coverage_type=coverage_choice_id)
-
-    if coverage_pledges:
-        services = [cp.service.pretty_name for cp in coverage_pledges]
-        return ', '.join(services)
+    if coverage_matrix is None:
+        coverage_matrix = CoverageMatrix.for_tickers([ticker])
 
-    return ''
+    return ', '.join(coverage_matrix.get_service_names(ticker, coverage_choice_id))
 
 
 @register.assignment_tag
-def get_services_ids(coverage_choice_id, ticker):
+def get_services_ids(coverage_choice_id, ticker, coverage_matrix=None):
     """
     Given a ticker and the integer representation of a coverage choice,
     find all CoverageType records, and from that set compile the ids of the associated services
     """
-    coverage_pledges = CoverageType.objects.filter(ticker=ticker, coverage_type=coverage_choice_id)
-    return [cp.service.id for cp in coverage_pledges]
+    if coverage_matrix is None:
+        coverage_matrix = CoverageMatrix.for_tickers([ticker])
+
+    return coverage_matrix.get_service_ids(ticker, coverage_choice_id)
+
+
+@register.simple_tag
+def get_promised_coverage(ticker, coverage_matrix=None):
+    """
+    Given a ticker, describe all the coverage promised for it, eg "10% Potential (Stock Advisor, Rule Breakers); Team Review (Hidden Gems)"
+    """
+    if coverage_matrix is None:
+        coverage_matrix = CoverageMatrix.for_tickers([ticker])
+
+    coverage_choice_names = dict(COVERAGE_CHOICES)
+    return '; '.join(['%s (%s)' % (coverage_choice_names[coverage_choice_id], ', '.join(coverage_matrix.get_service_names(ticker, coverage_choice_id)))
+        for coverage_choice_id in coverage_matrix.get_coverage_types(ticker)])
@@ -4,15 +4,14 @@ from satellite.models import Ticker
 register = template.Library()
 
 @register.assignment_tag
-def get_number_of_services(ticker_symbol):
+def get_number_of_services(ticker):
     """
-    Given a ticker, find the number of services that cover it.
+    Given a ticker (a Ticker object or its db id), find the number of services that cover it.
+    if the view annotated the tickers with num_services (eg Ticker.objects.annotate(num_services=Count('covering_services'))),
+    that count is used as is; otherwise it takes a query
     """
-    try:
-        ticker = Ticker.objects.get(ticker_symbol = ticker_symbol)
-        if ticker.services_for_ticker:
-            return len(ticker.services_for_ticker.split(','))
-        else:
-            return 0
-    except:
-        return None
+    if hasattr(ticker, 'num_services'):
+        return ticker.num_services
+
+    memberships = Ticker.covering_services.through.objects.filter(ticker=ticker)
+    return memberships.count()
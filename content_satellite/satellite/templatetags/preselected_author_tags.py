@@ -1,31 +1,33 @@
 from django import template
-from satellite.models import CoverageType
+from satellite.models import CoverageMatrix
 
 register = template.Library()
 
+# pass along the coverage_matrix that the view built (see CoverageMatrix) and these tags don't query;
+# without one, each call queries for the ticker's pledges
+
 @register.simple_tag
-def get_preselected_author(ticker, coverage_choice_id):
+def get_preselected_author(ticker, coverage_choice_id, coverage_matrix=None):
     """
     Given a ticker and the integer representation of a coverage choice,
     find all CoverageType records, and from that set create a string of the author's name 
     """
-    preselected_author = CoverageType.objects.filter(ticker=ticker, coverage_type=coverage_choice_id)
-    print preselected_author
+    if coverage_matrix is None:
+        coverage_matrix = CoverageMatrix.for_tickers([ticker])
 
-    if preselected_author:
-        author = [a.author for a in preselected_author]
-        return author
+    authors = coverage_matrix.get_authors(ticker, coverage_choice_id)
+    if authors:
+        return authors
 
 @register.assignment_tag
-def get_author_name(coverage_choice_id, ticker, service):
+def get_author_name(coverage_choice_id, ticker, service, coverage_matrix=None):
     """
     Given a ticker, coverage choice (its integer representation), and a service,
     figure out whether there exists a CoverageType record. Note: we expect at most one
     record, given any combo of ticker, coverage choice, and service.
     If there is one, then return its author value.
     """
-    try:
-        coverage_pledge = CoverageType.objects.get(ticker=ticker, coverage_type=coverage_choice_id, service=service)
-        return coverage_pledge.author
-    except:
-        return None
\ No newline at end of file
+    if coverage_matrix is None:
+        coverage_matrix = CoverageMatrix.for_tickers([ticker])
+
+    return coverage_matrix.get_author(ticker, coverage_choice_id, service)
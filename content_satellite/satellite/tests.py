@@ -0,0 +1,1251 @@
+import datetime
+import json
+import socket
+import urlparse
+import threading
+import time
+import unittest
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.db.models import Count
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from push_notifications.models import IntradayBigMovementReceipt
+from satellite.cache_utils import CachedValue, get_ticker_symbols, invalidate_ticker_symbols
+from satellite.db_utils import bulk_update, bulk_create_ignoring_duplicates, iterate_in_chunks
+from satellite.http_utils import HttpError, HttpTransport, get_with_retries, map_concurrently
+from satellite.management.commands import import_articles, import_tick_take, purge_old_articles, update_earnings_announcement_dates, update_num_followers, reset_daily_percent_change, update_byline_meta_data, \
+	update_daily_percent_change, update_percent_change_historical
+from satellite.models import Ticker, Article, Service, Scorecard, ServiceTake, CoverageType, CoverageMatrix, BylineMetaData, DataHarvestEventLog, \
+	TickerDailyPerformance, TickerIntradayPerformance, DATA_HARVEST_TYPE_ARTICLES, DATA_HARVEST_TYPE_MARKET_DATA, DATA_HARVEST_TYPE_BYLINE_META_DATA, \
+	DATA_HARVEST_TYPE_ARTICLE_PURGE, COVERAGE_CHOICES, record_daily_performances
+from satellite.pagination_utils import encode_cursor
+from satellite.templatetags.number_of_services_tags import get_number_of_services
+from satellite.views import _get_service_overviews, _save_coverage_pledges
+from satellite.views_2 import _get_upcoming_earnings, _iter_profiles_of_flagged_recs
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'reads sqlite query plans')
+class HotQueryIndexTests(TestCase):
+	"""
+	the lookups that the pages and commands run over and over should search an index, not scan the table.
+	checked with sqlite's EXPLAIN QUERY PLAN against the tables as the migrations build them.
+	"""
+
+	def get_query_plan(self, queryset):
+		sql, params = queryset.query.sql_with_params()
+		cursor = connection.cursor()
+		cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+		# each row is (id, parent, notused, detail); eg 'SEARCH satellite_ticker USING INDEX ... (ticker_symbol=?)'
+		return [row[-1] for row in cursor.fetchall()]
+
+	def assertUsesIndex(self, queryset, table_name):
+		plan = self.get_query_plan(queryset)
+		steps_for_table = [step for step in plan if table_name in step.split()]
+		self.assertTrue(steps_for_table, 'no step for %s in the plan: %s' % (table_name, plan))
+		for step in steps_for_table:
+			self.assertTrue(step.startswith('SEARCH') and 'INDEX' in step, 'not an index search: %s' % plan)
+
+	def test_ticker_by_symbol(self):
+		self.assertUsesIndex(Ticker.objects.filter(ticker_symbol='SBUX'), 'satellite_ticker')
+		self.assertUsesIndex(Ticker.objects.filter(ticker_symbol__in=['SBUX', 'AAPL']), 'satellite_ticker')
+
+	def test_ticker_by_instrument_id(self):
+		self.assertUsesIndex(Ticker.objects.filter(instrument_id=202935), 'satellite_ticker')
+
+	def test_articles_by_url(self):
+		self.assertUsesIndex(Article.objects.filter(url__in=['newsletters.fool.com/a', 'newsletters.fool.com/b']), 'satellite_article')
+
+	def test_articles_by_author(self):
+		self.assertUsesIndex(Article.objects.filter(author='Tom Gardner'), 'satellite_article')
+
+	def test_articles_by_publish_date(self):
+		old_articles = Article.objects.filter(date_pub__lt=timezone.now() - datetime.timedelta(days=100))
+		self.assertUsesIndex(old_articles, 'satellite_article')
+		self.assertUsesIndex(old_articles.filter(service_id=1), 'satellite_article')
+
+	def test_byline_meta_data_by_byline(self):
+		self.assertUsesIndex(BylineMetaData.objects.filter(byline__in=['Tom Gardner', 'David Gardner']), 'satellite_bylinemetadata')
+
+	def test_latest_harvest_events_by_type(self):
+		events = DataHarvestEventLog.objects.filter(data_type=DATA_HARVEST_TYPE_ARTICLES).order_by('-date_started')[:1]
+		self.assertUsesIndex(events, 'satellite_dataharvesteventlog')
+		# and the index hands the rows back already in order
+		self.assertFalse([step for step in self.get_query_plan(events) if 'TEMP B-TREE' in step])
+
+	def test_coverage_pledges_by_ticker_and_type(self):
+		self.assertUsesIndex(CoverageType.objects.filter(ticker_id=1, coverage_type=1), 'satellite_coveragetype')
+		self.assertUsesIndex(CoverageType.objects.filter(ticker_id=1, coverage_type=1, service_id=1), 'satellite_coveragetype')
+
+	def test_todays_alerts_for_ticker(self):
+		receipts = IntradayBigMovementReceipt.objects.filter(ticker_id=1, timestamp__gt=timezone.now() - datetime.timedelta(hours=12))
+		self.assertUsesIndex(receipts, 'push_notifications_intradaybigmovementreceipt')
+		plan = self.get_query_plan(receipts)
+		self.assertTrue([step for step in plan if 'ticker_id=? AND timestamp>?' in step], plan)
+
+	def test_tickers_by_tier_status(self):
+		self.assertUsesIndex(Ticker.objects.filter(tier_status__in=['core', 'first']), 'satellite_ticker')
+
+	def test_biggest_movers(self):
+		for ordering in ['daily_percent_change', '-daily_percent_change']:
+			plan = self.get_query_plan(Ticker.objects.order_by(ordering)[:1])
+			# walked in order along the index, so LIMIT 1 stops at the first row
+			self.assertTrue([step for step in plan if 'USING INDEX' in step], plan)
+			self.assertFalse([step for step in plan if 'TEMP B-TREE' in step], plan)
+
+	def test_upcoming_earnings(self):
+		# the upcoming earnings page's own query
+		upcoming = _get_upcoming_earnings(datetime.date.today())
+		self.assertUsesIndex(upcoming, 'satellite_ticker')
+		# walked in date order along the index, so LIMIT 100 stops early; only the tickers that share a date are sorted
+		# (by daily change) among themselves, not the whole result
+		plan = self.get_query_plan(upcoming)
+		self.assertFalse([step for step in plan if 'TEMP B-TREE FOR ORDER BY' in step or 'GROUP BY' in step], plan)
+
+	def test_ticker_history(self):
+		since = datetime.date.today() - datetime.timedelta(days=90)
+		self.assertUsesIndex(TickerDailyPerformance.objects.filter(ticker_id=1, date__gte=since), 'satellite_tickerdailyperformance')
+		self.assertUsesIndex(TickerDailyPerformance.objects.filter(date__gte=since), 'satellite_tickerdailyperformance')
+		self.assertUsesIndex(TickerIntradayPerformance.objects.filter(ticker_id=1, timestamp__gte=timezone.now() - datetime.timedelta(hours=6)), 'satellite_tickerintradayperformance')
+
+
+class TickerPerformanceHistoryTests(TestCase):
+
+	def setUp(self):
+		self.up = Ticker.objects.create(ticker_symbol='UP', exchange_symbol='NYSE', percent_change_historical=0)
+		self.down = Ticker.objects.create(ticker_symbol='DOWN', exchange_symbol='NYSE', percent_change_historical=0)
+		self.today = datetime.date(2015, 6, 5)
+		for days_ago, up_change, down_change in [(3, '50', '-1'), (2, '10', '-50'), (1, '-10', '2'), (0, '10', '-10')]:
+			record_daily_performances({self.up.id: Decimal(up_change), self.down.id: Decimal(down_change)}, self.today - datetime.timedelta(days=days_ago))
+
+	def test_returns_compound_over_the_last_trading_days(self):
+		returns = TickerDailyPerformance.objects.get_returns(3)
+		# 1.1 * 0.9 * 1.1 = 1.089
+		self.assertEqual(returns[self.up.id], Decimal('8.900'))
+		# 0.5 * 1.02 * 0.9 = 0.459
+		self.assertEqual(returns[self.down.id], Decimal('-54.100'))
+
+	def test_biggest_movers(self):
+		gainers, losers = TickerDailyPerformance.objects.get_biggest_movers(4, count=1)
+		self.assertEqual(gainers, [(self.up, Decimal('63.350'))])
+		self.assertEqual(losers, [(self.down, Decimal('-54.559'))])
+
+	def test_recording_a_day_again_overwrites_it(self):
+		self.assertEqual(record_daily_performances({self.up.id: Decimal('12'), self.down.id: Decimal('-10')}, self.today), (1, 0))
+		self.assertEqual(TickerDailyPerformance.objects.get(ticker=self.up, date=self.today).percent_change, Decimal('12'))
+		self.assertEqual(TickerDailyPerformance.objects.filter(date=self.today).count(), 2)
+
+
+class CoverageSummaryTests(TestCase):
+
+	def setUp(self):
+		stock_advisor = Service.objects.create(name='stock-advisor', pretty_name='Stock Advisor')
+		rule_breakers = Service.objects.create(name='rule-breakers', pretty_name='Rule Breakers')
+		scorecards = [Scorecard.objects.create(name='sa', pretty_name='SA Core', service=stock_advisor),
+			Scorecard.objects.create(name='rb', pretty_name='RB Core', service=rule_breakers)]
+		for ticker_symbol in ['AAPL', 'SBUX']:
+			ticker = Ticker.objects.create(ticker_symbol=ticker_symbol, exchange_symbol='NASDAQ', percent_change_historical=0)
+			for scorecard in scorecards:
+				ServiceTake.objects.create(ticker=ticker, scorecard=scorecard, action='Buy')
+
+	def test_prefetched_tickers_dont_query_per_ticker(self):
+		with self.assertNumQueries(2):
+			summaries = [(t.scorecards(), t.services()) for t in Ticker.objects.with_coverage_summary()]
+		self.assertEqual(summaries, [('RB Core, SA Core', 2)] * 2)
+
+	def test_a_ticker_on_its_own_queries_for_itself(self):
+		ticker = Ticker.objects.get(ticker_symbol='AAPL')
+		with self.assertNumQueries(1):
+			self.assertEqual(ticker.scorecards(), 'RB Core, SA Core')
+
+
+class NumberOfServicesTagTests(TestCase):
+
+	def setUp(self):
+		self.aapl = Ticker.objects.create(ticker_symbol='AAPL', exchange_symbol='NASDAQ', percent_change_historical=0)
+		self.sbux = Ticker.objects.create(ticker_symbol='SBUX', exchange_symbol='NASDAQ', percent_change_historical=0)
+		self.aapl.covering_services.add(Service.objects.create(name='stock-advisor', pretty_name='Stock Advisor'),
+			Service.objects.create(name='rule-breakers', pretty_name='Rule Breakers'))
+
+	def test_counts_a_ticker_that_wasnt_annotated(self):
+		with self.assertNumQueries(1):
+			self.assertEqual(get_number_of_services(self.aapl), 2)
+		self.assertEqual(get_number_of_services(self.sbux), 0)
+		self.assertEqual(get_number_of_services(self.aapl.id), 2)
+
+	def test_uses_the_annotation_if_there_is_one(self):
+		tickers = list(Ticker.objects.annotate(num_services=Count('covering_services')).order_by('ticker_symbol'))
+		with self.assertNumQueries(0):
+			self.assertEqual([get_number_of_services(t) for t in tickers], [2, 0])
+
+
+class TieredStocksTests(TestCase):
+
+	def setUp(self):
+		for ticker_symbol in ['AAPL', 'SBUX', 'Z']:
+			Ticker.objects.create(ticker_symbol=ticker_symbol, exchange_symbol='NASDAQ', percent_change_historical=0, tier=1,
+				tier_status='core')
+
+	def test_saving_notes_keeps_the_tickers_filter(self):
+		response = self.client.get(reverse('tiered_stocks'), {'tickers': 'aapl,sbux'})
+		self.assertContains(response, 'name="tickers" type="hidden" value="aapl,sbux"')
+
+		response = self.client.post(reverse('tiered_stocks'), {'tickers': 'aapl,sbux', 'ticker_notes_AAPL': 'buy more'})
+		self.assertEqual([t.ticker_symbol for t in response.context['tiered_stocks']], ['AAPL', 'SBUX'])
+		self.assertEqual(Ticker.objects.get(ticker_symbol='AAPL').notes, 'buy more')
+
+
+class PercentChangeHistoricalTests(TestCase):
+
+	def setUp(self):
+		self.up = Ticker.objects.create(ticker_symbol='UP', exchange_symbol='NYSE', percent_change_historical=0)
+		self.flat = Ticker.objects.create(ticker_symbol='FLAT', exchange_symbol='NYSE', percent_change_historical=Decimal('0.000'))
+		self.new = Ticker.objects.create(ticker_symbol='NEW', exchange_symbol='NYSE', percent_change_historical=Decimal('7.000'))
+		record_daily_performances({self.up.id: Decimal('10.00'), self.flat.id: Decimal('0.00')}, datetime.date(2015, 6, 4))
+		record_daily_performances({self.up.id: Decimal('10.00'), self.flat.id: Decimal('0.00')}, datetime.date(2015, 6, 5))
+
+	def test_writes_only_the_changes_that_moved(self):
+		self.assertEqual(update_percent_change_historical.update_percent_change_historical(), 1)
+		self.assertEqual(dict(Ticker.objects.values_list('ticker_symbol', 'percent_change_historical')), {
+			'UP': Decimal('21.000'),
+			'FLAT': Decimal('0.000'),
+			# no history, so left alone
+			'NEW': Decimal('7.000'),
+		})
+		self.assertEqual(update_percent_change_historical.update_percent_change_historical(), 0)
+
+	def test_the_reset_leaves_it_alone(self):
+		with CaptureQueriesContext(connection) as queries:
+			reset_daily_percent_change.reset_daily_percent_changes()
+		# one UPDATE of the tickers (and the cache delete); the history isn't read
+		self.assertFalse([q for q in queries.captured_queries if 'tickerdailyperformance' in q['sql']])
+		self.assertEqual(len([q for q in queries.captured_queries if 'UPDATE ' in q['sql']]), 1)
+		self.assertEqual(Ticker.objects.get(id=self.up.id).percent_change_historical, Decimal('0.000'))
+
+
+class BulkUpdateTests(TestCase):
+
+	def setUp(self):
+		for i in range(5):
+			BylineMetaData.objects.create(byline='Author %d' % i, services='Stock Advisor', tickers='AAPL')
+
+	def get_update_statements(self, queries):
+		# on sqlite, django 1.7 logs raw cursor statements as "QUERY = u'UPDATE ...' - PARAMS = (...)"
+		return [q['sql'] for q in queries if 'UPDATE ' in q['sql']]
+
+	def test_writes_each_row_its_own_values(self):
+		byline_meta_data = list(BylineMetaData.objects.order_by('byline'))
+		for i, b in enumerate(byline_meta_data[:4]):
+			b.services = 'Service %d' % i
+			b.tickers = None if i == 3 else 'T%d' % i
+
+		self.assertEqual(bulk_update(byline_meta_data[:4], ['services', 'tickers']), 4)
+
+		values = list(BylineMetaData.objects.order_by('byline').values_list('byline', 'services', 'tickers'))
+		self.assertEqual(values, [
+			('Author 0', 'Service 0', 'T0'),
+			('Author 1', 'Service 1', 'T1'),
+			('Author 2', 'Service 2', 'T2'),
+			('Author 3', 'Service 3', None),
+			('Author 4', 'Stock Advisor', 'AAPL'),
+		])
+
+	def test_only_writes_the_named_fields(self):
+		b = BylineMetaData.objects.get(byline='Author 0')
+		b.services = 'Rule Breakers'
+		b.tickers = 'not written'
+		bulk_update([b], ['services'])
+		self.assertEqual(BylineMetaData.objects.filter(byline='Author 0').values_list('services', 'tickers')[0], ('Rule Breakers', 'AAPL'))
+
+	def test_nothing_to_update(self):
+		with self.assertNumQueries(0):
+			self.assertEqual(bulk_update([], ['services']), 0)
+
+	def test_one_statement_per_batch(self):
+		byline_meta_data = list(BylineMetaData.objects.order_by('byline'))
+		for b in byline_meta_data:
+			b.tickers = b.byline.upper()
+
+		with CaptureQueriesContext(connection) as context:
+			self.assertEqual(bulk_update(byline_meta_data, ['tickers'], batch_size=2), 5)
+		self.assertEqual(len(self.get_update_statements(context.captured_queries)), 3)
+
+		self.assertEqual(sorted(BylineMetaData.objects.values_list('tickers', flat=True)), ['AUTHOR %d' % i for i in range(5)])
+
+	def test_default_batches_stay_under_the_sqlite_parameter_limit(self):
+		byline_meta_data = [BylineMetaData(byline='Extra %d' % i) for i in range(600)]
+		BylineMetaData.objects.bulk_create(byline_meta_data)
+		byline_meta_data = list(BylineMetaData.objects.filter(byline__startswith='Extra'))
+		for b in byline_meta_data:
+			b.services, b.tickers = 'S', 'T'
+
+		with CaptureQueriesContext(connection) as context:
+			self.assertEqual(bulk_update(byline_meta_data, ['services', 'tickers']), 600)
+		# 5 parameters per row (2 per CASE, 1 in the WHERE); 180 rows per statement
+		self.assertEqual(len(self.get_update_statements(context.captured_queries)), 4)
+		self.assertEqual(BylineMetaData.objects.filter(services='S', tickers='T').count(), 600)
+
+
+class BulkCreateIgnoringDuplicatesTests(TestCase):
+
+	def get_insert_statements(self, queries):
+		return [q['sql'] for q in queries if 'INSERT ' in q['sql']]
+
+	def test_new_rows_go_in_with_one_insert(self):
+		with CaptureQueriesContext(connection) as context:
+			count = bulk_create_ignoring_duplicates(BylineMetaData, [BylineMetaData(byline='Author %d' % i) for i in range(3)])
+		self.assertEqual(count, 3)
+		self.assertEqual(len(self.get_insert_statements(context.captured_queries)), 1)
+		self.assertEqual(BylineMetaData.objects.count(), 3)
+
+	def test_duplicates_are_skipped_row_by_row(self):
+		BylineMetaData.objects.create(byline='Author 1', services='kept')
+
+		with CaptureQueriesContext(connection) as context:
+			count = bulk_create_ignoring_duplicates(BylineMetaData, [BylineMetaData(byline='Author %d' % i, services='new') for i in range(3)])
+
+		self.assertEqual(count, 2)
+		# the bulk insert that tripped the constraint, then one insert per row
+		self.assertEqual(len(self.get_insert_statements(context.captured_queries)), 4)
+		self.assertEqual(sorted(BylineMetaData.objects.values_list('byline', 'services')), [
+			('Author 0', 'new'),
+			('Author 1', 'kept'),
+			('Author 2', 'new'),
+		])
+
+	def test_all_duplicates(self):
+		BylineMetaData.objects.create(byline='Author 0')
+		self.assertEqual(bulk_create_ignoring_duplicates(BylineMetaData, [BylineMetaData(byline='Author 0')]), 0)
+		self.assertEqual(BylineMetaData.objects.count(), 1)
+
+	def test_nothing_to_insert(self):
+		with self.assertNumQueries(0):
+			self.assertEqual(bulk_create_ignoring_duplicates(BylineMetaData, []), 0)
+
+
+class IterateInChunksTests(TestCase):
+
+	def setUp(self):
+		self.stock_advisor = Service.objects.create(name='stock-advisor', pretty_name='Stock Advisor')
+		self.rule_breakers = Service.objects.create(name='rule-breakers', pretty_name='Rule Breakers')
+		Ticker.objects.bulk_create([Ticker(ticker_symbol='T%03d' % i, exchange_symbol='NYSE', percent_change_historical=0)
+			for i in range(25)])
+
+	def test_walks_the_primary_keys_by_default(self):
+		tickers = Ticker.objects.order_by('pk')
+		with CaptureQueriesContext(connection) as queries:
+			chunked_tickers = list(iterate_in_chunks(tickers, chunk_size=10))
+		self.assertEqual(chunked_tickers, list(tickers))
+		# three chunks, each its keys and then its rows; nothing read up front
+		self.assertEqual(len(queries.captured_queries), 6)
+		self.assertIn('LIMIT 10', queries.captured_queries[0]['sql'])
+
+	def test_keeps_the_querysets_order_across_chunks(self):
+		tickers = Ticker.objects.order_by('-ticker_symbol').values_list('ticker_symbol', flat=True)
+		with CaptureQueriesContext(connection) as queries:
+			ticker_symbols = list(iterate_in_chunks(tickers, chunk_size=10, key='-ticker_symbol'))
+		self.assertEqual(ticker_symbols, list(tickers))
+		# three chunks, then the (no) tickers without a ticker symbol
+		self.assertEqual(len(queries.captured_queries), 7)
+
+	def test_keeps_a_joined_pks_rows_together(self):
+		for ticker in Ticker.objects.all():
+			ticker.covering_services.add(self.stock_advisor, self.rule_breakers)
+		tickers = Ticker.objects.order_by('ticker_symbol', 'covering_services__pretty_name').values_list('ticker_symbol',
+			'covering_services__pretty_name')
+		self.assertEqual(list(iterate_in_chunks(tickers, chunk_size=10, key='ticker_symbol')), list(tickers))
+		self.assertEqual(len(list(iterate_in_chunks(tickers, chunk_size=10, key='ticker_symbol'))), 50)
+
+	def test_rows_without_a_key_come_last(self):
+		ticker = Ticker.objects.get(ticker_symbol='T000')
+		date_pub = timezone.make_aware(datetime.datetime(2015, 6, 5, 12), timezone.get_current_timezone())
+		Article.objects.bulk_create([Article(title='article %d' % i, author='Tom', url='www.fool.com/%d' % i,
+			date_pub=date_pub - datetime.timedelta(hours=i // 2) if i < 20 else None, service=self.stock_advisor, ticker=ticker)
+			for i in range(25)])
+		articles = Article.objects.order_by('-date_pub', '-id').values_list('title', flat=True)
+		titles = list(iterate_in_chunks(articles, chunk_size=3, key='-date_pub'))
+		# two articles an hour, newest first (the newer id first within an hour); then the undated ones, by id
+		dated_titles = ['article %d' % i for pair in range(10) for i in (2*pair + 1, 2*pair)]
+		self.assertEqual(titles, dated_titles + ['article %d' % i for i in range(24, 19, -1)])
+
+	def test_flagged_recs_csv_takes_a_ticker_without_a_company_name(self):
+		ticker = Ticker.objects.get(ticker_symbol='T000')
+		scorecard = Scorecard.objects.create(name='sa', pretty_name='Stock Advisor', service=self.stock_advisor)
+		ServiceTake.objects.create(ticker=ticker, scorecard=scorecard, action='Buy', is_newest=True)
+
+		response = self.client.get(reverse('flagged_recs_as_csv'))
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(''.join(response.streaming_content).splitlines()[1], 'T000,,Stock Advisor,Stock Advisor,Buy,,Y,,')
+
+
+class FakeTransport(object):
+	""" stands in for HttpTransport: answers each get() with the next of the given responses (raising the exceptions) """
+
+	def __init__(self, responses):
+		self.responses = list(responses)
+		self.urls = []
+
+	def get(self, url, headers=None, timeout=None):
+		self.urls.append(url)
+		response = self.responses.pop(0)
+		if isinstance(response, Exception):
+			raise response
+		return response
+
+	def close(self):
+		pass
+
+
+class GetWithRetriesTests(SimpleTestCase):
+
+	def test_retries_server_errors(self):
+		transport = FakeTransport([HttpError('http://quotes/', 503), HttpError('http://quotes/', 500), 'ok'])
+		self.assertEqual(get_with_retries(transport, 'http://quotes/', backoff_seconds=0), 'ok')
+		self.assertEqual(len(transport.urls), 3)
+
+	def test_retries_network_errors(self):
+		transport = FakeTransport([socket.timeout('timed out'), 'ok'])
+		self.assertEqual(get_with_retries(transport, 'http://quotes/', backoff_seconds=0), 'ok')
+		self.assertEqual(len(transport.urls), 2)
+
+	def test_gives_up_after_max_attempts(self):
+		transport = FakeTransport([HttpError('http://quotes/', 502)] * 3)
+		with self.assertRaises(HttpError):
+			get_with_retries(transport, 'http://quotes/', max_attempts=3, backoff_seconds=0)
+		self.assertEqual(len(transport.urls), 3)
+
+	def test_does_not_retry_client_errors(self):
+		transport = FakeTransport([HttpError('http://quotes/', 404), 'ok'])
+		with self.assertRaises(HttpError) as raised:
+			get_with_retries(transport, 'http://quotes/', backoff_seconds=0)
+		self.assertEqual(raised.exception.status, 404)
+		self.assertEqual(len(transport.urls), 1)
+
+
+class MapConcurrentlyTests(SimpleTestCase):
+
+	def test_results_come_back_in_order_with_errors_caught(self):
+		def invert(n):
+			return 1.0 / n
+
+		results = map_concurrently(invert, [1, 0, 4, 2], max_workers=3)
+		self.assertEqual([(item, result) for item, result, error in results], [(1, 1.0), (0, None), (4, 0.25), (2, 0.5)])
+		self.assertEqual([type(error) for item, result, error in results], [type(None), ZeroDivisionError, type(None), type(None)])
+
+	def test_nothing_to_do(self):
+		self.assertEqual(map_concurrently(lambda item: item, []), [])
+
+
+class _LocalHandler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+
+	def do_GET(self):
+		self.server.client_ports.append(self.client_address[1])
+		self.server.headers_seen.append(dict(self.headers))
+		status, body = (404, 'not here') if self.path == '/missing' else (200, 'you asked for %s' % self.path)
+		self.send_response(status)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+
+class HttpTransportTests(SimpleTestCase):
+
+	def setUp(self):
+		self.server = HTTPServer(('127.0.0.1', 0), _LocalHandler)
+		self.server.client_ports = []
+		self.server.headers_seen = []
+		self.server_thread = threading.Thread(target=self.server.serve_forever)
+		self.server_thread.daemon = True
+		self.server_thread.start()
+		self.base_url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+		self.transport = HttpTransport(default_headers={'Cookie': 'Lookie=abc'})
+
+	def tearDown(self):
+		self.transport.close()
+		self.server.shutdown()
+		self.server.server_close()
+
+	def test_reuses_the_connection(self):
+		self.assertEqual(self.transport.get(self.base_url + '/quotes?s=AAPL'), 'you asked for /quotes?s=AAPL')
+		self.assertEqual(self.transport.get(self.base_url + '/quotes?s=SBUX'), 'you asked for /quotes?s=SBUX')
+		# both requests came in over the same client socket
+		self.assertEqual(len(set(self.server.client_ports)), 1)
+		self.assertEqual(self.server.headers_seen[0].get('cookie'), 'Lookie=abc')
+
+	def test_non_2xx_raises(self):
+		with self.assertRaises(HttpError) as raised:
+			self.transport.get(self.base_url + '/missing')
+		self.assertEqual(raised.exception.status, 404)
+		# and the connection is still good for the next request
+		self.assertEqual(self.transport.get(self.base_url + '/ok'), 'you asked for /ok')
+
+
+class FakeYqlTransport(object):
+	""" answers YQL quote queries from a dictionary of percent changes keyed by symbol; a batch holding 'BAD' gets a 400 """
+
+	def __init__(self, percent_changes_keyed_by_ticker_symbol):
+		self.percent_changes_keyed_by_ticker_symbol = percent_changes_keyed_by_ticker_symbol
+		self.urls = []
+
+	def get(self, url, headers=None, timeout=None):
+		self.urls.append(url)
+		yql = urlparse.parse_qs(urlparse.urlsplit(url).query)['q'][0]
+		ticker_symbols = [ts.strip('"') for ts in yql.split('(')[1].rstrip(')').split(',')]
+		if 'BAD' in ticker_symbols:
+			raise HttpError(url, 400)
+		quotes = [{'Symbol': ts, 'PercentChange': self.percent_changes_keyed_by_ticker_symbol.get(ts)} for ts in ticker_symbols]
+		if len(quotes) == 1:
+			# YQL hands back a lone quote by itself, not in a list
+			quotes = quotes[0]
+		return json.dumps({'query': {'results': {'quote': quotes}}})
+
+
+class QuoteIngestTests(TestCase):
+
+	def setUp(self):
+		for ticker_symbol in ['AAPL', 'BAD', 'MOD', 'SBUX', 'ZZZ']:
+			Ticker.objects.create(ticker_symbol=ticker_symbol, exchange_symbol='NASDAQ', percent_change_historical=0, daily_percent_change='9.99')
+		self.original_batch_size = update_daily_percent_change.batch_size
+		update_daily_percent_change.batch_size = 2
+
+	def tearDown(self):
+		update_daily_percent_change.batch_size = self.original_batch_size
+
+	def test_one_run(self):
+		transport = FakeYqlTransport({'AAPL': '+1.25%', 'MOD': '-0.50%', 'SBUX': '+14.35%', 'ZZZ': None})
+		quote_provider = update_daily_percent_change.YahooQuoteProvider(transport=transport)
+
+		count_updated, tickers_symbols_that_errored, history_date = update_daily_percent_change.update_daily_percent_changes(
+			quote_provider=quote_provider, max_workers=2)
+
+		# batches: AAPL+BAD (rejected), MOD+SBUX, ZZZ (no value in the quote)
+		self.assertEqual(len(transport.urls), 3)
+		self.assertEqual(count_updated, 2)
+		self.assertEqual(tickers_symbols_that_errored, set(['AAPL', 'BAD', 'ZZZ']))
+		self.assertEqual(dict(Ticker.objects.values_list('ticker_symbol', 'daily_percent_change')), {
+			'AAPL': Decimal('9.99'),
+			'BAD': Decimal('9.99'),
+			'MOD': Decimal('-0.50'),
+			'SBUX': Decimal('14.35'),
+			'ZZZ': Decimal('9.99'),
+		})
+		self.assertEqual(history_date, timezone.localtime(timezone.now()).date())
+		self.assertEqual(dict(TickerDailyPerformance.objects.filter(date=history_date).values_list('ticker__ticker_symbol', 'percent_change')),
+			{'MOD': Decimal('-0.50'), 'SBUX': Decimal('14.35')})
+
+	def test_a_run_while_the_market_is_closed_records_no_history(self):
+		# the last trading day was a few days back (eg before a long weekend); today's quotes are that day's, again
+		today = timezone.localtime(timezone.now()).date()
+		last_trading_day = today - datetime.timedelta(days=3)
+		tickers_keyed_by_symbol = dict([(t.ticker_symbol, t) for t in Ticker.objects.all()])
+		record_daily_performances({tickers_keyed_by_symbol['MOD'].id: Decimal('-0.50'), tickers_keyed_by_symbol['SBUX'].id: Decimal('14.35')},
+			last_trading_day)
+		record_daily_performances({tickers_keyed_by_symbol['MOD'].id: Decimal('2.00')}, last_trading_day - datetime.timedelta(days=1))
+
+		transport = FakeYqlTransport({'MOD': '-0.50%', 'SBUX': '+14.35%'})
+		quote_provider = update_daily_percent_change.YahooQuoteProvider(transport=transport)
+		count_updated, tickers_symbols_that_errored, history_date = update_daily_percent_change.update_daily_percent_changes(
+			quote_provider=quote_provider, max_workers=2, intraday=True)
+
+		self.assertEqual(count_updated, 2)
+		self.assertEqual(history_date, None)
+		self.assertFalse(TickerDailyPerformance.objects.filter(date=today).exists())
+		self.assertFalse(TickerIntradayPerformance.objects.exists())
+		# so the 50-day change still counts the move once
+		self.assertEqual(TickerDailyPerformance.objects.get_returns(50)[tickers_keyed_by_symbol['MOD'].id], Decimal('1.490'))
+
+		# and once the market opens, the day's quotes are recorded as usual
+		transport.percent_changes_keyed_by_ticker_symbol = {'MOD': '+0.10%', 'SBUX': '+14.35%'}
+		count_updated, tickers_symbols_that_errored, history_date = update_daily_percent_change.update_daily_percent_changes(
+			quote_provider=quote_provider, max_workers=2)
+		self.assertEqual(history_date, today)
+		self.assertEqual(TickerDailyPerformance.objects.filter(date=today).count(), 2)
+
+	def test_the_reset_archives_under_the_last_trading_day_in_the_history(self):
+		mod = Ticker.objects.get(ticker_symbol='MOD')
+		record_daily_performances({mod.id: Decimal('1.00')}, datetime.date(2015, 6, 5))
+		# eg a run that found the market closed, whatever its event log says
+		DataHarvestEventLog.objects.create(data_type=DATA_HARVEST_TYPE_MARKET_DATA, notes='tickers updated: 5; market closed, no history')
+
+		count_reset, count_archived, archive_date = reset_daily_percent_change.reset_daily_percent_changes(archive=True)
+		self.assertEqual((count_reset, count_archived, archive_date), (5, 4, datetime.date(2015, 6, 5)))
+		# the row the ingest already recorded is kept
+		self.assertEqual(TickerDailyPerformance.objects.get(ticker=mod, date=archive_date).percent_change, Decimal('1.00'))
+		self.assertEqual(TickerDailyPerformance.objects.filter(date=archive_date, percent_change=Decimal('9.99')).count(), 4)
+		self.assertFalse(Ticker.objects.exclude(daily_percent_change=0).exists())
+
+	def test_the_reset_archives_nothing_without_a_date(self):
+		count_reset, count_archived, archive_date = reset_daily_percent_change.reset_daily_percent_changes(archive=True)
+		self.assertEqual((count_reset, count_archived, archive_date), (5, 0, None))
+
+		Ticker.objects.update(daily_percent_change='2.50')
+		count_reset, count_archived, archive_date = reset_daily_percent_change.reset_daily_percent_changes(archive=True,
+			archive_date=datetime.date(2015, 6, 8))
+		self.assertEqual(count_archived, 5)
+		self.assertEqual(reset_daily_percent_change.get_last_trading_day(), datetime.date(2015, 6, 8))
+
+
+class FakeEarningsDateProvider(object):
+	""" answers from a dictionary of earnings dates keyed by symbol; a symbol that isn't there raises """
+
+	def __init__(self, earnings_dates_keyed_by_ticker_symbol):
+		self.earnings_dates_keyed_by_ticker_symbol = earnings_dates_keyed_by_ticker_symbol
+		self.ticker_symbols_asked_for = []
+
+	def get_earnings_announcement_date(self, ticker_symbol):
+		self.ticker_symbols_asked_for.append(ticker_symbol)
+		if ticker_symbol not in self.earnings_dates_keyed_by_ticker_symbol:
+			raise ValueError('no earnings date for %s' % ticker_symbol)
+		return self.earnings_dates_keyed_by_ticker_symbol[ticker_symbol]
+
+
+class EarningsAnnouncementDatesTests(TestCase):
+
+	def setUp(self):
+		self.today = datetime.date.today()
+		days = lambda n: self.today + datetime.timedelta(days=n)
+		# no date yet; passed; coming up soon; far enough off to skip
+		for ticker_symbol, earnings_announcement in [('NONE', None), ('PAST', days(-3)), ('SOON', days(10)), ('FAR', days(60))]:
+			Ticker.objects.create(ticker_symbol=ticker_symbol, exchange_symbol='NYSE', percent_change_historical=0,
+				earnings_announcement=earnings_announcement)
+
+	def test_skips_the_tickers_whose_date_is_far_off(self):
+		self.assertEqual([t.ticker_symbol for t in update_earnings_announcement_dates.get_tickers_to_refresh()], ['NONE', 'PAST', 'SOON'])
+		self.assertEqual([t.ticker_symbol for t in update_earnings_announcement_dates.get_tickers_to_refresh(include_all=True)],
+			['FAR', 'NONE', 'PAST', 'SOON'])
+		# right on the edge still counts as coming up
+		Ticker.objects.filter(ticker_symbol='FAR').update(earnings_announcement=self.today + datetime.timedelta(
+			days=update_earnings_announcement_dates.skip_if_days_away))
+		self.assertIn('FAR', [t.ticker_symbol for t in update_earnings_announcement_dates.get_tickers_to_refresh()])
+
+	def test_writes_only_the_dates_that_changed(self):
+		soon = Ticker.objects.get(ticker_symbol='SOON').earnings_announcement
+		next_quarter = self.today + datetime.timedelta(days=90)
+		provider = FakeEarningsDateProvider({'NONE': next_quarter, 'SOON': soon, 'FAR': next_quarter})
+
+		with CaptureQueriesContext(connection) as queries:
+			results = update_earnings_announcement_dates.update_earnings_announcement_dates(provider=provider, max_workers=2)
+
+		# FAR isn't asked about; PAST errors; SOON hasn't moved
+		self.assertEqual(sorted(provider.ticker_symbols_asked_for), ['NONE', 'PAST', 'SOON'])
+		self.assertEqual(results, (3, 1, set(['PAST'])))
+		updates = [q for q in queries.captured_queries if 'UPDATE ' in q['sql']]
+		self.assertEqual(len(updates), 1)
+		self.assertEqual(dict(Ticker.objects.values_list('ticker_symbol', 'earnings_announcement')), {
+			'NONE': next_quarter, 'PAST': self.today - datetime.timedelta(days=3), 'SOON': soon,
+			'FAR': self.today + datetime.timedelta(days=60)})
+
+	def test_nothing_changed_means_no_update(self):
+		provider = FakeEarningsDateProvider(dict(Ticker.objects.values_list('ticker_symbol', 'earnings_announcement')))
+		with CaptureQueriesContext(connection) as queries:
+			results = update_earnings_announcement_dates.update_earnings_announcement_dates(provider=provider)
+		self.assertEqual(results, (3, 0, set()))
+		self.assertFalse([q for q in queries.captured_queries if 'UPDATE ' in q['sql']])
+
+	def test_reads_quandls_date_format(self):
+		provider = update_earnings_announcement_dates.QuandlEarningsDateProvider(
+			transport=FakeTransport([json.dumps({'data': [['2015-06-01', 20150727.0]]})]), auth_token='token')
+		self.assertEqual(provider.get_earnings_announcement_date('AAPL'), datetime.date(2015, 7, 27))
+		self.assertTrue(provider.transport.urls[0].endswith('/ZEA/AAPL.json?column=4&auth_token=token'))
+
+
+class FakeLeadsTransport(object):
+	"""
+	answers leads queries from a dictionary of follower counts keyed by symbol: one ticker gets the one-ticker shape;
+	a batch gets a list of objects, but only for the symbols in batch_symbols (the rest it leaves out)
+	"""
+
+	def __init__(self, num_followers_keyed_by_ticker_symbol, batch_symbols=()):
+		self.num_followers_keyed_by_ticker_symbol = num_followers_keyed_by_ticker_symbol
+		self.batch_symbols = set(batch_symbols)
+		self.ticker_symbols_asked_for = []
+
+	def get(self, url, headers=None, timeout=None):
+		ticker_symbols = urlparse.parse_qs(urlparse.urlsplit(url).query)['tickers'][0].split(',')
+		self.ticker_symbols_asked_for.append(ticker_symbols)
+		if len(ticker_symbols) == 1:
+			return json.dumps({'SubscribersFollowingTicker': self.num_followers_keyed_by_ticker_symbol[ticker_symbols[0]]})
+		return json.dumps([{'Ticker': ts, 'SubscribersFollowingTicker': self.num_followers_keyed_by_ticker_symbol[ts]}
+			for ts in ticker_symbols if ts in self.batch_symbols])
+
+
+class NumFollowersTests(TestCase):
+
+	def test_parses_the_one_ticker_response(self):
+		parse_num_followers = update_num_followers.parse_num_followers
+		self.assertEqual(parse_num_followers({'SubscribersFollowingTicker': 12}, ['AAPL']), {'AAPL': 12})
+		# for several tickers, a single number might be their total
+		self.assertEqual(parse_num_followers({'SubscribersFollowingTicker': 12}, ['AAPL', 'SBUX']), {})
+		self.assertEqual(parse_num_followers({'SubscribersFollowingTicker': True}, ['AAPL']), {})
+		self.assertEqual(parse_num_followers({'SubscribersFollowingTicker': '12'}, ['AAPL']), {})
+
+	def test_parses_counts_keyed_by_ticker(self):
+		parse_num_followers = update_num_followers.parse_num_followers
+		expected = {'AAPL': 12, 'SBUX': 3}
+		self.assertEqual(parse_num_followers({'AAPL': 12, 'sbux': 3, 'MSFT': 4, 'GOOG': 'n/a'}, ['AAPL', 'SBUX', 'GOOG']), expected)
+		self.assertEqual(parse_num_followers({'SubscribersFollowingTicker': {'AAPL': 12, 'SBUX': 3}}, ['AAPL', 'SBUX']), expected)
+
+	def test_parses_a_list_of_counts(self):
+		parse_num_followers = update_num_followers.parse_num_followers
+		json_response = [
+			{'Ticker': 'AAPL', 'SubscribersFollowingTicker': 12},
+			{'TickerSymbol': 'sbux', 'SubscribersFollowingTicker': 3},
+			{'Symbol': 'GOOG', 'SubscribersFollowingTicker': None},
+			{'SubscribersFollowingTicker': 7},
+			'MSFT',
+		]
+		self.assertEqual(parse_num_followers(json_response, ['AAPL', 'SBUX', 'GOOG', 'MSFT']), {'AAPL': 12, 'SBUX': 3})
+		self.assertEqual(parse_num_followers({'SubscribersFollowingTicker': json_response}, ['AAPL']), {'AAPL': 12})
+		self.assertEqual(parse_num_followers('nothing useful', ['AAPL']), {})
+
+	def test_asks_one_at_a_time_for_the_tickers_a_batch_leaves_out(self):
+		Ticker.objects.bulk_create([Ticker(ticker_symbol=ticker_symbol, exchange_symbol='NYSE', percent_change_historical=0, num_followers=5)
+			for ticker_symbol in ['AAPL', 'GOOG', 'MSFT', 'SBUX']])
+		transport = FakeLeadsTransport({'AAPL': 12, 'GOOG': 5, 'MSFT': 7, 'SBUX': 3}, batch_symbols=['AAPL', 'GOOG', 'SBUX'])
+		provider = update_num_followers.LeadsFollowerCountProvider(transport=transport)
+
+		with CaptureQueriesContext(connection) as queries:
+			results = update_num_followers.update_num_followers(provider=provider, batch_size=2, max_workers=2)
+
+		# AAPL, GOOG and SBUX came from batches; MSFT was asked for on its own; GOOG hasn't changed
+		self.assertEqual(results, (4, 3, 3, set()))
+		self.assertEqual(sorted(transport.ticker_symbols_asked_for), [['AAPL', 'GOOG'], ['MSFT'], ['MSFT', 'SBUX']])
+		self.assertEqual(len([q for q in queries.captured_queries if 'UPDATE ' in q['sql']]), 1)
+		self.assertEqual(dict(Ticker.objects.values_list('ticker_symbol', 'num_followers')), {'AAPL': 12, 'GOOG': 5, 'MSFT': 7, 'SBUX': 3})
+
+	def test_one_at_a_time_by_default(self):
+		Ticker.objects.create(ticker_symbol='AAPL', exchange_symbol='NYSE', percent_change_historical=0)
+		transport = FakeLeadsTransport({'AAPL': 12})
+		results = update_num_followers.update_num_followers(provider=update_num_followers.LeadsFollowerCountProvider(transport=transport))
+		self.assertEqual(results, (1, 0, 1, set()))
+		self.assertEqual(transport.ticker_symbols_asked_for, [['AAPL']])
+
+
+class TickerLookupTests(TestCase):
+
+	def setUp(self):
+		cache.clear()
+		invalidate_ticker_symbols()
+		stock_advisor = Service.objects.create(name='stock-advisor', pretty_name='Stock Advisor')
+		rule_breakers = Service.objects.create(name='rule-breakers', pretty_name='Rule Breakers')
+		aapl = Ticker.objects.create(ticker_symbol='AAPL', exchange_symbol='NASDAQ', percent_change_historical=0, tier=1,
+			company_name='Apple', daily_percent_change='1.25')
+		aapl.covering_services.add(stock_advisor, rule_breakers)
+		Ticker.objects.create(ticker_symbol='SBUX', exchange_symbol='NASDAQ', percent_change_historical=0)
+
+	def lookup(self, query_string, **headers):
+		return self.client.get(reverse('json_blob') + '?' + query_string, **headers)
+
+	def test_repeated_lookups_dont_query(self):
+		self.assertEqual(json.loads(self.lookup('tickers=aapl, nope,SBUX').content), {'AAPL': True, 'NOPE': False, 'SBUX': True})
+		with self.assertNumQueries(0):
+			self.lookup('tickers=AAPL,MSFT')
+
+	def test_an_empty_symbol_is_unknown(self):
+		self.assertEqual(json.loads(self.lookup('tickers=').content), {'': False})
+		self.assertEqual(json.loads(self.lookup('tickers=AAPL,').content), {'': False, 'AAPL': True})
+
+	def test_details_list_the_covering_services(self):
+		content = json.loads(self.lookup('tickers=AAPL,SBUX,NOPE&details=1').content)
+		self.assertEqual(content['AAPL']['services'], ['Rule Breakers', 'Stock Advisor'])
+		self.assertEqual(content['AAPL']['daily_percent_change'], 1.25)
+		self.assertEqual(content['SBUX']['services'], [])
+		self.assertEqual(content['NOPE'], False)
+
+	def test_not_modified_only_for_an_exact_tag(self):
+		etag = self.lookup('tickers=AAPL')['ETag']
+		self.assertEqual(self.lookup('tickers=AAPL', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+		self.assertEqual(self.lookup('tickers=AAPL', HTTP_IF_NONE_MATCH='"abc", W/%s' % etag).status_code, 304)
+		self.assertEqual(self.lookup('tickers=AAPL', HTTP_IF_NONE_MATCH='*').status_code, 304)
+		# a tag that merely contains ours, or ours unquoted, is some other tag
+		self.assertEqual(self.lookup('tickers=AAPL', HTTP_IF_NONE_MATCH='"x%s"' % etag.strip('"')).status_code, 200)
+		self.assertEqual(self.lookup('tickers=AAPL', HTTP_IF_NONE_MATCH=etag.strip('"')).status_code, 200)
+
+
+class FakeNapiTransport(object):
+	""" answers article queries with pages of the given articles (newest first), as the API would page them """
+
+	def __init__(self, articles_json):
+		self.articles_json = articles_json
+		self.urls = []
+
+	def get(self, url, headers=None, timeout=None):
+		self.urls.append(url)
+		query = urlparse.parse_qs(urlparse.urlsplit(url).query)
+		start, stop = int(query['start'][0]), int(query['stop'][0])
+		return json.dumps({'results': self.articles_json[start:stop+1]})
+
+
+class ImportTickTakeTests(TestCase):
+
+	def setUp(self):
+		invalidate_ticker_symbols()
+		self.stock_advisor = Service.objects.create(name='stock-advisor', pretty_name='Stock Advisor')
+		self.scorecard = Scorecard.objects.create(name='sa', pretty_name='SA Core', service=self.stock_advisor)
+		# AAPL was on the scorecard last time; SBUX and the rest weren't
+		Ticker.objects.create(ticker_symbol='AAPL', exchange_symbol='NASDAQ', percent_change_historical=0,
+			scorecards_for_ticker='SA Core', services_for_ticker='Stock Advisor')
+		Ticker.objects.bulk_create([Ticker(ticker_symbol=ticker_symbol, exchange_symbol='NASDAQ', percent_change_historical=0)
+			for ticker_symbol in ['SBUX', 'MSFT', 'GOOG']])
+
+	def get_open_position(self, ticker_symbol):
+		return {'UnderlyingTickerSymbol': '', 'TickerSymbol': ticker_symbol, 'InstrumentId': 1, 'ExchangeSymbol': 'NYSE',
+			'CompanyName': ticker_symbol + ' Inc', 'IsCore': True, 'IsFirst': False, 'IsNewest': False, 'Action': 'Buy',
+			'OpenDate': '2015-06-01T00:00:00'}
+
+	def test_touches_only_the_tickers_on_a_scorecard_now_or_last_time(self):
+		with CaptureQueriesContext(connection) as queries:
+			notes = import_tick_take.save_open_positions([(self.scorecard,
+				[self.get_open_position('SBUX'), self.get_open_position('NEWCO')])])
+
+		self.assertEqual(notes, 'service takes: 2; new tickers: 1; tickers updated: 3; ticker/service memberships: 2')
+		self.assertEqual(list(Ticker.objects.order_by('ticker_symbol').values_list('ticker_symbol', 'scorecards_for_ticker')),
+			[('AAPL', None), ('GOOG', None), ('MSFT', None), ('NEWCO', 'SA Core'), ('SBUX', 'SA Core')])
+		# no query reads every ticker
+		ticker_table = Ticker._meta.db_table
+		self.assertFalse([q for q in queries.captured_queries
+			if 'SELECT ' in q['sql'] and 'FROM "%s"' % ticker_table in q['sql'] and 'WHERE' not in q['sql']])
+
+
+class ImportArticlesTests(TestCase):
+
+	def setUp(self):
+		cache.clear()
+		self.aapl = Ticker.objects.create(ticker_symbol='AAPL', exchange_symbol='NASDAQ', percent_change_historical=0, instrument_id=101)
+		Service.objects.create(name='stock_advisor', pretty_name='Stock Advisor')
+
+		self.original_page_size = import_articles.num_articles_to_retrieve
+		self.original_max_pages = import_articles.max_pages_per_run
+		import_articles.num_articles_to_retrieve = 3
+		import_articles.max_pages_per_run = 3
+
+		# ten articles, an hour apart, newest first; the odd ones are about a ticker we don't have
+		self.articles_json = [self.get_article_json(i, instrument_id=101 if i % 2 == 0 else 999) for i in range(10)]
+
+	def tearDown(self):
+		import_articles.num_articles_to_retrieve = self.original_page_size
+		import_articles.max_pages_per_run = self.original_max_pages
+
+	def get_article_json(self, i, instrument_id):
+		publish_at = datetime.datetime(2015, 6, 5, 20) - datetime.timedelta(hours=i)
+		return {
+			'headline': 'article %d' % i,
+			'byline': 'Tom',
+			'publish_at': publish_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+			'service': {'slug': 'stock-advisor'},
+			'legacy_uri': '/premium/%d' % i,
+			'tags': [{'slug': 'earnings-preview'}],
+			'tickers': [{'instrument_id': instrument_id}],
+		}
+
+	def get_publish_date(self, i):
+		return import_articles._get_publish_date(self.articles_json[i])
+
+	def test_pages_back_to_where_the_last_run_left_off(self):
+		transport = FakeNapiTransport(self.articles_json)
+		notes, data_through = import_articles.get_articles(since=self.get_publish_date(4), transport=transport)
+
+		# articles 0-2, then 3-5: article 5 is older than where we left off
+		self.assertEqual(len(transport.urls), 2)
+		self.assertEqual(sorted(Article.objects.values_list('title', flat=True)), ['article 0', 'article 2', 'article 4'])
+		self.assertEqual(data_through, self.get_publish_date(0))
+		self.assertNotIn('page limit', notes)
+
+	def test_stops_at_the_end_of_the_feed(self):
+		transport = FakeNapiTransport(self.articles_json[:5])
+		notes, data_through = import_articles.get_articles(since=self.get_publish_date(0) - datetime.timedelta(days=30), transport=transport)
+		# a short second page
+		self.assertEqual(len(transport.urls), 2)
+		self.assertEqual(Article.objects.count(), 3)
+
+	def test_moves_on_even_if_no_new_article_is_kept(self):
+		# only articles about tickers we don't have since the last run
+		DataHarvestEventLog.objects.create(data_type=DATA_HARVEST_TYPE_ARTICLES, succeeded=True, data_through=self.get_publish_date(4))
+		transport = FakeNapiTransport(self.articles_json[1::2])
+		notes, data_through = import_articles.get_articles(transport=transport)
+		self.assertEqual(len(transport.urls), 1)
+		self.assertFalse(Article.objects.exists())
+		self.assertEqual(data_through, self.get_publish_date(1))
+
+		# so the next run stops on its first page, rather than paging back to the newest article we kept
+		DataHarvestEventLog.objects.create(data_type=DATA_HARVEST_TYPE_ARTICLES, succeeded=True, data_through=data_through)
+		self.assertEqual(import_articles.get_last_run_data_through(), self.get_publish_date(1))
+
+	def test_says_so_when_the_page_limit_cuts_a_run_short(self):
+		transport = FakeNapiTransport(self.articles_json)
+		notes, data_through = import_articles.get_articles(since=self.get_publish_date(9) - datetime.timedelta(days=1), transport=transport)
+		self.assertEqual(len(transport.urls), 3)
+		self.assertIn('page limit reached', notes)
+		self.assertEqual(data_through, self.get_publish_date(0))
+
+	def test_first_run_picks_up_from_the_newest_article(self):
+		self.assertEqual(import_articles.get_last_run_data_through(), None)
+		Article.objects.create(title='old', author='Tom', url='www.fool.com/old', date_pub=self.get_publish_date(6),
+			service=Service.objects.get(), ticker=self.aapl)
+		self.assertEqual(import_articles.get_last_run_data_through(), self.get_publish_date(6))
+
+
+class CachedValueTests(TestCase):
+
+	def setUp(self):
+		cache.clear()
+		# and this process's own copy
+		invalidate_ticker_symbols()
+
+	def test_loads_once_into_the_shared_cache(self):
+		loads = []
+		def load_answer():
+			loads.append(1)
+			return None
+
+		answer = CachedValue(load_answer, key='satellite.test_answer')
+		self.assertEqual(answer.get(), None)
+		self.assertEqual(answer.get(), None)
+		self.assertEqual(len(loads), 1)
+		# in the django cache, where every process can see (and drop) it
+		self.assertEqual(cache.get('satellite.test_answer'), (None,))
+
+		answer.invalidate()
+		self.assertEqual(cache.get('satellite.test_answer'), None)
+		answer.get()
+		self.assertEqual(len(loads), 2)
+
+	def test_a_local_copy_outlives_other_processes_invalidations_until_it_expires(self):
+		answers = [1, 2, 3]
+		def load_answer():
+			return answers.pop(0)
+
+		answer = CachedValue(load_answer, key='satellite.test_answer', local_max_age_in_seconds=0.2)
+		self.assertEqual(answer.get(), 1)
+		# another process invalidates: it can only drop the shared copy
+		cache.delete('satellite.test_answer')
+		with self.assertNumQueries(0):
+			self.assertEqual(answer.get(), 1)
+		time.sleep(0.25)
+		self.assertEqual(answer.get(), 2)
+		# an invalidate() in this process drops both at once
+		answer.invalidate()
+		self.assertEqual(answer.get(), 3)
+
+	def test_ticker_symbols_follow_ticker_changes(self):
+		self.assertEqual(get_ticker_symbols(), frozenset())
+		Ticker.objects.bulk_create([Ticker(ticker_symbol='AAPL', exchange_symbol='NASDAQ', percent_change_historical=0)])
+		# bulk_create sends no signal; the cached set holds until someone invalidates it
+		self.assertEqual(get_ticker_symbols(), frozenset())
+		invalidate_ticker_symbols()
+		self.assertEqual(get_ticker_symbols(), frozenset(['AAPL']))
+
+		Ticker.objects.create(ticker_symbol='SBUX', exchange_symbol='NASDAQ', percent_change_historical=0)
+		self.assertEqual(get_ticker_symbols(), frozenset(['AAPL', 'SBUX']))
+
+
+class PurgeOldArticlesTests(TestCase):
+
+	def setUp(self):
+		cache.clear()
+		self.ticker = Ticker.objects.create(ticker_symbol='AAPL', exchange_symbol='NASDAQ', percent_change_historical=0)
+		self.service = Service.objects.create(name='stock-advisor', pretty_name='Stock Advisor')
+		now = timezone.now()
+		self.add_articles('old', 25, now - datetime.timedelta(days=150))
+		self.add_articles('new', 5, now - datetime.timedelta(days=1))
+
+	def add_articles(self, prefix, count, date_pub):
+		Article.objects.bulk_create([Article(title='%s %d' % (prefix, i), author='Tom', url='www.fool.com/%s/%d' % (prefix, i),
+			date_pub=date_pub, service=self.service, ticker=self.ticker) for i in range(count)])
+
+	def test_deletes_a_batch_per_statement(self):
+		# the services; per batch, one read of ids and one DELETE (3 batches, then an empty read); one cache delete
+		with self.assertNumQueries(1 + 3 * 2 + 1 + 1):
+			counts_keyed_by_service = purge_old_articles.purge_old_articles(batch_size=10)
+		self.assertEqual(counts_keyed_by_service, {self.service: 25})
+		self.assertEqual(Article.objects.count(), 5)
+
+	def test_keeps_what_the_service_says_to_and_undated_articles(self):
+		rule_breakers = Service.objects.create(name='rule-breakers', pretty_name='Rule Breakers', article_retention_days=200)
+		Article.objects.create(title='kept', author='Tom', url='www.fool.com/kept', service=rule_breakers, ticker=self.ticker,
+			date_pub=timezone.now() - datetime.timedelta(days=150))
+		self.add_articles('undated', 2, None)
+
+		counts_keyed_by_service = purge_old_articles.purge_old_articles(batch_size=10)
+		self.assertEqual(counts_keyed_by_service, {self.service: 25, rule_breakers: 0})
+		self.assertEqual(Article.objects.filter(title__startswith='old').count(), 0)
+		self.assertEqual(Article.objects.count(), 5 + 1 + 2)
+
+	def test_dry_run_only_counts(self):
+		with CaptureQueriesContext(connection) as queries:
+			counts_keyed_by_service = purge_old_articles.purge_old_articles(dry_run=True, batch_size=10)
+		self.assertEqual(counts_keyed_by_service, {self.service: 25})
+		self.assertEqual(Article.objects.count(), 30)
+		# the services, then one count per service; nothing deleted, not even from the cache
+		self.assertEqual(len(queries.captured_queries), 2)
+
+		call_command('purge_old_articles', dry_run=True)
+		self.assertEqual(Article.objects.count(), 30)
+		self.assertEqual(DataHarvestEventLog.objects.get(data_type=DATA_HARVEST_TYPE_ARTICLE_PURGE).notes,
+			'dry run; articles to delete: 25; Stock Advisor: 25')
+
+	def test_command_logs_what_it_deleted(self):
+		call_command('purge_old_articles', batch_size=10)
+		self.assertEqual(Article.objects.count(), 5)
+		self.assertEqual(DataHarvestEventLog.objects.get(data_type=DATA_HARVEST_TYPE_ARTICLE_PURGE).notes,
+			'articles deleted: 25; Stock Advisor: 25')
+
+
+class BylineMetaDataTests(TestCase):
+
+	def setUp(self):
+		cache.clear()
+		self.now = timezone.now()
+		self.aapl = Ticker.objects.create(ticker_symbol='AAPL', exchange_symbol='NASDAQ', percent_change_historical=0)
+		self.sbux = Ticker.objects.create(ticker_symbol='SBUX', exchange_symbol='NASDAQ', percent_change_historical=0)
+		self.stock_advisor = Service.objects.create(name='stock-advisor', pretty_name='Stock Advisor')
+		self.rule_breakers = Service.objects.create(name='rule-breakers', pretty_name='Rule Breakers')
+
+		self.add_article('Tom', self.aapl, self.stock_advisor, days_ago=100)
+		self.add_article('Ann', self.sbux, self.rule_breakers, days_ago=364)
+		self.add_article('Bob', self.sbux, self.stock_advisor, days_ago=200)
+		update_byline_meta_data.rebuild_byline_meta_data()
+
+	def add_article(self, author, ticker, service, days_ago):
+		Article.objects.create(title='%s on %s' % (author, ticker), author=author, url='www.fool.com/%s/%d' % (author, Article.objects.count()),
+			date_pub=self.now - datetime.timedelta(days=days_ago), ticker=ticker, service=service)
+
+	def get_byline_meta_data(self):
+		return dict([(b.byline, (b.services, b.tickers)) for b in BylineMetaData.objects.all()])
+
+	def test_recompiles_only_the_authors_touched_since(self):
+		# since the last run, two days ago: Tom has published again, and Ann's only article has turned a year old
+		since = self.now - datetime.timedelta(days=2)
+		self.add_article('Tom', self.sbux, self.rule_breakers, days_ago=1)
+		Article.objects.filter(author='Ann').update(date_pub=self.now - datetime.timedelta(days=366))
+		# Bob's is changed behind our back, so it shows whether Bob was recompiled
+		BylineMetaData.objects.filter(byline='Bob').update(tickers='AAPL')
+
+		self.assertEqual(update_byline_meta_data.get_authors_touched_since(since, self.now), set(['Tom', 'Ann']))
+		self.assertEqual(update_byline_meta_data.update_byline_meta_data(since), (2, 2, 0))
+		self.assertEqual(self.get_byline_meta_data(), {
+			'Tom': ('Rule Breakers, Stock Advisor', 'AAPL, SBUX'),
+			'Ann': (update_byline_meta_data.NOTHING_IN_THE_LAST_YEAR, update_byline_meta_data.NOTHING_IN_THE_LAST_YEAR),
+			'Bob': ('Stock Advisor', 'AAPL'),
+		})
+
+	def test_the_command_picks_incremental_unless_a_purge_ran(self):
+		call_command('update_byline_meta_data')
+		first_run = DataHarvestEventLog.objects.get(data_type=DATA_HARVEST_TYPE_BYLINE_META_DATA)
+		self.assertTrue(first_run.succeeded)
+		self.assertTrue(first_run.notes.startswith('full rebuild, no earlier run'))
+
+		# a failed run doesn't count as the last one
+		DataHarvestEventLog.objects.create(data_type=DATA_HARVEST_TYPE_BYLINE_META_DATA, succeeded=False)
+		self.assertEqual(update_byline_meta_data.get_last_run_started(), first_run.date_started)
+
+		call_command('update_byline_meta_data')
+		self.assertTrue(DataHarvestEventLog.objects.filter(data_type=DATA_HARVEST_TYPE_BYLINE_META_DATA).first().notes.startswith('changes since'))
+
+		# whatever a purge's notes say
+		DataHarvestEventLog.objects.create(data_type=DATA_HARVEST_TYPE_ARTICLE_PURGE, notes='dry run; articles to delete: 0')
+		call_command('update_byline_meta_data')
+		self.assertTrue(DataHarvestEventLog.objects.filter(data_type=DATA_HARVEST_TYPE_BYLINE_META_DATA).first().notes.startswith(
+			'full rebuild, article purge'))
+
+
+class ArticlesIndexStatsTests(TestCase):
+
+	def setUp(self):
+		cache.clear()
+		ticker = Ticker.objects.create(ticker_symbol='AAPL', exchange_symbol='NASDAQ', percent_change_historical=0)
+		service = Service.objects.create(name='stock-advisor', pretty_name='Stock Advisor')
+		date_pub = timezone.make_aware(datetime.datetime(2015, 6, 5, 12), timezone.get_current_timezone())
+		Article.objects.bulk_create([Article(title='article %d' % i, author='author %d' % (i % 2), url='www.fool.com/%d' % i,
+			date_pub=date_pub - datetime.timedelta(hours=i), service=service, ticker=ticker) for i in range(3)])
+		Article.objects.create(title='undated', author='someone else', url='www.fool.com/undated', service=service, ticker=ticker)
+
+	def test_keyset_stats_leave_out_undated_articles(self):
+		response = self.client.get(reverse('articles_index'), {'paging': 'keyset'})
+		self.assertEqual(response.context['num_articles'], 3)
+		self.assertEqual(response.context['num_authors'], 2)
+
+		response = self.client.get(reverse('articles_index'))
+		self.assertEqual(response.context['num_articles'], 4)
+
+	def test_later_keyset_pages_reuse_the_first_pages_stats(self):
+		self.client.get(reverse('articles_index'), {'paging': 'keyset'})
+		Article.objects.filter(title='article 0').delete()
+
+		article = Article.objects.get(title='article 1')
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(reverse('articles_index'), {'cursor': encode_cursor(article.date_pub, article.id)})
+		self.assertEqual(response.context['num_articles'], 3)
+		self.assertFalse([q for q in queries.captured_queries if 'COUNT(' in q['sql']])
+
+	def test_page_number_paging_counts_once_and_leaves_the_cache_alone(self):
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(reverse('articles_index'))
+		self.assertEqual(response.context['num_articles'], 4)
+		self.assertEqual(response.context['articles'].paginator.count, 4)
+		# the stats' aggregate is the only count
+		self.assertEqual(len([q for q in queries.captured_queries if 'COUNT(' in q['sql']]), 1)
+		self.assertFalse([q for q in queries.captured_queries if 'satellite_cache' in q['sql']])
+
+
+class ServiceOverviewTests(TestCase):
+
+	def setUp(self):
+		self.stock_advisor = Service.objects.create(name='stock-advisor', pretty_name='Stock Advisor')
+		self.rule_breakers = Service.objects.create(name='rule-breakers', pretty_name='Rule Breakers')
+		Service.objects.create(name='supernova', pretty_name='Supernova')  # covers nothing, has no articles
+
+		tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+		Ticker.objects.bulk_create([Ticker(ticker_symbol='T%02d' % i, exchange_symbol='NYSE', percent_change_historical=0,
+			daily_percent_change=i - 12, earnings_announcement=tomorrow + datetime.timedelta(days=25 - i)) for i in range(25)])
+		Membership = Ticker.covering_services.through
+		Membership.objects.bulk_create([Membership(ticker_id=t.id, service_id=self.stock_advisor.id) for t in Ticker.objects.all()] +
+			[Membership(ticker_id=t.id, service_id=self.rule_breakers.id) for t in Ticker.objects.filter(ticker_symbol__lt='T03')])
+
+		# the same title twice (one article, two tickers), then six more
+		now = timezone.now()
+		ticker = Ticker.objects.get(ticker_symbol='T00')
+		Article.objects.bulk_create([Article(title='article %d' % max(i - 1, 0), author='Tom', url='www.fool.com/%d' % i,
+			date_pub=now - datetime.timedelta(hours=i), service=self.stock_advisor, ticker=ticker) for i in range(8)])
+
+	def test_a_fixed_number_of_queries(self):
+		with self.assertNumQueries(4):
+			overviews = _get_service_overviews()
+
+		# (in the order of the Service table: by pretty name)
+		self.assertEqual([o['service'] for o in overviews], [self.rule_breakers, self.stock_advisor])
+		rule_breakers_overview, stock_advisor_overview = overviews
+
+		self.assertEqual([t.ticker_symbol for t in stock_advisor_overview['gainers']], ['T%02d' % i for i in range(24, 14, -1)])
+		self.assertEqual([t.ticker_symbol for t in stock_advisor_overview['losers']], ['T%02d' % i for i in range(10)])
+		# soonest first
+		self.assertEqual([t.ticker_symbol for t in stock_advisor_overview['earnings']], ['T%02d' % i for i in range(24, 14, -1)])
+		self.assertEqual([t.ticker_symbol for t in rule_breakers_overview['earnings']], ['T02', 'T01', 'T00'])
+
+		# the newest 5, one per title
+		self.assertEqual([a['title'] for a in stock_advisor_overview['articles']], ['article %d' % i for i in range(5)])
+		self.assertEqual(rule_breakers_overview['articles'], [])
+
+
+class FlaggedRecsTests(TestCase):
+
+	def setUp(self):
+		stock_advisor = Service.objects.create(name='stock-advisor', pretty_name='Stock Advisor')
+		self.sa_core = Scorecard.objects.create(name='sa', pretty_name='SA Core', service=stock_advisor)
+		self.sa_new = Scorecard.objects.create(name='sa-new', pretty_name='SA New', service=stock_advisor)
+		self.aapl = Ticker.objects.create(ticker_symbol='AAPL', exchange_symbol='NASDAQ', percent_change_historical=0, company_name='Apple')
+		self.sbux = Ticker.objects.create(ticker_symbol='SBUX', exchange_symbol='NASDAQ', percent_change_historical=0, company_name='Starbucks')
+		self.msft = Ticker.objects.create(ticker_symbol='MSFT', exchange_symbol='NASDAQ', percent_change_historical=0)
+
+	def add_service_take(self, ticker, scorecard, open_date, **flags):
+		ServiceTake.objects.create(ticker=ticker, scorecard=scorecard, action='Buy', open_date=open_date, **flags)
+
+	def test_one_profile_per_ticker_and_scorecard(self):
+		# created out of order, so the grouping can't lean on insertion order
+		self.add_service_take(self.sbux, self.sa_core, datetime.date(2015, 1, 2), is_core=True)
+		self.add_service_take(self.aapl, self.sa_new, datetime.date(2015, 3, 1), is_newest=True)
+		self.add_service_take(self.aapl, self.sa_core, datetime.date(2014, 5, 1), is_first=True)
+		self.add_service_take(self.aapl, self.sa_core, datetime.date(2015, 2, 1), is_first=True)
+		self.add_service_take(self.aapl, self.sa_core, datetime.date(2015, 2, 1), is_first=True)
+		self.add_service_take(self.aapl, self.sa_core, None, is_first=True)
+		# not flagged at all
+		self.add_service_take(self.msft, self.sa_core, datetime.date(2015, 1, 1))
+
+		with self.assertNumQueries(3):
+			profiles = list(_iter_profiles_of_flagged_recs())
+
+		self.assertEqual([(p['ticker_symbol'], p['scorecard_pretty_name']) for p in profiles],
+			[('AAPL', 'SA Core'), ('AAPL', 'SA New'), ('SBUX', 'SA Core')])
+		aapl_core, aapl_new, sbux_core = profiles
+		# newest first, without repeats
+		self.assertEqual(aapl_core['open_dates'], '2015-02-01<br/>2014-05-01')
+		self.assertEqual((aapl_core['is_first'], aapl_core['is_core'], aapl_core['is_new']), (True, False, False))
+		self.assertEqual((aapl_new['is_new'], aapl_new['company'], aapl_new['service_pretty_name']), (True, 'Apple', 'Stock Advisor'))
+		self.assertEqual((sbux_core['is_core'], sbux_core['open_dates']), (True, '2015-01-02'))
+
+
+class CoverageDetailTests(TestCase):
+
+	def setUp(self):
+		cache.clear()
+		self.ticker = Ticker.objects.create(ticker_symbol='AAPL', exchange_symbol='NASDAQ', percent_change_historical=0, company_name='Apple')
+		self.stock_advisor = Service.objects.create(name='stock-advisor', pretty_name='Stock Advisor')
+		self.rule_breakers = Service.objects.create(name='rule-breakers', pretty_name='Rule Breakers')
+		self.ticker.covering_services.add(self.stock_advisor, self.rule_breakers)
+		CoverageType.objects.create(ticker=self.ticker, service=self.stock_advisor, coverage_type=1, author='Tom')
+		BylineMetaData.objects.create(byline='Tom', services='Stock Advisor')
+
+	def add_articles(self, num_articles, days_ago=1):
+		date_pub = timezone.now() - datetime.timedelta(days=days_ago)
+		num_existing = Article.objects.count()
+		Article.objects.bulk_create([Article(title='article %d' % i, author='Tom', url='www.fool.com/%d' % i, date_pub=date_pub,
+			tags='10 promise, earnings', service=[self.stock_advisor, self.rule_breakers][i % 2], ticker=self.ticker)
+			for i in range(num_existing, num_existing + num_articles)])
+
+	def get_page(self):
+		return self.client.get(reverse('coverage_detail', args=[self.ticker.ticker_symbol]))
+
+	def test_queries_dont_grow_with_the_articles(self):
+		self.add_articles(2)
+		self.get_page()  # fills the caches
+		with CaptureQueriesContext(connection) as queries:
+			self.get_page()
+		num_queries = len(queries.captured_queries)
+
+		self.add_articles(20)
+		with self.assertNumQueries(num_queries):
+			response = self.get_page()
+		self.assertEqual(len(response.context['earnings']), 22)
+
+	def test_articles_from_the_last_90_days_each_show_up_once_per_bucket(self):
+		self.add_articles(1)
+		self.add_articles(1, days_ago=89.9)
+		self.add_articles(1, days_ago=90.1)
+		response = self.get_page()
+		self.assertEqual(sorted(a.title for a in response.context['ten_percent_promises']), ['article 0', 'article 1'])
+		self.assertEqual(response.context['ten_percent_promises'], response.context['earnings'])
+		self.assertEqual(response.context['news'], set())
+
+
+class CoverageMatrixTests(TestCase):
+
+	def setUp(self):
+		self.ticker = Ticker.objects.create(ticker_symbol='AAPL', exchange_symbol='NASDAQ', percent_change_historical=0)
+		self.stock_advisor = Service.objects.create(name='stock-advisor', pretty_name='Stock Advisor')
+		self.rule_breakers = Service.objects.create(name='rule-breakers', pretty_name='Rule Breakers')
+
+	def test_pledges_without_an_author_dont_count(self):
+		CoverageType.objects.create(ticker=self.ticker, service=self.stock_advisor, coverage_type=1, author='Tom')
+		CoverageType.objects.create(ticker=self.ticker, service=self.rule_breakers, coverage_type=1, author=None)
+		CoverageType.objects.create(ticker=self.ticker, service=self.rule_breakers, coverage_type=2, author='')
+
+		coverage_matrix = CoverageMatrix.for_tickers([self.ticker])
+		self.assertEqual(coverage_matrix.get_coverage_types(self.ticker), [1])
+		self.assertEqual(coverage_matrix.get_service_names(self.ticker, 1), ['Stock Advisor'])
+		self.assertEqual(coverage_matrix.get_service_ids(self.ticker, 2), [])
+		self.assertEqual(coverage_matrix.get_author(self.ticker, 1, self.rule_breakers), None)
+
+		# nor do they in the csv
+		response = self.client.get(reverse('coverage_as_csv'))
+		self.assertEqual(''.join(response.streaming_content).splitlines()[1:], ['AAPL,,%s,Stock Advisor,Tom' % dict(COVERAGE_CHOICES)[1]])
+
+	def test_saving_an_empty_selection_leaves_no_pledge(self):
+		CoverageType.objects.create(ticker=self.ticker, service=self.stock_advisor, coverage_type=1, author='Tom')
+
+		_save_coverage_pledges(self.ticker, {
+			(1, self.stock_advisor.id): '',
+			(1, self.rule_breakers.id): '-----',
+			(2, self.rule_breakers.id): 'Tom'})
+
+		self.assertEqual(list(CoverageType.objects.filter(ticker=self.ticker).values_list('coverage_type', 'service_id', 'author')),
+			[(2, self.rule_breakers.id, u'Tom')])
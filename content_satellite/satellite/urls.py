@@ -17,5 +17,9 @@ urlpatterns = patterns('',
     url(r'^flagged_recs/$', views_2.get_flagged_recs_index, name='flagged_recs'),    
     url(r'^flagged_recs_csv/$', views_2.get_flagged_recs_as_csv, name='flagged_recs_as_csv'),
     url(r'^articles_index/$', views_2.articles_index, name='articles_index'),
+    url(r'^articles_feed/$', views_2.articles_feed, name='articles_feed'),
+    url(r'^articles_csv/$', views_2.get_articles_as_csv, name='articles_as_csv'),
+    url(r'^tickers_csv/$', views_2.get_tickers_as_csv, name='tickers_as_csv'),
+    url(r'^coverage_csv/$', views_2.get_coverage_as_csv, name='coverage_as_csv'),
     url(r'^json_blob_for_ticker/$', views_2.ticker_lookup, name='json_blob'),
     )
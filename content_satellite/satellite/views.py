@@ -3,8 +3,13 @@ from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.core.urlresolvers import reverse
 from django.shortcuts import redirect, render
 from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from cache_utils import get_single_authors, get_market_snapshot
+from db_utils import bulk_update
 from forms import FilterForm, TickerForm, CoverageTypeForm
-from models import Article, BylineMetaData, Service, Ticker, Scorecard, ServiceTake, AnalystForTicker, CoverageType, COVERAGE_CHOICES
+from models import Article, BylineMetaData, Service, Ticker, Scorecard, ServiceTake, AnalystForTicker, CoverageType, CoverageMatrix, COVERAGE_CHOICES
 
 ###############################################################################
 
@@ -13,15 +18,13 @@ def index(request):
 		'page-title': 'Welcome to the Satellite',
 	}
 
-	tickers = Ticker.objects.all().order_by('daily_percent_change')
-	gainer = tickers.reverse()[0]
-	loser = tickers[0]
-	latest = Article.objects.all().order_by('-date_pub')[0]
+	# kept in memory for a minute at most, and dropped whenever quotes or articles come in
+	market_snapshot = get_market_snapshot()
 
 	dictionary_of_values = {
-		'gainer': gainer,
-		'loser': loser,
-		'latest': latest,
+		'gainer': market_snapshot.gainer,
+		'loser': market_snapshot.loser,
+		'latest': market_snapshot.latest,
 
 	}
 
@@ -29,31 +32,53 @@ def index(request):
 
 ###############################################################################
 
-def gainers_losers(list_of_tickers):
-	tickers_sorted = sorted(list_of_tickers, key=lambda x: x.daily_percent_change, reverse = True)
-	gainers = tickers_sorted[:10]
-	losers = tickers_sorted[-10:]
-	losers.reverse()
+def _get_tiered_stocks(services=None, tier_statuses=None, ticker_symbols=None):
+	"""
+	the tickers for the tiered stocks page, as one query. every filter is optional:
+	services: only tickers that a tier has been assigned to and that at least one of these services covers
+	tier_statuses: only tickers with one of these tier statuses (eg ['core', 'first'])
+	ticker_symbols: only these tickers
+	without any filter, it's every ticker that has a tier status
+	"""
+	tiered_stocks = Ticker.objects.all()
 
-	return gainers, losers
+	if services is not None:
+		tiered_stocks = tiered_stocks.in_services(services).exclude(tier=0)
+	if tier_statuses is not None:
+		tiered_stocks = tiered_stocks.filter(tier_status__in=tier_statuses)
+	if ticker_symbols is not None:
+		tiered_stocks = tiered_stocks.filter(ticker_symbol__in=ticker_symbols)
 
-###############################################################################
+	if services is None and tier_statuses is None and ticker_symbols is None:
+		tiered_stocks = tiered_stocks.exclude(tier_status=None).exclude(tier_status='')
 
-def tiered_stocks(request):
+	return tiered_stocks
 
-	tiered_stocks = []
 
-	for t in Ticker.objects.all():
-		if t.tier:
-			tiered_stocks.append(t)
-		else:
-			print 'newp'
+def _save_ticker_notes(notes_keyed_by_ticker_symbol):
+	"""
+	write the notes of many tickers at once: one query to find the tickers, and one bulk update, in a single
+	transaction, of the ones whose notes changed. returns the number of tickers updated
+	"""
+	with transaction.atomic():
+		tickers_to_update = []
+		for t in Ticker.objects.filter(ticker_symbol__in=notes_keyed_by_ticker_symbol.keys()).only('id', 'ticker_symbol', 'notes'):
+			notes = notes_keyed_by_ticker_symbol[t.ticker_symbol]
+			if notes != (t.notes or ''):
+				t.notes = notes
+				tickers_to_update.append(t)
+
+		bulk_update(tickers_to_update, ['notes'])
+
+	return len(tickers_to_update)
+
+
+def tiered_stocks(request):
 
 	services_to_filter_by = None
 	service_filter_description = None
-	tickers_to_filter_by = None
+	ticker_symbols_to_filter_by = None
 	ticker_filter_description = None
-	service_options = Service.objects.all()
 	tiers_to_filter_by = None
 	tier_filter_description = None
 
@@ -61,6 +86,12 @@ def tiered_stocks(request):
 		tiered_filter_form = FilterForm(request.POST)
 
 		if tiered_filter_form.is_valid():
+			# only the notes form carries the tickers filter (from the url), so that saving notes keeps it
+			tickers_user_input = tiered_filter_form.cleaned_data.get('tickers', '').strip()
+			if tickers_user_input != '':
+				ticker_symbols_to_filter_by = [ts.strip().upper() for ts in tickers_user_input.split(',')]
+				ticker_filter_description = ', '.join(ticker_symbols_to_filter_by)
+
 			if 'services' in tiered_filter_form.cleaned_data:
 				if len(tiered_filter_form.cleaned_data['services']) > 0:
 					services_to_filter_by = tiered_filter_form.cleaned_data['services']
@@ -68,39 +99,31 @@ def tiered_stocks(request):
 			if 'tier_status' in tiered_filter_form.cleaned_data:
 				tiers_user_input = tiered_filter_form.cleaned_data['tier_status']
 				if len(tiers_user_input) > 0:
-					tickers_to_filter_by = _get_ticker_objects_for_tier_status(tiers_user_input)
+					tiers_to_filter_by = tiers_user_input
 
+		# the notes form: a textarea per ticker, named "ticker_notes_" + ticker symbol
 		ticker_note_name_prefix = 'ticker_notes_'
 
-		keys_of_ticker_note_data = [key_in_post_dict for key_in_post_dict in request.POST.keys() if key_in_post_dict.startswith(ticker_note_name_prefix)]
-
-		for key_of_ticker_note_data in keys_of_ticker_note_data:
-
-			ticker_id = key_of_ticker_note_data[len(ticker_note_name_prefix):]
-			print ticker_id
-			ticker_to_update = Ticker.objects.get(ticker_symbol=ticker_id)
-
-			ticker_to_update.notes = request.POST[key_of_ticker_note_data]
-			ticker_to_update.save()
-
-			print 'updated Ticker %s (id: %s). notes value: %s' % (ticker_to_update.ticker_symbol, ticker_id, ticker_to_update.notes)
+		notes_keyed_by_ticker_symbol = dict([(k[len(ticker_note_name_prefix):], request.POST[k].strip())
+			for k in request.POST.keys() if k.startswith(ticker_note_name_prefix)])
 
+		if notes_keyed_by_ticker_symbol:
+			print 'updated the notes of %d tickers' % _save_ticker_notes(notes_keyed_by_ticker_symbol)
 
 	elif request.GET:
 		initial_form_values = {}
 
 		if 'tickers' in request.GET:
 			tickers_user_input = request.GET.get('tickers')
-			tickers_to_filter_by = _get_ticker_objects_for_ticker_symbols(tickers_user_input)
+			ticker_symbols_to_filter_by = [ts.strip().upper() for ts in tickers_user_input.split(',')]
+			ticker_filter_description = ', '.join(ticker_symbols_to_filter_by)
 			initial_form_values['tickers'] = tickers_user_input
 		if 'service_ids' in request.GET:
 			services_to_filter_by = _get_service_objects_for_service_ids(request.GET.get('service_ids'))
 			initial_form_values['services'] = services_to_filter_by
 		if 'tier_status' in request.GET:
-			tiers_user_input = request.GET.get('tier_status')
-			tiers_to_filter_by = _get_ticker_objects_for_tier_status(tiers_user_input)
+			tiers_to_filter_by = [ts.strip() for ts in request.GET.get('tier_status').split(',')]
 			initial_form_values['tier_status'] = tiers_to_filter_by
-			print tiers_user_input
 
 		tiered_filter_form = FilterForm(initial=initial_form_values)
 
@@ -113,46 +136,15 @@ def tiered_stocks(request):
 		pretty_names_of_services_we_matched.sort()
 		service_filter_description = ', '.join(pretty_names_of_services_we_matched)
 
-	if tickers_to_filter_by:
-		tier_status_names = [t.tier_status for t in tickers_to_filter_by]
-		tier_status_names.sort()
-		tier_status_names = set(tier_status_names)
-		tier_filter_description = ', '.join(tier_status_names)
-
-	else:
-		pass
-
-	if tickers_to_filter_by is not None and services_to_filter_by is not None:
-		tiered_stocks = []
-		for t in tickers_to_filter_by:
-			for service in services_to_filter_by:
-				if service.pretty_name in t.services_for_ticker and t.tier is not 0:
-					tiered_stocks.append(t)
-					break
-
-	elif services_to_filter_by is not None:
-		tiered_stocks = []
-		for t in Ticker.objects.all():
-			if t.services_for_ticker is None:
-				continue
-			for service in services_to_filter_by:
-				if service.pretty_name in t.services_for_ticker and t.tier is not 0:
-					tiered_stocks.append(t)
-				break
-
-	elif tickers_to_filter_by is not None:
-		tiered_stocks = tickers_to_filter_by
-
-	else:
-		tiered_stocks = []
-		for t in Ticker.objects.all():
-			if t.tier_status:
-				tiered_stocks.append(t)
+	if tiers_to_filter_by:
+		tier_filter_description = ', '.join(sorted(set(tiers_to_filter_by)))
 
+	tiered_stocks = _get_tiered_stocks(services=services_to_filter_by, tier_statuses=tiers_to_filter_by,
+		ticker_symbols=ticker_symbols_to_filter_by)
 
 	dictionary_of_values = {
 		'tiered_stocks': tiered_stocks,
-		'tiered_filter_form': FilterForm,
+		'tiered_filter_form': tiered_filter_form,
 		'ticker_filter_description': ticker_filter_description,
 		'service_filter_description': service_filter_description,
 		'tier_filter_description': tier_filter_description,
@@ -162,266 +154,118 @@ def tiered_stocks(request):
 
 ###############################################################################
 
-def upcoming_earnings(list_of_tickers):
-	yesterday = (datetime.now() - timedelta(days=1)).date()
-	earnings = [t for t in list_of_tickers if t.earnings_announcement is not None and t.earnings_announcement > yesterday]
-	earnings = sorted(earnings, key=lambda x: x.earnings_announcement)[:10]
-
-	return earnings
-
-###############################################################################
-
-def recent_articles(list_of_articles):
-	duplicate_titles = set()
-	individual_articles = []
-	for a in list_of_articles:
-		if a.title not in duplicate_titles:
-			individual_articles.append(a)
-			duplicate_titles.add(a.title)
-	articles = sorted(individual_articles, key=lambda x: x.date_pub, reverse=True)[:5]
-
-	return articles
+# how many tickers go in each service overview list (gainers, losers, earnings), and how many recent articles
+NUM_TICKERS_PER_OVERVIEW_LIST = 10
+NUM_ARTICLES_PER_OVERVIEW = 5
+OVERVIEW_ARTICLE_WINDOW_IN_DAYS = 21
+
+def _get_service_overviews():
+	"""
+	returns a list of dictionary elements, one element per service (ordered like the Service table), with the buckets
+	the service overview page shows: the top 10 gainers, the worst 10 losers, the next 10 earnings dates, and the
+	5 most recent articles (one per title).
+
+	the number of queries is fixed, no matter how many services or tickers there are: one for the services, one for
+	the ticker/service memberships, one for the tickers (already sorted by daily % change), and one streaming pass
+	over the recent articles that stops as soon as every service has its articles.
+	"""
+	overviews = []
+	overview_by_service_id = {}
+
+	for s in Service.objects.all():
+		overview = {
+			'service': s,
+			'tickers': [],
+			'gainers': [],
+			'losers': [],
+			'earnings': [],
+			'articles': [],
+		}
+		overviews.append(overview)
+		overview_by_service_id[s.id] = overview
 
-###############################################################################
-
-def service_overview(request):
-
-	fool_one_tickers = []
-	supernova_tickers = []
-	pro_tickers = []
-	mdp_tickers = []
-	stock_advisor_tickers = []
-	hidden_gems_tickers = []
-	income_investor_tickers = []
-	rule_breakers_tickers = []
-	inside_value_tickers = []
-	special_ops_tickers = []
-	deep_value_tickers = []
-	options_tickers = []
-
-	for t in Ticker.objects.all():
-		if not t.services_for_ticker:
-			continue
-		was_processed = False
-		if 'One' in t.services_for_ticker:
-			fool_one_tickers.append(t)
-			was_processed = True
-		if 'Supernova' in t.services_for_ticker:
-			supernova_tickers.append(t)
-			was_processed = True
-		if 'Pro' in t.services_for_ticker:
-			pro_tickers.append(t)
-			was_processed = True
-		if 'MDP' in t.services_for_ticker:
-			mdp_tickers.append(t)
-			was_processed = True
-		if 'Stock Advisor' in t.services_for_ticker:
-			stock_advisor_tickers.append(t)
-			was_processed = True
-		if 'Hidden Gems' in t.services_for_ticker:
-			hidden_gems_tickers.append(t)
-			was_processed = True
-		if 'Income Investor' in t.services_for_ticker:
-			income_investor_tickers.append(t)
-			was_processed = True
-		if 'Rule Breakers' in t.services_for_ticker:
-			rule_breakers_tickers.append(t)
-			was_processed = True
-		if 'Inside Value' in t.services_for_ticker:
-			inside_value_tickers.append(t)
-			was_processed = True
-		if 'Special Ops' in t.services_for_ticker:
-			special_ops_tickers.append(t)
-			was_processed = True
-		if 'Options' in t.services_for_ticker:
-			options_tickers.append(t)
-			was_processed = True
-		if 'Deep Value' in t.services_for_ticker:
-			deep_value_tickers.append(t)
-			was_processed = True
-		if was_processed == False:
-			print 'this ticker %s was in some other service' % t.ticker_symbol
-
-
-	fool_one_articles = []
-	supernova_articles = []
-	pro_articles = []
-	mdp_articles = []
-	stock_advisor_articles = []
-	hidden_gems_articles = []
-	income_investor_articles = []
-	rule_breakers_articles = []
-	inside_value_articles = []
-	special_ops_articles = []
-	deep_value_articles = []
-	options_articles = []
-
-	for a in Article.objects.filter(date_pub__gt = (datetime.now() - timedelta(days=21)).date()):
-		if 'One' in a.service.pretty_name:
-			fool_one_articles.append(a)
-		elif 'Supernova' in a.service.pretty_name:
-			supernova_articles.append(a)
-		elif 'Pro' in a.service.pretty_name:
-			pro_articles.append(a)
-		elif 'MDP' in a.service.pretty_name:
-			mdp_articles.append(a)
-		elif 'Stock Advisor' in a.service.pretty_name:
-			stock_advisor_articles.append(a)
-		elif 'Hidden Gems' in a.service.pretty_name:
-			hidden_gems_articles.append(a)
-		elif 'Income Investor' in a.service.pretty_name:
-			income_investor_articles.append(a)
-		elif 'Rule Breakers' in a.service.pretty_name:
-			rule_breakers_articles.append(a)
-		elif 'Inside Value' in a.service.pretty_name:
-			inside_value_articles.append(a)
-		elif 'Special Ops' in a.service.pretty_name:
-			special_ops_articles.append(a)
-		elif 'Options' in a.service.pretty_name:
-			options_articles.append(a)
-		elif 'Deep Value' in a.service.pretty_name:
-			deep_value_articles.append(a)
-		else:
-			print 'this article was in some other service'
+	# which services cover which tickers? one read of the membership table
+	service_ids_by_ticker_id = {}
+	for ticker_id, service_id in Ticker.covering_services.through.objects.values_list('ticker_id', 'service_id'):
+		service_ids_by_ticker_id.setdefault(ticker_id, []).append(service_id)
 
+	# one pass over the tickers. the query hands them to us ordered by daily % change (biggest gainer first),
+	# so each service's list of tickers comes out already sorted
+	tickers = Ticker.objects.in_any_service() \
+		.only('ticker_symbol', 'daily_percent_change', 'earnings_announcement') \
+		.order_by('-daily_percent_change', 'ticker_symbol')
 
 	yesterday = (datetime.now() - timedelta(days=1)).date()
+	tickers_with_upcoming_earnings = []
+
+	for t in tickers:
+		# (a membership or service added between the queries above and this one just isn't on the page yet)
+		service_ids = [service_id for service_id in service_ids_by_ticker_id.get(t.id, []) if service_id in overview_by_service_id]
+		overviews_for_ticker = [overview_by_service_id[service_id] for service_id in service_ids]
+		for overview in overviews_for_ticker:
+			overview['tickers'].append(t)
+
+		if t.earnings_announcement is not None and t.earnings_announcement > yesterday:
+			tickers_with_upcoming_earnings.append((t, overviews_for_ticker))
+
+	for overview in overviews:
+		overview['gainers'] = overview['tickers'][:NUM_TICKERS_PER_OVERVIEW_LIST]
+		losers = overview['tickers'][-NUM_TICKERS_PER_OVERVIEW_LIST:]
+		losers.reverse()
+		overview['losers'] = losers
+
+	# sort the upcoming earnings once, then deal the tickers out to their services
+	tickers_with_upcoming_earnings.sort(key=lambda x: x[0].earnings_announcement)
+	for t, overviews_for_ticker in tickers_with_upcoming_earnings:
+		for overview in overviews_for_ticker:
+			if len(overview['earnings']) < NUM_TICKERS_PER_OVERVIEW_LIST:
+				overview['earnings'].append(t)
+
+	# newest articles first; keep at most one article per title, per service
+	articles_cutoff = (datetime.now() - timedelta(days=OVERVIEW_ARTICLE_WINDOW_IN_DAYS)).date()
+	recent_articles = Article.objects.filter(date_pub__gt=articles_cutoff).order_by('-date_pub') \
+		.values('title', 'url', 'service_id')
+
+	titles_seen_by_service_id = dict([(service_id, set()) for service_id in overview_by_service_id])
+	num_services_still_collecting = len(overviews)
+
+	for a in recent_articles.iterator():
+		if num_services_still_collecting == 0:
+			break
+
+		overview = overview_by_service_id.get(a['service_id'])
+		if overview is None or len(overview['articles']) >= NUM_ARTICLES_PER_OVERVIEW:
+			continue
 
-	fool_one_gainers, fool_one_losers = gainers_losers(fool_one_tickers)
-	fool_one_earnings = upcoming_earnings(fool_one_tickers)
-	fool_one_articles = recent_articles(fool_one_articles)
-
-	supernova_gainers, supernova_losers = gainers_losers(supernova_tickers)
-	supernova_earnings = upcoming_earnings(supernova_tickers)
-	supernova_articles = recent_articles(supernova_articles)
-
-	pro_gainers, pro_losers = gainers_losers(pro_tickers)
-	pro_earnings = upcoming_earnings(pro_tickers)
-	pro_articles = recent_articles(pro_articles)
-
-	mdp_gainers, mdp_losers = gainers_losers(mdp_tickers)
-	mdp_earnings = upcoming_earnings(mdp_tickers)
-	mdp_articles = recent_articles(mdp_articles)
-
-	stock_advisor_gainers, stock_advisor_losers = gainers_losers(stock_advisor_tickers)
-	stock_advisor_earnings = upcoming_earnings(stock_advisor_tickers)
-	stock_advisor_articles = recent_articles(stock_advisor_articles)
-
-	rule_breakers_gainers, rule_breakers_losers = gainers_losers(rule_breakers_tickers)
-	rule_breakers_earnings = upcoming_earnings(rule_breakers_tickers)
-	rule_breakers_articles = recent_articles(rule_breakers_articles)
-
-	income_investor_gainers, income_investor_losers = gainers_losers(income_investor_tickers)
-	income_investor_earnings = upcoming_earnings(income_investor_tickers)
-	income_investor_articles = recent_articles(income_investor_articles)
-
-	inside_value_gainers, inside_value_losers = gainers_losers(inside_value_tickers)
-	inside_value_earnings = upcoming_earnings(inside_value_tickers)
-	inside_value_articles = recent_articles(inside_value_articles)
-
-	hidden_gems_gainers, hidden_gems_losers = gainers_losers(hidden_gems_tickers)
-	hidden_gems_earnings = upcoming_earnings(hidden_gems_tickers)
-	hidden_gems_articles = recent_articles(hidden_gems_articles)
+		titles_seen = titles_seen_by_service_id[a['service_id']]
+		if a['title'] in titles_seen:
+			continue
+		titles_seen.add(a['title'])
 
-	special_ops_gainers, special_ops_losers = gainers_losers(special_ops_tickers)
-	special_ops_earnings = upcoming_earnings(special_ops_tickers)
-	special_ops_articles = recent_articles(special_ops_articles)
+		overview['articles'].append(a)
+		if len(overview['articles']) == NUM_ARTICLES_PER_OVERVIEW:
+			num_services_still_collecting -= 1
 
-	# options_gainers, options_losers = gainers_losers(options_tickers)
-	# options_earnings = sorted(options_tickers, key=lambda x: x.earnings_announcement, reverse=True)[:10]
-	options_articles = recent_articles(options_articles)
+	# services with neither tickers nor recent articles have nothing to show
+	return [o for o in overviews if o['tickers'] or o['articles']]
 
-	deep_value_gainers, deep_value_losers = gainers_losers(deep_value_tickers)
-	deep_value_earnings = upcoming_earnings(deep_value_tickers)
-	deep_value_articles = recent_articles(deep_value_articles)
+###############################################################################
 
+def service_overview(request):
 
 	dictionary_of_values = {
-		'fool_one_tickers': fool_one_tickers,
-		'fool_one_gainers': fool_one_gainers,
-		'fool_one_losers': fool_one_losers,
-		'fool_one_earnings': fool_one_earnings,
-		'fool_one_articles': fool_one_articles,
-		'supernova_tickers': supernova_tickers,
-		'supernova_gainers': supernova_gainers,
-		'supernova_losers': supernova_losers,
-		'supernova_earnings': supernova_earnings,
-		'supernova_articles': supernova_articles,
-		'pro_tickers': pro_tickers,
-		'pro_gainers': pro_gainers,
-		'pro_losers': pro_losers,
-		'pro_earnings': pro_earnings,
-		'pro_articles': pro_articles,
-		'mdp_tickers': mdp_tickers,
-		'mdp_gainers': mdp_gainers,
-		'mdp_losers': mdp_losers,
-		'mdp_earnings': mdp_earnings,
-		'mdp_articles': mdp_articles,
-		'stock_advisor_tickers': stock_advisor_tickers,
-		'stock_advisor_gainers': stock_advisor_gainers,
-		'stock_advisor_losers': stock_advisor_losers,
-		'stock_advisor_earnings': stock_advisor_earnings,
-		'stock_advisor_articles': stock_advisor_articles,
-		'rule_breakers_tickers': rule_breakers_tickers,
-		'rule_breakers_gainers': rule_breakers_gainers,
-		'rule_breakers_losers': rule_breakers_losers,
-		'rule_breakers_earnings': rule_breakers_earnings,
-		'rule_breakers_articles': rule_breakers_articles,
-		'income_investor_tickers': income_investor_tickers,
-		'income_investor_gainers': income_investor_gainers,
-		'income_investor_losers': income_investor_losers,
-		'income_investor_earnings': income_investor_earnings,
-		'income_investor_articles': income_investor_articles,
-		'inside_value_tickers': inside_value_tickers,
-		'inside_value_gainers': inside_value_gainers,
-		'inside_value_losers': inside_value_losers,
-		'inside_value_earnings': inside_value_earnings,
-		'inside_value_articles': inside_value_articles,
-		'hidden_gems_tickers': hidden_gems_tickers,
-		'hidden_gems_gainers': hidden_gems_gainers,
-		'hidden_gems_losers': hidden_gems_losers,
-		'hidden_gems_earnings': hidden_gems_earnings,
-		'hidden_gems_articles': hidden_gems_articles,
-		'special_ops_tickers': special_ops_tickers,
-		'special_ops_gainers': special_ops_gainers,
-		'special_ops_losers': special_ops_losers,
-		'special_ops_earnings': special_ops_earnings,
-		'special_ops_articles': special_ops_articles,
-		'deep_value_tickers': deep_value_tickers,
-		'deep_value_gainers': deep_value_gainers,
-		'deep_value_losers': deep_value_losers,
-		'deep_value_earnings': deep_value_earnings,
-		'deep_value_articles': deep_value_articles,
-		#'options_tickers': options_tickers,
-		#'options_gainers': options_gainers,
-		#'options_losers': options_losers,
-		#'options_earnings': options_earnings,
-		'options_articles': options_articles,
+		'service_overviews': _get_service_overviews(),
 	}
 
 	return render(request, 'satellite/service_overview.html', dictionary_of_values)
 
-
 ###############################################################################
 
-def _get_ticker_objects_for_ticker_symbols(ticker_symbols_csv='AAPL,SWIR,Z'):
-	csv_elements = ticker_symbols_csv.split(',')
-	csv_elements = [el.strip().upper() for el in csv_elements]
-
-	return Ticker.objects.filter(ticker_symbol__in=csv_elements)
-
 def _get_service_objects_for_service_ids(service_ids_csv='1,4,7'):
 	csv_elements = service_ids_csv.split(',')
 	csv_elements = [int(el.strip()) for el in csv_elements]
 	return Service.objects.filter(id__in=csv_elements)
 
-def _get_ticker_objects_for_tier_status(tier_status_csv=['core','first']):
-	# given a set of tier statuses, find corresponding ticker objects
-	csv_elements = tier_status_csv
-	print csv_elements
-
-	return Ticker.objects.filter(tier_status__in=csv_elements)
-
 ######################################################################################
 
 def ticker_overview(request):
@@ -429,7 +273,8 @@ def ticker_overview(request):
 	dictionary_of_values = {
 		'title_value': 'All Tickers',
 		'services': Service.objects.all(),
-		'tickers': Ticker.objects.all(),
+		# the number of services per ticker comes along in the same query (for get_number_of_services)
+		'tickers': Ticker.objects.annotate(num_services=Count('covering_services')),
 	}
 	return render(request, 'satellite/tickers_index.html', dictionary_of_values)
 
@@ -461,6 +306,73 @@ def ticker_detail(request, ticker_symbol):
 
 ###############################################################################
 
+def _save_coverage_pledges(ticker, authors_keyed_by_choice_and_service_id):
+	"""
+	make the ticker's CoverageType records match what was submitted: one record per (coverage choice id, service id)
+	key that has an author. a key with no author picked ('-----' in the form, or nothing) isn't a pledge, so there's no
+	record for it; one that was there before is deleted.
+
+	instead of deleting and re-creating every record, we compare with what's there: pledges that didn't change are
+	left alone, changed authors are written with one bulk update, new pledges with one bulk insert, and pledges that
+	weren't submitted are deleted. all in one transaction, so nobody sees a half-saved set of pledges.
+	returns a short description of what changed
+	"""
+	# only services that exist; one query for all of them
+	services_keyed_by_id = Service.objects.in_bulk(set([service_id for choice_id, service_id in authors_keyed_by_choice_and_service_id]))
+
+	wanted_authors = {}
+	for (choice_id, service_id), author in authors_keyed_by_choice_and_service_id.items():
+		if service_id not in services_keyed_by_id:
+			continue
+		author = author.strip()
+		if not author.strip('-'):
+			continue
+		wanted_authors[(choice_id, service_id)] = author
+
+	with transaction.atomic():
+		pledges_to_update = []
+		ids_of_pledges_to_delete = []
+		existing_keys = set()
+
+		for ct in CoverageType.objects.filter(ticker=ticker).order_by('id'):
+			key = (ct.coverage_type, ct.service_id)
+			if key not in wanted_authors or key in existing_keys:
+				# no longer wanted, or a duplicate of a pledge we've already seen
+				ids_of_pledges_to_delete.append(ct.id)
+				continue
+			existing_keys.add(key)
+			if ct.author != wanted_authors[key]:
+				ct.author = wanted_authors[key]
+				pledges_to_update.append(ct)
+
+		pledges_to_create = [CoverageType(ticker=ticker, coverage_type=choice_id, service_id=service_id, author=author)
+			for (choice_id, service_id), author in wanted_authors.items() if (choice_id, service_id) not in existing_keys]
+
+		if ids_of_pledges_to_delete:
+			CoverageType.objects.filter(id__in=ids_of_pledges_to_delete).delete()
+		bulk_update(pledges_to_update, ['author'])
+		CoverageType.objects.bulk_create(pledges_to_create)
+
+	return 'added %d, updated %d, deleted %d' % (len(pledges_to_create), len(pledges_to_update), len(ids_of_pledges_to_delete))
+
+
+# for the coverage tags on coverage_detail: (name of the bucket in the template, the tag that puts an article in it).
+# an article goes in every bucket whose tag appears in its tags
+COVERAGE_DETAIL_TAG_BUCKETS = (
+	('ten_percent_promises', '10 promise'),
+	('everlasting', 'everlasting'),
+	('analysis', 'analysis'),
+	('featured', 'featured'),
+	('earnings', 'earnings'),
+	('mission_log', 'mission_log'),
+	('buy_recommendations', 'buy recommendation'),
+	('five_and_three', '5 and 3'),
+	('best_buys_now', 'best buys now'),
+	('two_minute_drills', '2 minute drill'),
+	('commentary', 'commentary'),
+	('news', 'news'),
+)
+
 def coverage_detail(request, ticker_symbol):
 
 	try:
@@ -480,34 +392,15 @@ def coverage_detail(request, ticker_symbol):
 		if 'coverage' in request.POST:
 			audit_filter_form = FilterForm(request.POST)
 
-			# delete records that are already there
-			coverage_type_objects = CoverageType.objects.filter(ticker=ticker)
-			print 'deleting existing CoverageType records for %s (%d)' % (ticker.ticker_symbol, len(coverage_type_objects))
-			coverage_type_objects.delete()
-
-			# replace them with the records passed along in POST
-			# we expect the keys per selection to have this format: "cid_x__sid_y", where x is a content choice integer value, y is a service id
-			selected_keys = [k for k in request.POST if k.startswith('author_')]
-			for k in selected_keys:
+			# we expect the keys per selection to have this format: "author_cid_x__sid_y", where x is a content choice integer value, y is a service id
+			authors_keyed_by_choice_and_service_id = {}
+			for k in request.POST:
+				if not k.startswith('author_'):
+					continue
+				choice_id, service_id = k.replace('author_','').replace("cid_","").replace("sid_","").split('__')
+				authors_keyed_by_choice_and_service_id[(int(choice_id), int(service_id))] = request.POST[k]
 
-				k = k.replace('author_','')
-				print k, '----pants----'
-				choice_id, service_id = k.replace("cid_","").replace("sid_","").split('__')
-
-				ct = CoverageType()
-				ct.coverage_type = int(choice_id)
-				ct.ticker = ticker
-				ct.service = Service.objects.get(id=service_id)
-
-				author_key = 'author_'+k
-
-				print author_key
-
-				if author_key in request.POST:
-					ct.author = request.POST[author_key]
-
-				ct.save()
-				print 'added CoverageType record: %s %s %d %s' % (ct.service.pretty_name, ct.ticker.ticker_symbol, ct.coverage_type, ct.author)
+			print 'saved CoverageType records for %s: %s' % (ticker.ticker_symbol, _save_coverage_pledges(ticker, authors_keyed_by_choice_and_service_id))
 		else:
 			audit_filter_form = FilterForm(request.POST)
 
@@ -537,53 +430,26 @@ def coverage_detail(request, ticker_symbol):
 	else:
 		pass
 
-	services = Service.objects.all()
+	# only the services that cover this ticker get a column in the coverage pledge table
+	services = ticker.covering_services.all()
 	
-	today = datetime.now()
-	date_today = today.date()
-	ninety_days_ago = (date_today - timedelta(days=90))
-
-	articles = [a for a in Article.objects.filter(ticker=ticker).exclude(tags=None).exclude(tags='') if a.date_pub is not None and a.date_pub.date() >= ninety_days_ago]
+	# the ticker's tagged articles from the past 90 days
+	ninety_days_ago = timezone.now() - timedelta(days=90)
+	articles = Article.objects.filter(ticker=ticker, date_pub__gte=ninety_days_ago).exclude(tags=None).exclude(tags='') \
+		.select_related('service')
 
 	relevant_articles = set()
-	ten_percent_promises = set()
-	everlasting = set()
-	analysis = set()
-	featured = set()
-	earnings = set()
-	mission_log = set()
-	buy_recommendations = set()
-	five_and_three = set()
-	best_buys_now = set()
-	two_minute_drills = set()
-	commentary = set()
-	news = set()
+
+	# sort the articles into buckets by tag, in one pass. many articles share the same tags string,
+	# so we work out which buckets a tags string belongs in only once per distinct string
+	articles_by_bucket = dict([(bucket_name, set()) for bucket_name, tag in COVERAGE_DETAIL_TAG_BUCKETS])
+	bucket_names_keyed_by_tags = {}
 
 	for a in articles:
-		if '10 promise' in a.tags:
-			ten_percent_promises.add(a)
-		if 'everlasting' in a.tags:
-			everlasting.add(a)
-		if 'analysis' in a.tags:
-			analysis.add(a)
-		if 'featured' in a.tags:
-			featured.add(a)
-		if 'earnings' in a.tags:
-			earnings.add(a)
-		if 'mission_log' in a.tags:
-			mission_log.add(a)
-		if 'buy recommendation' in a.tags:
-			buy_recommendations.add(a)
-		if '5 and 3' in a.tags:
-			five_and_three.add(a)
-		if 'best buys now' in a.tags:
-			best_buys_now.add(a)
-		if '2 minute drill' in a.tags:
-			two_minute_drills.add(a)
-		if 'commentary' in a.tags:
-			commentary.add(a)
-		if 'news' in a.tags:
-			news.add(a)
+		if a.tags not in bucket_names_keyed_by_tags:
+			bucket_names_keyed_by_tags[a.tags] = [bucket_name for bucket_name, tag in COVERAGE_DETAIL_TAG_BUCKETS if tag in a.tags]
+		for bucket_name in bucket_names_keyed_by_tags[a.tags]:
+			articles_by_bucket[bucket_name].add(a)
 
 	print request.POST
 
@@ -593,21 +459,13 @@ def coverage_detail(request, ticker_symbol):
 		'service_filter_description': service_filter_description,
 		'coverage_type_choices': COVERAGE_CHOICES,
 		'services': services,
+		'coverage_matrix': CoverageMatrix.for_tickers([ticker]),
 		'single_authors': single_authors,
 		'title_value': '%s (%s)' % (ticker.company_name, ticker.ticker_symbol),
 		'relevant_articles': relevant_articles,
-		'ten_percent_promises': ten_percent_promises,
-		'everlasting': everlasting,
-		'featured': featured,
-		'earnings': earnings,
-		'mission_log': mission_log,
-		'buy_recommendations': buy_recommendations,
-		'five_and_three': five_and_three,
-		'best_buys_now': best_buys_now,
-		'two_minute_drills': two_minute_drills,
-		'commentary': commentary,
-		'news': news,
 	}
+	# eg 'ten_percent_promises': [articles tagged '10 promise'], 'everlasting': [...], ...
+	dictionary_of_values.update(articles_by_bucket)
 
 	return render(request, 'satellite/coverage_detail.html', dictionary_of_values)
 
@@ -626,27 +484,19 @@ def get_service_ids(coverage_type_id, ticker_symbol):
 #################################################################################
 
 def get_authors_from_article_set():
-	all_authors_ever = [a.byline for a in BylineMetaData.objects.all()]
-	sep = ' and'
-	authors_no_and = [a.split(sep, 1)[0] for a in all_authors_ever]
-	sep = ','
-	single_authors = [a.split(sep, 1)[0] for a in authors_no_and]
-	single_authors = set(single_authors)
-	single_authors = list(single_authors)
-	single_authors.sort()
-	return single_authors
+	# rebuilt from the BylineMetaData records only when they change (see cache_utils)
+	return get_single_authors()
 
 ###############################################################################
 
 def coverage_index(request):
 
-	coverage_types = CoverageType.objects.all()
-
 	dictionary_of_values = {
 	'title_value': 'All Tickers',
 	'services': Service.objects.all(),
 	'tickers': Ticker.objects.all(),
-	'coverage_types': CoverageType.objects.all(),
+	# everyone's coverage pledges, in one query, for the coverage tags to read from
+	'coverage_matrix': CoverageMatrix.for_tickers(),
 		}
 
 	return render(request, 'satellite/coverage_index.html', dictionary_of_values)
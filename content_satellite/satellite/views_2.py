@@ -1,31 +1,55 @@
-import csv
-from datetime import datetime, timedelta
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+import hashlib
+import json
+import urllib
+from itertools import groupby
+from datetime import datetime, time, timedelta
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, PageNotAnInteger
 from django.core.urlresolvers import reverse
 from django.shortcuts import render
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_date
+from cache_utils import get_ticker_symbols
+from db_utils import iterate_in_chunks
+from export_utils import get_streaming_csv_response
 from forms import FilterForm, TickerForm
-from django.db.models import Q
+from pagination_utils import get_keyset_page, InvalidCursor, PrecountedPaginator
+from django.db.models import Count, Max, Min, Q
 from models import Article, BylineMetaData, Service, Ticker, Scorecard, ServiceTake, \
 	AnalystForTicker, CoverageType, COVERAGE_CHOICES, DataHarvestEventLog, DATA_HARVEST_TYPE_CHOICES
 
 ###############################################################################
 
+def _get_upcoming_earnings(after_date, num_tickers=100):
+	"""
+	the next num_tickers earnings dates after after_date, of tickers some service covers; on the same date, biggest
+	gainers first. walked straight off the earnings_announcement index, so the db stops after num_tickers rows (only
+	the tickers that share a date need sorting among themselves)
+	"""
+	tickers = Ticker.objects.filter(earnings_announcement__gt=after_date, services_for_ticker__isnull=False)
+	return tickers.order_by('earnings_announcement', '-daily_percent_change')[:num_tickers]
+
+
 def upcoming_earnings(request):
 	context = {
 		'page-title': 'Upcoming Earnings',
 	}
 
-	tickers = Ticker.objects.all()
-	tickers = sorted(tickers, key=lambda x: x.daily_percent_change, reverse=True)
-
 	yesterday = (datetime.now() - timedelta(days=1)).date()
 
-	tickers_sorted_by_earnings_date = [t for t in tickers if t.services_for_ticker != None and t.earnings_announcement != None and t.earnings_announcement>yesterday]
-	tickers_sorted_by_earnings_date = sorted(tickers_sorted_by_earnings_date, key=lambda x: x.earnings_announcement)[:100]
+	tickers_sorted_by_earnings_date = list(_get_upcoming_earnings(yesterday))
+
+	# count the services of just these tickers, in one query; an annotate() on the query above would have to group
+	# (and so read) every ticker with an upcoming date before it could pick the first 100
+	memberships = Ticker.covering_services.through.objects.filter(ticker_id__in=[t.id for t in tickers_sorted_by_earnings_date])
+	num_services_keyed_by_ticker_id = dict(memberships.values_list('ticker_id').annotate(num_services=Count('id')).order_by())
+	for t in tickers_sorted_by_earnings_date:
+		# read by the number_of_services template tag
+		t.num_services = num_services_keyed_by_ticker_id.get(t.id, 0)
 
 	dictionary_of_values = {
-	'tickers': tickers,
 	'tickers_sorted_by_earnings_date': tickers_sorted_by_earnings_date,
 	'form': TickerForm,
 	}
@@ -69,6 +93,40 @@ def get_author_bylines_index(request):
 
 ###########################################################################################################
 
+num_articles_per_page = 100
+
+# how long the keyset pages after the first can go on showing the first page's stats
+article_stats_max_age_in_seconds = 600
+
+def _get_article_stats(articles):
+	"""
+	the stats for the whole result set (count, newest/oldest publish date, number of authors), from the db in one
+	query no matter how many articles match
+	"""
+	return articles.order_by().aggregate(
+		num_articles=Count('id'),
+		pub_date_newest=Max('date_pub'),
+		pub_date_oldest=Min('date_pub'),
+		num_authors=Count('author', distinct=True))
+
+
+def _get_cached_article_stats(articles, refresh=True):
+	"""
+	_get_article_stats, kept in the cache keyed by the query. with refresh=True the stats are worked out again (and
+	the cache updated); with refresh=False the stats from an earlier request for the same articles are used if
+	there are some, and the cache is only written on a miss
+	"""
+	cache_key = 'satellite.article_stats.%s' % hashlib.md5(str(articles.query)).hexdigest()
+	if not refresh:
+		article_stats = cache.get(cache_key)
+		if article_stats is not None:
+			return article_stats
+
+	article_stats = _get_article_stats(articles)
+	cache.set(cache_key, article_stats, article_stats_max_age_in_seconds)
+	return article_stats
+
+
 def articles_index(request):
 
 	tickers_to_filter_by = None
@@ -78,9 +136,16 @@ def articles_index(request):
 
 	page_num = 1
 
+	# keyset mode: page through by cursor (see pagination_utils) rather than by page number
+	use_keyset = False
+	cursor = None
+
 	if request.POST:
 		if 'page_number' in request.POST:
 			page_num = int(request.POST['page_number'])
+		if 'cursor' in request.POST:
+			use_keyset = True
+			cursor = request.POST['cursor']
 
 		article_filter_form = FilterForm(request.POST)
 
@@ -97,6 +162,10 @@ def articles_index(request):
 	elif request.GET:
 		initial_form_values = {}
 
+		if 'cursor' in request.GET or request.GET.get('paging') == 'keyset':
+			use_keyset = True
+			cursor = request.GET.get('cursor')
+
 		if 'tickers' in request.GET:
 			tickers_user_input = request.GET.get('tickers')
 			tickers_to_filter_by = _get_ticker_objects_for_ticker_symbols(tickers_user_input)
@@ -112,12 +181,17 @@ def articles_index(request):
 		article_filter_form = FilterForm()
 
 
+	# the same filters, for the csv download link
+	csv_filters = {}
+
 	if tickers_to_filter_by:
 		ticker_filter_description = ', '.join([t.strip() for t in tickers_user_input.split(",")])
+		csv_filters['tickers'] = tickers_user_input
 	if services_to_filter_by:
 		pretty_names_of_services_we_matched = [s.pretty_name for s in services_to_filter_by]
 		pretty_names_of_services_we_matched.sort()
 		service_filter_description = ', '.join(pretty_names_of_services_we_matched)
+		csv_filters['service_ids'] = ','.join([str(s.id) for s in services_to_filter_by])
 
 
 	if tickers_to_filter_by is not None and services_to_filter_by is not None:
@@ -129,67 +203,213 @@ def articles_index(request):
 	else:
 		articles = Article.objects.all().order_by('-date_pub')
 
+	articles = articles.select_related('ticker', 'service')
 
-	paginator = Paginator(articles, 100)
+	next_cursor = None
 
-	try:
-		articles_subset = paginator.page(page_num)
-	except PageNotAnInteger:
-		# page is not an integer; let's show the first page of results
-		articles_subset = paginator.page(1)
-	except EmptyPage:
-		# the user asked for a page way beyond what we have available;
-		# let's show the last page of articles, which we can calculate
-		# with paginator.num_pages
-		articles_subset = paginator.page(paginator.num_pages)
-
-
-	if len(articles):
-		article_most_recent_date = articles[0].date_pub
-		article_oldest_date = articles[len(articles)-1].date_pub
+	if use_keyset:
+		try:
+			articles_subset, next_cursor = get_keyset_page(articles, cursor, num_articles_per_page)
+		except InvalidCursor:
+			# eg a mangled url; start again from the newest articles
+			cursor = None
+			articles_subset, next_cursor = get_keyset_page(articles, None, num_articles_per_page)
 	else:
-		article_most_recent_date = "n/a"
-		article_oldest_date = "n/a"
-
-	authors = [art.author for art in articles]
-	authors_set = set(authors)
-	num_authors = len(authors_set)
-
-	num_articles = len(articles)
+		# the stats include the count, so the paginator can use that rather than run its own COUNT(*)
+		article_stats = _get_article_stats(articles)
+		paginator = PrecountedPaginator(articles, num_articles_per_page, count=article_stats['num_articles'])
+
+		try:
+			articles_subset = paginator.page(page_num)
+		except PageNotAnInteger:
+			# page is not an integer; let's show the first page of results
+			articles_subset = paginator.page(1)
+		except EmptyPage:
+			# the user asked for a page way beyond what we have available;
+			# let's show the last page of articles, which we can calculate
+			# with paginator.num_pages
+			articles_subset = paginator.page(paginator.num_pages)
+
+
+	if use_keyset:
+		# keyset pages leave out the articles without a publish date, so the stats do too. they're only worked out
+		# on the first page; the pages after it read them back from the cache rather than re-scan the whole result set
+		article_stats = _get_cached_article_stats(articles.filter(date_pub__isnull=False), refresh=not cursor)
+
+	num_articles = article_stats['num_articles']
+	num_authors = article_stats['num_authors']
+	article_most_recent_date = article_stats['pub_date_newest'] or "n/a"
+	article_oldest_date = article_stats['pub_date_oldest'] or "n/a"
+
+	# look up the byline meta data for all the authors on this page at once
+	authors_on_page = set([article.author for article in articles_subset])
+	services_keyed_by_byline = dict(BylineMetaData.objects.filter(byline__in=authors_on_page).values_list('byline', 'services'))
 
 	article_defns = []
 	for article in articles_subset:
-		byline_meta_data = ''
-		byline_match = BylineMetaData.objects.filter(byline=article.author)
-		if byline_match:
-			byline_meta_data = byline_match[0].services
 		article_defns.append({
 			'article':article,
-			'author_service_associations': byline_meta_data,
+			'author_service_associations': services_keyed_by_byline.get(article.author) or '',
 			})
 
 	dictionary_of_values = {
 		'form': article_filter_form,
 		'articles': articles_subset,
+		'use_keyset': use_keyset,
+		'cursor': cursor,
+		'next_cursor': next_cursor,
 		'article_defns': article_defns,
 		'pub_date_newest': article_most_recent_date,
 		'pub_date_oldest': article_oldest_date,
 		'num_authors' : num_authors,
 		'num_articles' : num_articles,
 		'service_filter_description': service_filter_description,
-		'ticker_filter_description': ticker_filter_description
+		'ticker_filter_description': ticker_filter_description,
+		'csv_query_string': urllib.urlencode(csv_filters),
 	}
 
 	return render(request, 'satellite/articles_index.html', dictionary_of_values)
 
+
+max_articles_per_feed_page = 1000
+
+def _get_start_of_day(date_as_string):
+	""" 'YYYY-MM-DD' -> the first moment of that day, in the site's timezone. raises ValueError for anything else """
+	date = parse_date(date_as_string.strip())
+	if date is None:
+		raise ValueError('not a date (expected YYYY-MM-DD): %s' % date_as_string)
+	return timezone.make_aware(datetime.combine(date, time.min), timezone.get_current_timezone())
+
+
+def _get_filtered_articles(query_dict):
+	"""
+	the Articles that match the filters in the query string (tickers, service_ids, author, since, until; see articles_feed).
+	raises ValueError for a filter value we can't make sense of
+	"""
+	articles = Article.objects.all()
+
+	if query_dict.get('tickers'):
+		articles = articles.filter(ticker__in=_get_ticker_objects_for_ticker_symbols(query_dict['tickers']))
+	if query_dict.get('service_ids'):
+		articles = articles.filter(service__in=_get_service_objects_for_service_ids(query_dict['service_ids']))
+	if query_dict.get('author'):
+		articles = articles.filter(author=query_dict['author'].strip())
+	if query_dict.get('since'):
+		articles = articles.filter(date_pub__gte=_get_start_of_day(query_dict['since']))
+	if query_dict.get('until'):
+		articles = articles.filter(date_pub__lt=_get_start_of_day(query_dict['until']) + timedelta(days=1))
+
+	return articles
+
+
+def articles_feed(request):
+	"""
+	a machine-readable feed of articles, newest first, one page at a time; meant for dashboards and scripts.
+
+	query string (all optional):
+		tickers=AAPL,SBUX		service_ids=1,4		author=<byline>
+		since=YYYY-MM-DD		until=YYYY-MM-DD (both inclusive)
+		limit=<articles per page; default 100, at most 1000>
+		cursor=<the next_cursor from the previous page>
+		format=json (default) or ndjson
+
+	json: {"articles": [...], "next_cursor": ...}. next_cursor is null on the last page.
+	ndjson: one article per line; the next cursor is in the X-Next-Cursor header (absent on the last page).
+
+	pages are found by cursor rather than by page number (see pagination_utils), so paging through every article
+	costs the same per page, however deep you go.
+	"""
+	try:
+		articles = _get_filtered_articles(request.GET)
+
+		limit = int(request.GET.get('limit', num_articles_per_page))
+		if not 0 < limit <= max_articles_per_feed_page:
+			raise ValueError('limit must be between 1 and %d' % max_articles_per_feed_page)
+
+		article_values = articles.values('id', 'title', 'author', 'date_pub', 'url', 'tags', 'ticker__ticker_symbol', 'service__pretty_name')
+		page, next_cursor = get_keyset_page(article_values, request.GET.get('cursor'), limit)
+	except ValueError as e:
+		# (InvalidCursor is a ValueError too)
+		return HttpResponseBadRequest(json.dumps({'message': 'error: %s' % str(e)}), content_type='application/json')
+
+	articles_as_json = [{
+		'id': a['id'],
+		'title': a['title'],
+		'author': a['author'],
+		'date_pub': a['date_pub'].isoformat(),
+		'url': a['url'],
+		'tags': a['tags'],
+		'ticker': a['ticker__ticker_symbol'],
+		'service': a['service__pretty_name'],
+		} for a in page]
+
+	if request.GET.get('format') == 'ndjson':
+		response = HttpResponse(''.join([json.dumps(a) + '\n' for a in articles_as_json]), content_type='application/x-ndjson')
+		if next_cursor:
+			response['X-Next-Cursor'] = next_cursor
+		return response
+
+	return HttpResponse(json.dumps({'articles': articles_as_json, 'next_cursor': next_cursor}), content_type='application/json')
+
 ###################################################################################
 
+# how long clients may reuse a ticker_lookup answer without asking again
+ticker_lookup_max_age_in_seconds = 60
+
+def _get_ticker_details(ticker_symbols):
+	"""
+	for the richer ticker_lookup payload: a dictionary, keys = ticker symbol, values = dictionary of details.
+	two queries per 500 symbols: the tickers, and their services from the ticker/service membership table
+	"""
+	Membership = Ticker.covering_services.through
+
+	details_keyed_by_ticker_symbol = {}
+	chunk_size = 500
+	for start_idx in range(0, len(ticker_symbols), chunk_size):
+		tickers = list(Ticker.objects.filter(ticker_symbol__in=ticker_symbols[start_idx:start_idx+chunk_size]) \
+			.only('ticker_symbol', 'company_name', 'tier', 'earnings_announcement', 'daily_percent_change'))
+
+		service_names_keyed_by_ticker_id = {}
+		memberships = Membership.objects.filter(ticker_id__in=[t.id for t in tickers]).order_by('service__pretty_name')
+		for ticker_id, service_name in memberships.values_list('ticker_id', 'service__pretty_name'):
+			service_names_keyed_by_ticker_id.setdefault(ticker_id, []).append(service_name)
+
+		for t in tickers:
+			details_keyed_by_ticker_symbol[t.ticker_symbol] = {
+				'company_name': t.company_name,
+				'services': service_names_keyed_by_ticker_id.get(t.id, []),
+				'tier': t.tier,
+				'earnings_announcement': t.earnings_announcement.isoformat() if t.earnings_announcement else None,
+				'daily_percent_change': float(t.daily_percent_change) if t.daily_percent_change is not None else None,
+			}
+	return details_keyed_by_ticker_symbol
+
+
+def _matches_if_none_match(etag, if_none_match):
+	"""
+	whether an If-None-Match header names our (quoted) etag: it's '*', or a comma-separated list of quoted tags, any of
+	which may carry a 'W/' (weak) prefix. each tag has to be ours exactly
+	"""
+	if not if_none_match:
+		return False
+	if if_none_match.strip() == '*':
+		return True
+	tags = [tag.strip() for tag in if_none_match.split(',')]
+	return etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+
 def ticker_lookup(request):
 	"""
 	returns json.  if the request contains a string of ticker symbols in its query string,
 	then let the json be a dictionary with keys for each ticker symbol, value (True/False), for whether SOL knows about it.
+	with 'details=1' in the query string too, the value for a ticker SOL knows about is a dictionary of details
+	(services, tier, earnings date, daily change) instead of True.
 
 	if no ticker symbols are detected, return a dictionary with a key of 'message'.
+
+	the plain answer comes from the cached set of ticker symbols (no query while this process's copy is fresh, see
+	cache_utils); the details take two queries. either way, the response carries an ETag, so a client asking again
+	can get a 304.
 	"""
 
 	# is there a 'tickers=x,y,z' in the query string? if so, let's process it
@@ -199,23 +419,31 @@ def ticker_lookup(request):
 
 		# proces the tickers; split into individual symbols, remove whitespace, and convert to uppercase
 		ticker_symbols = ticker_symbols.split(',')
-		ticker_symbols = [ts.strip().upper() for ts in ticker_symbols]
+		# (an empty symbol, eg from 'tickers=' or a trailing comma, is answered like any other: False)
+		ticker_symbols = set([ts.strip().upper() for ts in ticker_symbols])
 
-		response = {}
 		# for each ticker symbol, we report whether SOL has a corresponding Ticker
-		for ts in ticker_symbols:
-			if Ticker.objects.filter(ticker_symbol=ts):
-				response[ts] = True
-			else:
-				response[ts] = False
+		known_ticker_symbols = get_ticker_symbols()
+		response = dict([(ts, ts in known_ticker_symbols) for ts in ticker_symbols])
+
+		if request.GET.get('details') in ('1', 'true'):
+			response.update(_get_ticker_details(sorted(ts for ts in ticker_symbols if ts in known_ticker_symbols)))
 
 	else:
 		response = {'message':'error: no tickers found in the query string'}
 
-	# instead of rendering an html page, let's return this plain dictionary as a JsonResponse object.
-	# https://docs.djangoproject.com/en/1.7/ref/request-response/#jsonresponse-objects
-	# (the page won't have pretty markup)
-	return JsonResponse(response)
+	# instead of rendering an html page, let's return this plain dictionary as json.
+	# (the page won't have pretty markup.) the keys are sorted, so the same answer always has the same ETag
+	content = json.dumps(response, sort_keys=True)
+	etag = '"%s"' % hashlib.md5(content).hexdigest()
+
+	if _matches_if_none_match(etag, request.META.get('HTTP_IF_NONE_MATCH')):
+		json_response = HttpResponseNotModified()
+	else:
+		json_response = HttpResponse(content, content_type='application/json')
+	json_response['ETag'] = etag
+	patch_cache_control(json_response, max_age=ticker_lookup_max_age_in_seconds)
+	return json_response
 
 ######################################################################################################
 
@@ -249,61 +477,56 @@ def data_freshness_index(request):
 
 ################################################################################################
 
-def _get_profiles_of_flagged_recs():
-
+def _iter_profiles_of_flagged_recs():
 	"""
-	returns a list of dictionary elements, one element per ticker/scorecard combo, where the
+	yields dictionary elements, one element per ticker/scorecard combo, where the
 	tickers are limited to the set flagged as at least one of these: a core buy, a buy first, or a new rec
-	the list will be ordered by ticker (if HG and SA scorecards both flagged ticker AAPL, then elements for AAPL/HG and AAPL/SA would be grouped together)
-	"""
-	flagged_rec_defns = []
+	the elements come ordered by ticker, then scorecard (if HG and SA scorecards both flagged ticker AAPL, then elements for AAPL/HG and AAPL/SA would be grouped together)
 
+	the service takes are read in order of ticker and scorecard (a chunk of tickers at a time, see iterate_in_chunks), so that each
+	ticker/scorecard combo's service takes arrive next to each other; we hand back a profile as soon as we've seen all
+	of a combo's service takes
+	"""
 	# let's find all the ServiceTake objects that satisfies at least one of these: is a "core buy", "buy first", or new rec.
-	flagged_service_takes = ServiceTake.objects.filter(Q(is_core=True) | Q(is_first=True) | Q(is_newest=True))
-
-
-	# we want one profile per ticker/scorecard combo. we'll organize our results by ticker, and from there (per ticker) inspect
-	# the cases where a scorecard appears multiple times. along the way, we compile flagged_rec_defns
-
-	# compile a set of the ticker symbols that are flagged
-	ticker_symbols_in_flagged_service_takes = [st.ticker.ticker_symbol for st in flagged_service_takes]
-	ticker_symbols_in_flagged_service_takes = set(ticker_symbols_in_flagged_service_takes)
-	ticker_symbols_in_flagged_service_takes = list(ticker_symbols_in_flagged_service_takes)
-	ticker_symbols_in_flagged_service_takes.sort()
-
-	# now let's go through the flagged service takes, inspecting cases per ticker.
-
-	for ticker_symbol in ticker_symbols_in_flagged_service_takes:
-		flagged_service_takes_on_this_ticker_symbol = [st for st in flagged_service_takes if st.ticker.ticker_symbol==ticker_symbol]
-
-		# process this subset of service takes by scorecard
-		scorecards_in_this_subset_of_ticker_specific_service_takes = [st.scorecard.pretty_name for st in flagged_service_takes_on_this_ticker_symbol]
-		scorecards_in_this_subset_of_ticker_specific_service_takes = set(scorecards_in_this_subset_of_ticker_specific_service_takes)
-
-		for scorecard_pretty_name in scorecards_in_this_subset_of_ticker_specific_service_takes:
-			service_takes_to_process = [st for st in flagged_service_takes_on_this_ticker_symbol if st.scorecard.pretty_name==scorecard_pretty_name]
-			open_dates = [st.open_date.strftime('%Y-%m-%d') for st in service_takes_to_process if st.open_date is not None]
-			open_dates = set(open_dates)
-			open_dates = list(open_dates)
-			open_dates.sort(reverse=True)
-			open_dates_as_string = '<br/>'.join(open_dates)
-
-			sample_service_take_for_this_scorecard = service_takes_to_process[0]
+	# (along with what we need of their tickers, scorecards and services, in the same query)
+	flagged_service_takes = ServiceTake.objects.filter(Q(is_core=True) | Q(is_first=True) | Q(is_newest=True)) \
+		.order_by('ticker__ticker_symbol', 'scorecard__pretty_name', 'id') \
+		.values('ticker__ticker_symbol', 'ticker__company_name', 'ticker__daily_percent_change',
+			'scorecard__pretty_name', 'scorecard__service__pretty_name',
+			'action', 'open_date', 'is_core', 'is_first', 'is_newest')
+
+	# we want one profile per ticker/scorecard combo
+	for (ticker_symbol, scorecard_pretty_name), service_takes_to_process in groupby(iterate_in_chunks(flagged_service_takes, key='ticker__ticker_symbol'),
+			key=lambda st: (st['ticker__ticker_symbol'], st['scorecard__pretty_name'])):
+		service_takes_to_process = list(service_takes_to_process)
+
+		open_dates = [st['open_date'].strftime('%Y-%m-%d') for st in service_takes_to_process if st['open_date'] is not None]
+		open_dates = set(open_dates)
+		open_dates = list(open_dates)
+		open_dates.sort(reverse=True)
+		open_dates_as_string = '<br/>'.join(open_dates)
+
+		sample_service_take_for_this_scorecard = service_takes_to_process[0]
+
+		yield {
+			'ticker_symbol': ticker_symbol,
+			'company': sample_service_take_for_this_scorecard['ticker__company_name'],
+			'service_pretty_name': sample_service_take_for_this_scorecard['scorecard__service__pretty_name'],
+			'scorecard_pretty_name': scorecard_pretty_name,
+			'action':sample_service_take_for_this_scorecard['action'],
+			'open_dates': open_dates_as_string,
+			'is_core':sample_service_take_for_this_scorecard['is_core'],
+			'is_first':sample_service_take_for_this_scorecard['is_first'],
+			'is_new': sample_service_take_for_this_scorecard['is_newest'],
+			'daily_percent_change': sample_service_take_for_this_scorecard['ticker__daily_percent_change']
+			}
 
-			flagged_rec_defns.append({
-				'ticker_symbol': ticker_symbol,
-				'company': sample_service_take_for_this_scorecard.ticker.company_name,
-				'service_pretty_name': sample_service_take_for_this_scorecard.scorecard.service.pretty_name,
-				'scorecard_pretty_name': sample_service_take_for_this_scorecard.scorecard.pretty_name,
-				'action':sample_service_take_for_this_scorecard.action,
-				'open_dates': open_dates_as_string,
-				'is_core':sample_service_take_for_this_scorecard.is_core,
-				'is_first':sample_service_take_for_this_scorecard.is_first,
-				'is_new': sample_service_take_for_this_scorecard.is_newest,
-				'daily_percent_change': sample_service_take_for_this_scorecard.ticker.daily_percent_change
-				})
 
-	return flagged_rec_defns
+def _get_profiles_of_flagged_recs():
+	"""
+	returns a list of dictionary elements, one element per flagged ticker/scorecard combo (see _iter_profiles_of_flagged_recs)
+	"""
+	return list(_iter_profiles_of_flagged_recs())
 
 ####################################################################################################
 
@@ -321,24 +544,81 @@ def get_flagged_recs_as_csv(request):
 	"""
 	return a csv version of the flagged recs
 	"""
-	flagged_rec_defns = _get_profiles_of_flagged_recs()
+	def generate_rows():
+		# because it's a csv, we'll be careful that no cell includes a comma
+		for frd in _iter_profiles_of_flagged_recs():
+			row_to_write = [frd['ticker_symbol'], (frd['company'] or '').replace(",",""), frd['service_pretty_name'].replace(",",""), frd['scorecard_pretty_name'].replace(",",""), frd['action']]
+			row_to_write.append(frd['open_dates'].replace('<br/>', ', '))
+			row_to_write.append('Y' if frd['is_new'] else '')
+			row_to_write.append('Y' if frd['is_first'] else '')
+			row_to_write.append('Y' if frd['is_core'] else '')
+			yield row_to_write
+
+	return get_streaming_csv_response('satellite_flagged_recs.csv',
+		['ticker','company','service','scorecard','action','open dates','new','buy first', 'core'],
+		generate_rows())
+
+####################################################################################################
+
+def get_articles_as_csv(request):
+	"""
+	return a csv of the articles, newest first. takes the same filters as the articles feed (tickers, service_ids,
+	author, since, until)
+	"""
+	try:
+		articles = _get_filtered_articles(request.GET)
+	except ValueError as e:
+		return HttpResponseBadRequest('error: %s' % str(e), content_type='text/plain')
+
+	articles = articles.order_by('-date_pub', '-id').values_list('date_pub', 'ticker__ticker_symbol', 'service__pretty_name',
+		'author', 'title', 'url', 'tags')
+
+	def generate_rows():
+		for date_pub, ticker_symbol, service_pretty_name, author, title, url, tags in iterate_in_chunks(articles, key='-date_pub'):
+			yield [timezone.localtime(date_pub).strftime('%Y-%m-%d %H:%M') if date_pub else '', ticker_symbol, service_pretty_name, author, title, 'http://' + url, tags]
+
+	return get_streaming_csv_response('satellite_articles.csv',
+		['date published', 'ticker', 'service', 'author', 'title', 'url', 'tags'],
+		generate_rows())
+
+####################################################################################################
+
+def get_tickers_as_csv(request):
+	"""
+	return a csv of all the tickers, each with the services that cover it
+	"""
+	# one row per ticker/service combo (and one row for a ticker no service covers); we fold each ticker's rows into one
+	tickers = Ticker.objects.order_by('ticker_symbol', 'covering_services__pretty_name').values_list('ticker_symbol', 'company_name',
+		'exchange_symbol', 'instrument_id', 'tier', 'tier_status', 'daily_percent_change', 'earnings_announcement',
+		'covering_services__pretty_name')
+
+	def generate_rows():
+		for ticker_symbol, rows_for_ticker in groupby(iterate_in_chunks(tickers, key='ticker_symbol'), key=lambda row: row[0]):
+			rows_for_ticker = list(rows_for_ticker)
+			service_pretty_names = [row[-1] for row in rows_for_ticker if row[-1] is not None]
+			yield list(rows_for_ticker[0][:-1]) + [len(service_pretty_names), ', '.join(service_pretty_names)]
+
+	return get_streaming_csv_response('satellite_tickers.csv',
+		['ticker', 'company', 'exchange', 'instrument id', 'tier', 'tier status', 'daily % change', 'earnings announcement',
+		'number of services', 'services'],
+		generate_rows())
 
-	response = HttpResponse(content_type='text/csv')
+####################################################################################################
 
-	response['Content-Disposition'] = 'attachment; filename="satellite_flagged_recs.csv"'
+def get_coverage_as_csv(request):
+	"""
+	return a csv of the coverage pledges: who promised what kind of coverage of which ticker, for which service.
+	the same pledges as the CoverageMatrix on the coverage pages: records without an author are left out
+	"""
+	coverage_choice_names = dict(COVERAGE_CHOICES)
 
-	# here we write out, line-by-line, the file's contents
-	# because it's a csv, we'll be careful that no cell includes a comma
-	writer = csv.writer(response)
-	writer.writerow(['ticker','company','service','scorecard','action','open dates','new','buy first', 'core'])
-	for frd in flagged_rec_defns:
-		row_to_write = []
-		row_to_write = [frd['ticker_symbol'], frd['company'].replace(",",""), frd['service_pretty_name'].replace(",",""), frd['scorecard_pretty_name'].replace(",",""), frd['action']]
-		row_to_write.append(frd['open_dates'].replace('<br/>', ', '))
-		row_to_write.append('Y' if frd['is_new'] else '')
-		row_to_write.append('Y' if frd['is_first'] else '')
-		row_to_write.append('Y' if frd['is_core'] else '')
+	coverage_pledges = CoverageType.objects.pledged().order_by('ticker__ticker_symbol', 'coverage_type', 'service__pretty_name', 'id') \
+		.values_list('ticker__ticker_symbol', 'ticker__company_name', 'coverage_type', 'service__pretty_name', 'author')
 
-		writer.writerow(row_to_write)
+	def generate_rows():
+		for ticker_symbol, company_name, coverage_type, service_pretty_name, author in iterate_in_chunks(coverage_pledges, key='ticker__ticker_symbol'):
+			yield [ticker_symbol, company_name, coverage_choice_names.get(coverage_type, coverage_type), service_pretty_name, author]
 
-	return response
+	return get_streaming_csv_response('satellite_coverage_pledges.csv',
+		['ticker', 'company', 'coverage type', 'service', 'analyst'],
+		generate_rows())
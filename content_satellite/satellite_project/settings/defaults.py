@@ -77,6 +77,19 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/1.7/topics/cache/#database-caching
+# shared by the web server and the cron commands, so that a command can tell the pages its data changed
+# (see satellite/cache_utils.py). the table is made by a satellite migration
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'satellite_cache',
+    }
+}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.7/topics/i18n/
 